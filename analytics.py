@@ -0,0 +1,287 @@
+# analytics.py
+"""
+浏览/收藏事件统计
+
+上报的事件只在内存中累加：计数器按 key 哈希分片，每片一把锁，接口线程与刷新线程
+互不阻塞。后台任务定期把各分片换出，按 (分钟, 对象类型, 对象ID, 事件类型) 批量
+upsert 到 analytics_event_counts，并在同一事务中累加小时/天汇总（见 rollups.py）。
+统计接口读取启动时从汇总表加载的按天/按小时计数，再叠加尚未写库的计数，不扫描事件明细。
+"""
+import asyncio
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, inspect
+from sqlalchemy.dialects.mysql import insert
+
+from database import engine, SessionLocal
+from models_db import AnalyticsEventCount, StatRollup
+from rollups import GRANULARITIES, apply_deltas, query_rollups, truncate
+
+ANALYTICS_CONFIG = {
+    "shards": 16,                      # 计数器分片数
+    "flush_interval_seconds": 5,       # 写库间隔
+    "flush_batch_size": 1000,          # 每条 upsert 语句的行数
+    "resync_interval_seconds": 300,    # 从库重新加载汇总的间隔（合并其他进程写入的计数）
+    "daily_window_days": 30,           # 内存中保留的按天汇总天数
+    "hourly_window_hours": 24,         # 内存中保留的按小时汇总小时数
+    "max_event_count": 100,            # 单条事件允许的最大计数
+}
+
+TARGET_TYPES = ("location", "panorama", "shop")
+EVENT_TYPES = ("view", "favorite")
+
+
+def ensure_schema():
+    """旧库没有 analytics_event_counts 表时创建（汇总表见 rollups.ensure_schema）"""
+    if not inspect(engine).has_table(AnalyticsEventCount.__tablename__):
+        AnalyticsEventCount.__table__.create(bind=engine)
+
+
+class ShardedCounter:
+    """按 key 分片加锁的计数器"""
+
+    def __init__(self, shards):
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+
+    def add(self, key, n=1):
+        lock, counts = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            counts[key] = counts.get(key, 0) + n
+
+    def drain(self):
+        """取出并清空所有分片的计数"""
+        result = {}
+        for lock, counts in self._shards:
+            with lock:
+                items = list(counts.items())
+                counts.clear()
+            for key, n in items:
+                result[key] = result.get(key, 0) + n
+        return result
+
+    def snapshot(self):
+        result = {}
+        for lock, counts in self._shards:
+            with lock:
+                items = list(counts.items())
+            for key, n in items:
+                result[key] = result.get(key, 0) + n
+        return result
+
+
+class AnalyticsStore:
+    def __init__(self, config=None):
+        self.config = dict(ANALYTICS_CONFIG, **(config or {}))
+        self.counter = ShardedCounter(self.config["shards"])
+        self._lock = threading.Lock()
+        # 已写库部分的汇总，key 为 (target_type, event_type)
+        self.totals = {}
+        self.daily = {}    # (date, target_type, event_type) -> n
+        self.hourly = {}   # (整点时间, target_type, event_type) -> n
+        self._flushing = {}   # 已从分片取出、正在写库的计数
+        self._task = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+
+    # ---------- 上报 ----------
+    def ingest(self, events):
+        """累加一批事件，返回 (接受数, 拒绝数)"""
+        minute = datetime.now().replace(second=0, microsecond=0)
+        limit = self.config["max_event_count"]
+        accepted = rejected = 0
+        for e in events:
+            if e.target_type not in TARGET_TYPES or e.event_type not in EVENT_TYPES:
+                rejected += 1
+                continue
+            # 浏览只能累加；收藏允许负数（取消收藏）
+            low = 1 if e.event_type == "view" else -limit
+            if not low <= e.count <= limit or e.count == 0:
+                rejected += 1
+                continue
+            self.counter.add((minute, e.target_type, e.target_id, e.event_type), e.count)
+            accepted += 1
+        self.accepted += accepted
+        self.rejected += rejected
+        return accepted, rejected
+
+    # ---------- 写库 ----------
+    def flush(self):
+        """把分片中的计数 upsert 到分钟表（同步，在线程池中调用）"""
+        # 取出与登记在同一把锁内完成，查询时不会漏算或重复计算这部分计数
+        with self._lock:
+            drained = self._flushing = self.counter.drain()
+        if not drained:
+            return 0
+        rows = [{"bucket_minute": minute, "target_type": target_type, "target_id": target_id,
+                 "event_type": event_type, "count": n}
+                for (minute, target_type, target_id, event_type), n in drained.items()]
+        try:
+            self._upsert(rows)
+        except Exception as e:
+            # 写库失败时放回计数器，等待下次刷新
+            for key, n in drained.items():
+                self.counter.add(key, n)
+            with self._lock:
+                self._flushing = {}
+            self.failed += len(rows)
+            print(f"写入浏览/收藏统计失败({len(rows)}条): {e}")
+            return 0
+        with self._lock:
+            self._apply(self.totals, self.daily, self.hourly, drained)
+            self._flushing = {}
+        self.written += len(rows)
+        return len(rows)
+
+    def _upsert(self, rows):
+        table = AnalyticsEventCount.__table__
+        size = self.config["flush_batch_size"]
+        deltas = {}
+        for row in rows:
+            for granularity in GRANULARITIES:
+                key = ("analytics", granularity, truncate(granularity, row["bucket_minute"]), "",
+                       row["target_type"], row["event_type"])
+                deltas[key] = deltas.get(key, 0) + row["count"]
+        with engine.begin() as conn:
+            for i in range(0, len(rows), size):
+                stmt = insert(table).values(rows[i:i + size])
+                conn.execute(stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted["count"]))
+            # 小时/天汇总与分钟表在同一事务中更新
+            apply_deltas(conn, deltas)
+
+    def _apply(self, totals, daily, hourly, counts):
+        """把按分钟的计数累加到各级汇总"""
+        for (minute, target_type, _, event_type), n in counts.items():
+            key = (target_type, event_type)
+            totals[key] = totals.get(key, 0) + n
+            day_key = (minute.date(), target_type, event_type)
+            daily[day_key] = daily.get(day_key, 0) + n
+            hour_key = (truncate("hour", minute), target_type, event_type)
+            hourly[hour_key] = hourly.get(hour_key, 0) + n
+
+    # ---------- 加载汇总 ----------
+    def load(self):
+        """从小时/天汇总表重新加载（启动时及定期调用）"""
+        day_since = truncate("day", datetime.now()) - timedelta(days=self.config["daily_window_days"] - 1)
+        hour_since = truncate("hour", datetime.now()) - timedelta(hours=self.config["hourly_window_hours"] - 1)
+        db = SessionLocal()
+        try:
+            totals = {(tt, et): int(n) for tt, et, n in db.query(
+                StatRollup.dimension, StatRollup.value, func.sum(StatRollup.count)
+            ).filter(
+                StatRollup.metric == "analytics", StatRollup.granularity == "day"
+            ).group_by(StatRollup.dimension, StatRollup.value)}
+            daily = {(bucket.date(), tt, et): n
+                     for bucket, _, tt, et, n in query_rollups(db, "analytics", "day", day_since)}
+            hourly = {(bucket, tt, et): n
+                      for bucket, _, tt, et, n in query_rollups(db, "analytics", "hour", hour_since)}
+        finally:
+            db.close()
+
+        with self._lock:
+            self.totals, self.daily, self.hourly = totals, daily, hourly
+
+    # ---------- 查询 ----------
+    def _views(self):
+        """返回 (totals, daily, hourly)：已写库的汇总叠加尚未写库的计数"""
+        with self._lock:
+            totals, daily, hourly = dict(self.totals), dict(self.daily), dict(self.hourly)
+            pending = self.counter.snapshot()
+            self._apply(totals, daily, hourly, self._flushing)
+        self._apply(totals, daily, hourly, pending)
+        return totals, daily, hourly
+
+    @staticmethod
+    def _sum(counts, prefix, target_type, event_type):
+        types = TARGET_TYPES if target_type is None else (target_type,)
+        return sum(counts.get(prefix + (tt, event_type), 0) for tt in types)
+
+    def stats(self, target_type=None):
+        totals, daily, _ = self._views()
+        today = date.today()
+        week = [today - timedelta(days=6 - i) for i in range(7)]
+        return {
+            "favoriteTotal": self._sum(totals, (), target_type, "favorite"),
+            "favoritesToday": self._sum(daily, (today,), target_type, "favorite"),
+            "viewsTotal": self._sum(totals, (), target_type, "view"),
+            "viewsToday": self._sum(daily, (today,), target_type, "view"),
+            "weeklyFavorites": [self._sum(daily, (d,), target_type, "favorite") for d in week],
+            "weeklyViews": [self._sum(daily, (d,), target_type, "view") for d in week]
+        }
+
+    def trends(self, time_range, target_type=None):
+        _, daily, hourly = self._views()
+        if time_range == "today":
+            current = truncate("hour", datetime.now())
+            return [{
+                "time": hour.strftime("%H:00"),
+                "favorites": self._sum(hourly, (hour,), target_type, "favorite"),
+                "views": self._sum(hourly, (hour,), target_type, "view")
+            } for hour in (current - timedelta(hours=23 - i) for i in range(24))]
+        days = {"7d": 7, "30d": 30}.get(time_range)
+        if days is None:
+            return []
+        today = date.today()
+        return [{
+            "date": day.strftime("%m-%d"),
+            "favorites": self._sum(daily, (day,), target_type, "favorite"),
+            "views": self._sum(daily, (day,), target_type, "view")
+        } for day in (today - timedelta(days=days - 1 - i) for i in range(days))]
+
+    def _trim(self):
+        """丢弃超出窗口的按天/按小时汇总"""
+        day_since = date.today() - timedelta(days=self.config["daily_window_days"] - 1)
+        hour_since = truncate("hour", datetime.now()) - timedelta(hours=self.config["hourly_window_hours"] - 1)
+        with self._lock:
+            self.daily = {k: v for k, v in self.daily.items() if k[0] >= day_since}
+            self.hourly = {k: v for k, v in self.hourly.items() if k[0] >= hour_since}
+
+    # ---------- 后台任务 ----------
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.load)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并把剩余计数写库"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        elapsed = 0
+        while True:
+            await asyncio.sleep(self.config["flush_interval_seconds"])
+            elapsed += self.config["flush_interval_seconds"]
+            try:
+                await loop.run_in_executor(None, self.flush)
+                if elapsed >= self.config["resync_interval_seconds"]:
+                    elapsed = 0
+                    await loop.run_in_executor(None, self.load)
+                else:
+                    self._trim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"浏览/收藏统计刷新失败: {e}")
+
+    def summary(self) -> dict:
+        return {
+            "pending": len(self.counter.snapshot()),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed
+        }
+
+
+# 进程内共享的统计实例
+analytics = AnalyticsStore()
@@ -0,0 +1,150 @@
+# audit_log.py
+"""
+操作日志异步批量写入
+
+接口处理函数只把日志放入有界内存队列，由后台任务每隔 flush_interval_ms
+或攒够 batch_size 条时批量插入 operation_logs，审计日志不再占用请求的提交。
+"""
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database import engine
+from models_db import OperationLog
+
+AUDIT_LOG_CONFIG = {
+    "flush_interval_ms": 200,   # 定时刷新间隔
+    "batch_size": 500,          # 攒够多少条立即刷新
+    "max_queue": 10000,         # 队列上限
+    # 队列满时的处理方式：
+    #   drop_oldest - 丢弃最早的日志
+    #   drop_new    - 丢弃新日志
+    #   flush       - 由当前调用方同步写库（背压，保证不丢）
+    "overflow": "drop_oldest",
+}
+
+
+class AuditLogWriter:
+    def __init__(self, config=None):
+        self.config = dict(AUDIT_LOG_CONFIG, **(config or {}))
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    # ---------- 入队 ----------
+    def record(self, operator, action, target, ip_address, result, details=None, operation_time=None):
+        """记录一条操作日志（只入队，不访问数据库）"""
+        self.record_many([{
+            "operator": operator,
+            "action": action,
+            "target": target,
+            "operation_time": operation_time or datetime.now(),
+            "ip_address": ip_address,
+            "result": result,
+            "details": details
+        }])
+
+    def record_many(self, rows):
+        """批量入队，rows 为 operation_logs 列名到值的字典列表"""
+        overflow_rows = []
+        with self._lock:
+            for row in rows:
+                row.setdefault("operation_time", datetime.now())
+                if len(self._queue) < self.config["max_queue"]:
+                    self._queue.append(row)
+                elif self.config["overflow"] == "drop_oldest":
+                    self._queue.popleft()
+                    self._queue.append(row)
+                    self.dropped += 1
+                elif self.config["overflow"] == "drop_new":
+                    self.dropped += 1
+                else:
+                    overflow_rows.append(row)
+            pending = len(self._queue)
+
+        if overflow_rows:
+            self.flush()
+            self._insert(overflow_rows)
+
+        if pending >= self.config["batch_size"] and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ---------- 写库 ----------
+    def flush(self):
+        """把队列中的日志全部写库（同步，可在线程池中调用）"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        return
+                    size = min(len(self._queue), self.config["batch_size"])
+                    batch = [self._queue.popleft() for _ in range(size)]
+                if not self._insert(batch):
+                    # 写库失败时放回队首，等待下次刷新
+                    with self._lock:
+                        room = self.config["max_queue"] - len(self._queue)
+                        self._queue.extendleft(reversed(batch[:max(room, 0)]))
+                        self.dropped += max(len(batch) - room, 0)
+                    return
+
+    def _insert(self, rows):
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(OperationLog), rows)
+            self.written += len(rows)
+            return True
+        except Exception as e:
+            self.failed += len(rows)
+            print(f"写入操作日志失败({len(rows)}条): {e}")
+            return False
+
+    # ---------- 后台任务 ----------
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并把剩余日志写完"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def _run(self):
+        interval = self.config["flush_interval_ms"] / 1000
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await loop.run_in_executor(None, self.flush)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "overflow": self.config["overflow"]
+        }
+
+
+# 进程内共享的日志写入器
+audit_log = AuditLogWriter()
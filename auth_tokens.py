@@ -0,0 +1,128 @@
+# auth_tokens.py
+"""
+HMAC 签名的无状态登录令牌
+
+令牌格式为 base64url(载荷).base64url(HMAC-SHA256签名)，载荷包含令牌类型（管理端/政府端）、
+用户ID、角色、令牌版本、过期时间和令牌ID。校验只做一次 HMAC 计算，不访问数据库。
+
+吊销方式：
+- 退出登录：令牌ID放入进程内的黑名单，直到令牌本身过期
+- 修改角色/禁用账户：用户的 token_version 加一，旧版本令牌全部失效
+  （版本号与用户对象一起从 identity_cache 读取，常见情况下同样不访问数据库）
+
+多进程部署时需通过环境变量 TOKEN_SECRET 配置相同的密钥；黑名单只在本进程内有效，
+需要跨进程立即生效的吊销请使用令牌版本。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect, text
+
+from database import engine
+from models_db import GovernmentUser, User
+
+TOKEN_CONFIG = {
+    "secret": os.environ.get("TOKEN_SECRET", ""),
+    "ttl_hours": 12,          # 令牌有效期
+    "denylist_size": 100000,  # 黑名单上限
+}
+
+if not TOKEN_CONFIG["secret"]:
+    print("未配置 TOKEN_SECRET，使用随机密钥（重启后已签发的令牌失效）")
+    TOKEN_CONFIG["secret"] = secrets.token_hex(32)
+
+_KEY = TOKEN_CONFIG["secret"].encode()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(value):
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_KEY, payload.encode(), hashlib.sha256).digest())
+
+
+class TokenDenylist:
+    """已吊销令牌ID -> 过期时间，过期后自动清理"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._items[jti] = exp
+            if len(self._items) > self.maxsize:
+                now = time.time()
+                for key in [k for k, v in self._items.items() if v <= now]:
+                    del self._items[key]
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+
+    def __contains__(self, jti):
+        return jti in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+denylist = TokenDenylist(TOKEN_CONFIG["denylist_size"])
+
+
+def issue_token(kind, user_id, role, version):
+    """签发令牌，kind 为 user（管理端）或 gov（政府端）"""
+    claims = {
+        "k": kind,
+        "uid": user_id,
+        "role": role,
+        "ver": version or 0,
+        "exp": int(time.time() + TOKEN_CONFIG["ttl_hours"] * 3600),
+        "jti": secrets.token_urlsafe(12)
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token, kind):
+    """校验签名、类型、有效期和黑名单，成功返回载荷，否则返回 None"""
+    payload, _, signature = token.partition(".")
+    # 按字节比较：compare_digest 对含非 ASCII 字符的 str 会抛出 TypeError
+    if not signature or not hmac.compare_digest(_sign(payload).encode(), signature.encode()):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("k") != kind or claims.get("exp", 0) < time.time() or claims.get("jti") in denylist:
+        return None
+    return claims
+
+
+def revoke(claims):
+    """吊销单个令牌（退出登录）"""
+    denylist.add(claims["jti"], claims["exp"])
+
+
+def ensure_schema():
+    """为旧库的 users / government_users 补充 token_version 列"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for model in (User, GovernmentUser):
+            table = model.__tablename__
+            if not inspector.has_table(table):
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table)}
+            if "token_version" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN token_version INT NOT NULL DEFAULT 0"))
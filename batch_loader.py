@@ -0,0 +1,68 @@
+# batch_loader.py
+"""
+请求内批量加载
+
+组装响应时先用 want() 登记需要的主键，第一次 get() 时把所有已登记、尚未加载的
+主键合并成一条 IN (...) 查询；之后的 get() 直接读本地结果。每个请求新建实例，
+不跨请求缓存；传入 cache（如 identity_cache 中的用户缓存）时先查缓存，
+查询结果从会话中移除后写回缓存。
+"""
+
+
+class BatchLoader:
+    def __init__(self, db, model, key_column=None, cache=None):
+        self.db = db
+        self.model = model
+        self.key_column = key_column if key_column is not None else model.__mapper__.primary_key[0]
+        self.cache = cache
+        self._loaded = {}
+        self._pending = set()
+        self.queries = 0
+
+    def want(self, *keys):
+        """登记稍后需要的主键（None 会被忽略）"""
+        for key in keys:
+            if key is not None and key not in self._loaded:
+                self._pending.add(key)
+        return self
+
+    def dispatch(self):
+        """一次查询加载所有已登记的主键"""
+        if not self._pending:
+            return
+        keys = list(self._pending)
+        self._pending.clear()
+        if self.cache is not None:
+            missing = []
+            for key in keys:
+                row = self.cache.get(key)
+                if row is None:
+                    missing.append(key)
+                else:
+                    self._loaded[key] = row
+            keys = missing
+            if not keys:
+                return
+        # 本会话中已有的对象（可能正在被修改）不移出会话、不放入缓存
+        attached = {key for key in keys
+                    if self.db.identity_key(self.model, key) in self.db.identity_map}
+        for key in keys:
+            self._loaded[key] = None
+        rows = self.db.query(self.model).filter(self.key_column.in_(keys)).all()
+        self.queries += 1
+        for row in rows:
+            key = getattr(row, self.key_column.key)
+            if self.cache is not None and key not in attached:
+                self.db.expunge(row)
+                self.cache.set(key, row)
+            self._loaded[key] = row
+
+    def get(self, key):
+        """返回主键对应的对象，不存在时返回 None"""
+        if key is None:
+            return None
+        if key not in self._loaded:
+            self._pending.add(key)
+        if self._pending:
+            self.dispatch()
+        return self._loaded.get(key)
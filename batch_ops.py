@@ -0,0 +1,239 @@
+# batch_ops.py
+"""
+全景图、店铺的批量操作
+
+按 id 集合执行少量 UPDATE/DELETE ... WHERE id IN (...)，全部在一个事务中完成；
+超大 id 集合按 chunk_size 分段。操作日志、搜索索引在提交后更新。
+commit=False 时只写入不提交，由调用方（后台作业）与检查点一起提交。
+- 全景图 发布/拒绝/删除：删除时与单条删除一致，解除地点关联、删除时间机器数据和预览图关联
+- 店铺审核：单个审核与批量审核共用，审核后同步搜索联想索引
+- 缩略图重建：按全景原图重新生成缩略图
+"""
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image
+
+from sqlalchemy import delete, select, update
+
+from audit_log import audit_log
+from database import run_after_commit
+from models_db import ImageStorage, Location, Panorama, PanoramaPreviewImages, Shop, TimeMachineData
+from suggest_index import name_index
+import rollups
+
+BATCH_CONFIG = {
+    "chunk_size": 1000,          # 每条语句的 IN 列表长度上限
+    "thumbnail_size": (200, 200),
+}
+
+# 操作 -> 操作后的状态（删除为 None）
+PANORAMA_ACTIONS = {
+    "publish": "published",
+    "reject": "rejected",
+    "delete": None,
+}
+
+# 审核操作 -> 审核状态
+SHOP_AUDIT_ACTIONS = {
+    "approve": "approved",
+    "reject": "rejected",
+}
+
+
+def chunks(items, size=None):
+    size = size or BATCH_CONFIG["chunk_size"]
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def batch_panoramas(db, action, data_ids, operator, ip_address="192.168.1.1", commit=True):
+    """
+    对一组全景图执行 publish / reject / delete，返回每个 id 的结果列表
+    [{"id": ..., "success": bool, "msg": ...}]；出错时整个事务回滚
+    """
+    new_status = PANORAMA_ACTIONS[action]
+    ids = list(dict.fromkeys(data_ids))
+
+    # 现有记录及其统计字段（用于同步更新小时/天汇总）
+    existing = {}
+    for chunk in chunks(ids):
+        for panorama_id, status, created_at in db.execute(
+            select(Panorama.panorama_id, Panorama.status, Panorama.created_at)
+            .where(Panorama.panorama_id.in_(chunk))
+        ):
+            existing[panorama_id] = {"status": status, "created_at": created_at}
+    found = [i for i in ids if i in existing]
+
+    try:
+        for chunk in chunks(found):
+            if action == "delete":
+                db.execute(update(Location).where(Location.panorama_id.in_(chunk))
+                           .values(panorama_id=None))
+                db.execute(delete(TimeMachineData).where(TimeMachineData.panorama_id.in_(chunk)))
+                db.execute(delete(PanoramaPreviewImages).where(PanoramaPreviewImages.panorama_id.in_(chunk)))
+                db.execute(delete(Panorama).where(Panorama.panorama_id.in_(chunk)))
+            else:
+                db.execute(update(Panorama).where(Panorama.panorama_id.in_(chunk))
+                           .values(status=new_status, updated_at=datetime.now()))
+
+        changes = [(Panorama, values, None if action == "delete" else dict(values, status=new_status))
+                   for values in existing.values() if action == "delete" or values["status"] != new_status]
+        rollups.apply_changes(db.connection(), changes)
+
+        now = datetime.now()
+        run_after_commit(db, lambda: audit_log.record_many([{
+            "operator": operator,
+            "action": f"批量{action}",
+            "target": f"全景图数据{data_id}",
+            "operation_time": now,
+            "ip_address": ip_address,
+            "result": "成功",
+            "details": f"批量操作: {action}"
+        } for data_id in found]))
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # 会话中已加载的全景图对象与数据库不再一致
+    db.expire_all()
+
+    return [{"id": data_id, "success": data_id in existing,
+             "msg": "成功" if data_id in existing else "数据不存在"} for data_id in ids]
+
+
+def _shop_id(value):
+    """请求中的店铺 id 转为 int（接受 12、"12"、12.0），无法转换时返回 None"""
+    try:
+        shop_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    if shop_id == value or str(value).strip() == str(shop_id):
+        return shop_id
+    return None
+
+
+def audit_shops(db, action, shop_ids, operator, log_action, details, ip_address="192.168.1.1", commit=True):
+    """
+    审核一组店铺，返回 (已审核的 [(shop_id, username)], 不存在或无法识别的 id 列表)；
+    重复的 id 只审核一次、只返回一次；出错时整个事务回滚
+    """
+    new_status = SHOP_AUDIT_ACTIONS[action]
+    invalid, valid, seen = [], [], set()
+    for value in shop_ids:
+        shop_id = _shop_id(value)
+        if shop_id is None:
+            invalid.append(value)
+        elif shop_id not in seen:
+            seen.add(shop_id)
+            valid.append(shop_id)
+
+    # 搜索索引需要的字段随存在性检查一起读出
+    existing = {}
+    for chunk in chunks(valid):
+        for row in db.execute(
+            select(Shop.shop_id, Shop.username, Shop.province, Shop.city, Shop.district, Shop.status)
+            .where(Shop.shop_id.in_(chunk))
+        ):
+            existing[row.shop_id] = row
+    found = [i for i in valid if i in existing]
+
+    def after_commit():
+        name_index.upsert_shops([
+            (r.shop_id, r.username, r.province, r.city, r.district, new_status, r.status)
+            for r in (existing[i] for i in found)
+        ])
+        audit_log.record_many([{
+            "operator": operator,
+            "action": log_action,
+            "target": existing[shop_id].username,
+            "operation_time": now,
+            "ip_address": ip_address,
+            "result": "成功",
+            "details": details
+        } for shop_id in found])
+
+    try:
+        now = datetime.now()
+        for chunk in chunks(found):
+            db.execute(update(Shop).where(Shop.shop_id.in_(chunk))
+                       .values(audit_status=new_status, updated_at=now))
+        run_after_commit(db, after_commit)
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    db.expire_all()
+
+    audited = [(shop_id, existing[shop_id].username) for shop_id in found]
+    return audited, invalid + [i for i in valid if i not in existing]
+
+
+def make_thumbnail(data):
+    """生成 JPEG 缩略图"""
+    image = Image.open(BytesIO(data))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail(BATCH_CONFIG["thumbnail_size"])
+    thumb_io = BytesIO()
+    image.save(thumb_io, format='JPEG')
+    return thumb_io.getvalue()
+
+
+def regenerate_thumbnails(db, panorama_ids, commit=True):
+    """
+    按全景原图重新生成缩略图，返回每个 id 的结果列表。
+    原图逐张读取（全景图可能有几十 MB）；每张图在单独的保存点中写入，
+    一张失败不影响其他，commit 时每张写完即提交
+    """
+    ids = list(dict.fromkeys(panorama_ids))
+    rows = {}
+    for chunk in chunks(ids):
+        for row in db.execute(
+            select(Panorama.panorama_id, Panorama.panorama_image_id, Panorama.thumbnail_image_id)
+            .where(Panorama.panorama_id.in_(chunk))
+        ):
+            rows[row.panorama_id] = row
+
+    results = []
+    for panorama_id in ids:
+        row = rows.get(panorama_id)
+        if row is None:
+            results.append({"id": panorama_id, "success": False, "msg": "数据不存在"})
+            continue
+        savepoint = db.begin_nested()
+        try:
+            source = db.execute(
+                select(ImageStorage.file_data).where(ImageStorage.image_id == row.panorama_image_id)
+            ).scalar()
+            if source is None:
+                savepoint.rollback()
+                results.append({"id": panorama_id, "success": False, "msg": "原图不存在"})
+                continue
+            thumb = make_thumbnail(source)
+            values = {"file_data": thumb, "file_size": len(thumb), "mime_type": "image/jpeg"}
+            if row.thumbnail_image_id == row.panorama_image_id:
+                # 缩略图与原图是同一条记录时不能覆盖原图，另存一条
+                image = ImageStorage(filename=f"thumbnail_{panorama_id}.jpg", image_type="thumbnail", **values)
+                db.add(image)
+                db.flush()
+                db.execute(update(Panorama).where(Panorama.panorama_id == panorama_id)
+                           .values(thumbnail_image_id=image.image_id))
+            else:
+                db.execute(update(ImageStorage).where(ImageStorage.image_id == row.thumbnail_image_id)
+                           .values(**values))
+            savepoint.commit()
+            if commit:
+                db.commit()
+            results.append({"id": panorama_id, "success": True, "msg": "成功"})
+        except Exception as e:
+            if savepoint.is_active:
+                savepoint.rollback()
+            if commit:
+                db.rollback()
+            results.append({"id": panorama_id, "success": False, "msg": str(e)})
+    return results
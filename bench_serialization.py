@@ -0,0 +1,130 @@
+# bench_serialization.py
+"""
+响应序列化的微基准
+
+用与 get_locations / get_law_enforcement_tasks 结构相同的模拟数据，比较：
+- 原路径：接口内 strftime 格式化时间 -> BaseResponse -> response_model 校验与转换 -> 标准库 json 编码
+- 新路径：直接放入 datetime -> trusted_response（orjson 编码，序列化时格式化时间）
+
+用法:
+    python bench_serialization.py              # 默认 5000 行
+    python bench_serialization.py --rows 20000
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from fast_json import orjson, trusted_response
+from models import BaseResponse
+
+RESPONSE_FIELD = create_response_field(name="response", type_=BaseResponse)
+
+
+def _time(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def location_rows(n, fmt):
+    now = datetime.now()
+    rows = []
+    for i in range(n):
+        shoot_time = now - timedelta(minutes=i)
+        rows.append({
+            "id": i,
+            "name": f"地点{i}",
+            "longitude": 120.1 + i * 1e-5,
+            "latitude": 30.2 + i * 1e-5,
+            "rating": 4.5,
+            "category": "景点",
+            "description": "西湖边的全景拍摄点，可以看到断桥和保俶塔",
+            "address": "浙江省杭州市西湖区北山街",
+            "panorama": {
+                "id": i,
+                "panorama_image": f"/api/images/{i * 2}",
+                "thumbnail": f"/api/images/{i * 2 + 1}",
+                "description": "清晨拍摄",
+                "shoot_time": fmt(shoot_time),
+                "longitude": 120.1 + i * 1e-5,
+                "latitude": 30.2 + i * 1e-5,
+                "status": "published"
+            },
+            "preview_images": [f"/api/images/{i * 10 + k}" for k in range(4)]
+        })
+    return rows
+
+
+def task_rows(n, fmt):
+    now = datetime.now()
+    rows = []
+    for i in range(n):
+        created_at = now - timedelta(hours=i)
+        rows.append({
+            "id": i,
+            "task_code": f"TASK-20261019-{i:03d}",
+            "title": f"清理占道经营{i}",
+            "description": "商户在人行道上摆放货架，影响通行，需要现场处理并拍照反馈",
+            "task_type": "regulation",
+            "priority": "high",
+            "status": "assigned",
+            "longitude": 120.1,
+            "latitude": 30.2,
+            "address": "浙江省杭州市西湖区文三路",
+            "assigned_to": {"id": 2, "name": "officer", "department": "城管"},
+            "created_by": {"id": 1, "name": "gov_admin"},
+            "deadline": fmt(created_at + timedelta(days=3)),
+            "completion_time": None,
+            "attachments": ["/api/images/1", "/api/images/2"],
+            "remarks": None,
+            "created_at": fmt(created_at),
+            "updated_at": fmt(created_at)
+        })
+    return {"list": rows, "total": n, "page": 1, "pageSize": n}
+
+
+async def old_path(build):
+    """与 FastAPI 处理 response_model=BaseResponse 的接口相同的步骤"""
+    content = BaseResponse(data=build(_time))
+    serialized = await serialize_response(field=RESPONSE_FIELD, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def new_path(build):
+    return trusted_response(build(lambda t: t)).body
+
+
+def measure(func, build, repeat):
+    loop = asyncio.new_event_loop()
+    try:
+        body = loop.run_until_complete(func(build))
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            loop.run_until_complete(func(build))
+            best = min(best, time.perf_counter() - start)
+    finally:
+        loop.close()
+    return best * 1000, len(body)
+
+
+def main():
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 5000
+    repeat = 5
+    print(f"序列化库: {'orjson ' + orjson.__version__ if orjson else '标准库 json（未安装 orjson）'}，每组 {rows} 行，取 {repeat} 次最快值")
+    for name, build in (
+        ("get_locations", lambda fmt: location_rows(rows, fmt)),
+        ("get_law_enforcement_tasks", lambda fmt: task_rows(rows, fmt)),
+    ):
+        old_ms, old_size = measure(old_path, build, repeat)
+        new_ms, new_size = measure(new_path, build, repeat)
+        print(f"  {name}:")
+        print(f"    原路径 {old_ms:8.1f} ms  {old_size / 1024:8.1f} KB")
+        print(f"    新路径 {new_ms:8.1f} ms  {new_size / 1024:8.1f} KB  加速 {old_ms / new_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
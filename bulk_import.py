@@ -0,0 +1,454 @@
+# bulk_import.py
+"""
+地点、店铺、执法任务的批量导入
+
+请求体为 NDJSON（每行一个对象）或 CSV（首行为列名），边接收边解析，不把整个文件读入内存。
+每行先用与单条创建接口相同的 Pydantic 模型校验，再按 batch_size 攒批：
+每批用少量 IN 查询检查名称重复、全景图/负责人是否存在等约束，通过的行用 executemany
+一次写入并提交。字符串长度按表的列定义逐行检查；整批写入仍然出错时回滚该批并逐行重试，
+错误落到具体的行上。返回逐行的错误报告；dry_run 时只做校验不写库。
+也可以只在请求内做格式校验，把通过的行提交为后台作业（见 jobs.py）。
+"""
+import asyncio
+import codecs
+import csv
+import json
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import Text, func, insert, select
+
+from database import run_after_commit
+from models import LawEnforcementTaskCreate, LocationCreate, ShopCreate
+from models_db import (GovernmentUser, ImageStorage, LawEnforcementTask, Location, Panorama,
+                       PanoramaPreviewImages, Shop, TaskHistory)
+from suggest_index import name_index
+from task_codes import task_codes
+import rollups
+
+IMPORT_CONFIG = {
+    "batch_size": 1000,    # 每批写入的行数
+    "max_rows": 100000,    # 单次导入的行数上限
+    "max_errors": 1000,    # 报告中保留的错误行数上限
+}
+
+ENTITIES = {
+    "locations": LocationCreate,
+    "shops": ShopCreate,
+    "tasks": LawEnforcementTaskCreate,
+}
+
+# CSV 中的列表字段，写作 JSON 数组或用分号分隔，如 "1;2;3"
+LIST_FIELDS = ("preview_image_ids", "attachments")
+
+SHOP_ROLES = ("admin", "advanced", "user")
+SHOP_SIZES = ("small", "medium", "large")
+TASK_PRIORITIES = ("low", "medium", "high", "urgent")
+TEXT_MAX_BYTES = 65535  # MySQL TEXT 列的上限
+
+
+# ---------- 解析 ----------
+async def _lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def _csv_value(field, value):
+    if value is None or value == "":
+        return None
+    if field in LIST_FIELDS:
+        if value.startswith("["):
+            return json.loads(value)
+        return [v.strip() for v in value.replace(",", ";").split(";") if v.strip()]
+    return value
+
+
+async def iter_records(chunks, fmt):
+    """逐行解析请求体，产出 (行号, 数据字典, 错误信息)，行号从 1 开始（CSV 不计列名行）"""
+    row_no = 0
+    if fmt == "ndjson":
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            row_no += 1
+            try:
+                value = json.loads(line)
+            except ValueError as e:
+                yield row_no, None, f"JSON格式错误: {e}"
+                continue
+            if not isinstance(value, dict):
+                yield row_no, None, "每行必须是一个JSON对象"
+                continue
+            yield row_no, value, None
+        return
+
+    header = None
+    record = []
+    async for line in _lines(chunks):
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            continue  # 引号内的换行，记录尚未结束
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row_no += 1
+        if len(values) != len(header):
+            yield row_no, None, f"列数为 {len(values)}，与列名行的 {len(header)} 列不一致"
+            continue
+        try:
+            yield row_no, {k: _csv_value(k, v) for k, v in zip(header, values)}, None
+        except ValueError as e:
+            yield row_no, None, f"列表字段格式错误: {e}"
+    if record:
+        yield row_no + 1, None, "引号未闭合"
+
+
+def _validation_message(error):
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+# ---------- 按批校验与写入 ----------
+# 各导入函数只在本批写入成功后才把名称、全景图等记入 context，
+# 写入失败（整批回滚或逐行重试）时 context 不受影响
+def _length_error(model, values):
+    """按表的列定义检查字符串长度，返回第一个超长字段的错误信息"""
+    for column in model.__table__.columns:
+        value = values.get(column.name)
+        if not isinstance(value, str):
+            continue
+        if isinstance(column.type, Text):
+            if len(value.encode("utf-8")) > TEXT_MAX_BYTES:
+                return f"{column.name} 超过 {TEXT_MAX_BYTES} 字节"
+        elif column.type.length and len(value) > column.type.length:
+            return f"{column.name} 超过 {column.type.length} 个字符"
+    return None
+
+
+def _parse_deadline(value):
+    """与创建任务接口相同的截止时间解析"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
+def _import_locations(db, rows, context, dry_run):
+    seen = context.setdefault("seen", set())
+    names = {item.name.lower() for _, item in rows}
+    existing = set(db.execute(
+        select(func.lower(Location.name)).where(func.lower(Location.name).in_(names))
+    ).scalars())
+    panorama_ids = {item.panorama_image_id for _, item in rows if item.panorama_image_id}
+    found_panoramas, used_panoramas = set(), set()
+    if panorama_ids:
+        found_panoramas = set(db.execute(
+            select(Panorama.panorama_id).where(Panorama.panorama_id.in_(panorama_ids))).scalars())
+        used_panoramas = set(db.execute(
+            select(Location.panorama_id).where(Location.panorama_id.in_(panorama_ids))).scalars())
+    # 本次导入中前面批次已占用的全景图（dry_run 时尚未写库）
+    used_panoramas |= context.setdefault("panoramas", set())
+
+    results, values, previews = [], [], []
+    added_names, added_panoramas = set(), set()  # 本批新增
+    for row_no, item in rows:
+        name = item.name.lower()
+        if name in existing or name in seen or name in added_names:
+            results.append((row_no, "地点名称已存在"))
+            continue
+        panorama_id = item.panorama_image_id or None
+        if panorama_id and panorama_id not in found_panoramas:
+            results.append((row_no, "指定的全景图不存在"))
+            continue
+        if panorama_id and (panorama_id in used_panoramas or panorama_id in added_panoramas):
+            results.append((row_no, "该全景图已被其他地点使用"))
+            continue
+        value = {
+            "name": item.name,
+            "longitude": item.longitude,
+            "latitude": item.latitude,
+            "rating": item.rating or 0.0,
+            "category": item.category,
+            "description": item.description,
+            "address": item.address,
+            "panorama_id": panorama_id
+        }
+        error = _length_error(Location, value)
+        if error:
+            results.append((row_no, error))
+            continue
+        added_names.add(name)
+        if panorama_id:
+            added_panoramas.add(panorama_id)
+        values.append(value)
+        if panorama_id and item.preview_image_ids:
+            previews.extend({"panorama_id": panorama_id, "preview_image_id": image_id, "sort_order": i}
+                            for i, image_id in enumerate(item.preview_image_ids))
+        results.append((row_no, None))
+
+    if values and not dry_run:
+        db.execute(insert(Location), values)
+        if previews:
+            # 与单条创建一致：不存在的预览图忽略
+            images = set(db.execute(select(ImageStorage.image_id).where(
+                ImageStorage.image_id.in_({p["preview_image_id"] for p in previews}))).scalars())
+            previews = [p for p in previews if p["preview_image_id"] in images]
+            if previews:
+                db.execute(insert(PanoramaPreviewImages), previews)
+        created = db.execute(
+            select(Location.location_id, Location.name, Location.longitude, Location.latitude)
+            .where(Location.name.in_([v["name"] for v in values]))
+        ).all()
+        run_after_commit(db, lambda: name_index.upsert_locations(created))
+    seen |= added_names
+    context["panoramas"] |= added_panoramas
+    return results
+
+
+def _import_shops(db, rows, context, dry_run):
+    seen = context.setdefault("seen", set())
+    existing = set(db.execute(
+        select(Shop.username).where(Shop.username.in_({item.username for _, item in rows}))
+    ).scalars())
+
+    now = datetime.now()
+    results, values = [], []
+    added_names = set()  # 本批新增
+    for row_no, item in rows:
+        if item.username in existing or item.username in seen or item.username in added_names:
+            results.append((row_no, "商铺名已存在"))
+            continue
+        if (item.role or "admin") not in SHOP_ROLES:
+            results.append((row_no, f"role 取值应为 {'/'.join(SHOP_ROLES)}"))
+            continue
+        if (item.size or "small") not in SHOP_SIZES:
+            results.append((row_no, f"size 取值应为 {'/'.join(SHOP_SIZES)}"))
+            continue
+        value = {
+            "username": item.username,
+            "email": item.email,  # 这里实际是地点
+            "province": item.province,
+            "city": item.city,
+            "district": item.district,
+            "size": item.size or "small",
+            "role": item.role or "admin",
+            "status": True,  # 默认激活
+            "audit_status": "pending",  # 默认待审核，审核通过前不进入搜索索引
+            "last_login_time": now
+        }
+        error = _length_error(Shop, value)
+        if error:
+            results.append((row_no, error))
+            continue
+        added_names.add(item.username)
+        values.append(value)
+        results.append((row_no, None))
+
+    if values and not dry_run:
+        db.execute(insert(Shop), values)
+    seen |= added_names
+    return results
+
+
+def _import_tasks(db, rows, context, dry_run):
+    creator_id = context["gov_user_id"]
+    assignee_ids = {item.assigned_to for _, item in rows if item.assigned_to}
+    found_users = set()
+    if assignee_ids:
+        found_users = set(db.execute(
+            select(GovernmentUser.gov_user_id).where(GovernmentUser.gov_user_id.in_(assignee_ids))).scalars())
+
+    now = datetime.now()
+    results, values = [], []
+    for row_no, item in rows:
+        if item.priority not in TASK_PRIORITIES:
+            results.append((row_no, f"priority 取值应为 {'/'.join(TASK_PRIORITIES)}"))
+            continue
+        if item.assigned_to and item.assigned_to not in found_users:
+            results.append((row_no, "指派的执法人员不存在"))
+            continue
+        try:
+            deadline = _parse_deadline(item.deadline) if item.deadline else None
+        except ValueError:
+            results.append((row_no, "deadline 格式错误"))
+            continue
+        value = {
+            "task_code": None,
+            "title": item.title,
+            "description": item.description,
+            "task_type": item.task_type,
+            "priority": item.priority,
+            "status": "pending",
+            "longitude": item.longitude,
+            "latitude": item.latitude,
+            "address": item.address,
+            "assigned_to": item.assigned_to,
+            "assigned_by": creator_id if item.assigned_to else None,
+            "deadline": deadline,
+            "created_by": creator_id,
+            "attachments": item.attachments or [],
+            "created_at": now,
+            "updated_at": now
+        }
+        error = _length_error(LawEnforcementTask, value)
+        if error:
+            results.append((row_no, error))
+            continue
+        values.append(value)
+        results.append((row_no, None))
+
+    if values and not dry_run:
+        for value in values:
+            value["task_code"] = task_codes.next_code()
+        db.execute(insert(LawEnforcementTask), values)
+        task_ids = dict(db.execute(
+            select(LawEnforcementTask.task_code, LawEnforcementTask.task_id)
+            .where(LawEnforcementTask.task_code.in_([v["task_code"] for v in values]))
+        ).all())
+        db.execute(insert(TaskHistory), [{
+            "task_id": task_ids[v["task_code"]],
+            "action": "create",
+            "description": f"创建任务: {v['title']}",
+            "performed_by": creator_id,
+            "old_status": None,
+            "new_status": "pending",
+            "performed_at": now
+        } for v in values])
+        # 绕过了 ORM 的 flush 事件，手动更新统计汇总
+        rollups.apply_changes(db.connection(), [
+            (LawEnforcementTask, None, {field: v[field] for field in
+                                        ("created_at", "status", "task_type", "priority", "assigned_to")})
+            for v in values
+        ])
+    return results
+
+
+_IMPORTERS = {
+    "locations": _import_locations,
+    "shops": _import_shops,
+    "tasks": _import_tasks,
+}
+
+
+def import_batch(db, entity, rows, context, dry_run=False, commit=True):
+    """
+    校验并写入一批已通过模型校验的行 [(行号, 模型对象)]，返回 [(行号, 错误信息或 None)]。
+    整批写入出错时回滚到保存点并逐行重试，只有出错的行记为失败；
+    commit=False 时由调用方（后台作业）提交
+    """
+    importer = _IMPORTERS[entity]
+    try:
+        with db.begin_nested():
+            results = importer(db, rows, context, dry_run)
+    except Exception as e:
+        print(f"导入{entity}整批写入失败，逐行重试: {e}")
+        results = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    results.extend(importer(db, [row], context, dry_run))
+            except Exception as row_error:
+                results.append((row[0], f"写入失败: {row_error}"))
+
+    if commit and not dry_run:
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return [(row_no, f"写入失败: {e}") for row_no, _ in rows]
+    return results
+
+
+class ImportReport:
+    def __init__(self, entity, dry_run):
+        self.entity = entity
+        self.dry_run = dry_run
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors = []
+        self.rows = []  # 提交为后台作业时待处理的行
+
+    def add(self, results):
+        for row_no, error in results:
+            if error is None:
+                self.succeeded += 1
+            else:
+                self.fail(row_no, error)
+
+    def fail(self, row_no, error):
+        self.failed += 1
+        if len(self.errors) < IMPORT_CONFIG["max_errors"]:
+            self.errors.append({"row": row_no, "error": error})
+
+    def to_dict(self):
+        return {
+            "entity": self.entity,
+            "dryRun": self.dry_run,
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors)
+        }
+
+
+async def run_import(db, entity, chunks, fmt, context, dry_run=False, background=False):
+    """
+    流式导入。background 时只做格式校验，通过的行放在 report.rows 中由调用方提交为作业
+    （succeeded 表示通过格式校验的行数）。每批的查询和写入在线程池中执行，不阻塞事件循环
+    """
+    loop = asyncio.get_running_loop()
+    model = ENTITIES[entity]
+    report = ImportReport(entity, dry_run)
+    batch = []
+    async for row_no, data, error in iter_records(chunks, fmt):
+        if row_no > IMPORT_CONFIG["max_rows"]:
+            report.fail(row_no, f"超出单次导入上限 {IMPORT_CONFIG['max_rows']} 行，之后的行未处理")
+            break
+        report.total = row_no
+        if error is not None:
+            report.fail(row_no, error)
+            continue
+        try:
+            item = model.model_validate(data)
+        except ValidationError as e:
+            report.fail(row_no, _validation_message(e))
+            continue
+
+        if background and not dry_run:
+            report.rows.append(dict(item.model_dump(), _row=row_no))
+            report.succeeded += 1
+            continue
+        batch.append((row_no, item))
+        if len(batch) >= IMPORT_CONFIG["batch_size"]:
+            report.add(await loop.run_in_executor(None, import_batch, db, entity, batch, context, dry_run))
+            batch = []
+    if batch:
+        report.add(await loop.run_in_executor(None, import_batch, db, entity, batch, context, dry_run))
+    report.errors.sort(key=lambda e: e["row"])
+    return report
+
+
+def import_job_handler(entity):
+    """后台作业的处理函数：条目为 run_import 收集的行，结果中的 id 为原始行号"""
+    model = ENTITIES[entity]
+
+    def handler(db, params, items, operator):
+        rows = [(item["_row"], model.model_validate({k: v for k, v in item.items() if k != "_row"}))
+                for item in items]
+        return [{"id": row_no, "success": error is None, "msg": error or "成功"}
+                for row_no, error in import_batch(db, entity, rows, dict(params), commit=False)]
+    return handler
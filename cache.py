@@ -0,0 +1,129 @@
+# cache.py
+"""
+进程内 TTL 缓存
+
+按最近使用顺序淘汰的有界字典，每个条目带过期时间；支持按 key 或整体失效。
+所有实例登记在 CACHES 中，统一导出命中率。
+invalidate_on_commit 在会话提交了指定模型的写入后自动清空缓存。
+"""
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from sqlalchemy import event
+
+_MISSING = object()
+
+# 名称 -> TTLCache，供监控接口汇总
+CACHES = {}
+
+
+class TTLCache:
+    def __init__(self, name, ttl, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0          # 每次失效加一，加载期间发生失效时不写入旧数据
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """命中时返回缓存值，否则调用 loader() 计算并缓存"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self.generation
+            value = loader()
+            if generation == self.generation:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """使单个 key 失效；不传 key 时清空整个缓存"""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self.invalidations += 1
+            self.generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+def cache_stats():
+    return [c.stats() for c in CACHES.values()]
+
+
+def invalidate_on_commit(session_factory, models, *caches):
+    """
+    会话提交了对 models 的增删改后清空 caches，包括 flush 的 ORM 对象和
+    session.execute 执行的批量 INSERT/UPDATE/DELETE；回滚时不失效。
+    只在最外层事务提交时失效（释放保存点不算）；回滚保存点时保留标记，最外层提交时照常失效
+    """
+    models = tuple(models)
+    flag = f"invalidate:{','.join(c.name for c in caches)}"
+
+    def before_flush(session, flush_context, instances):
+        if any(isinstance(obj, models) for obj in chain(session.new, session.dirty, session.deleted)):
+            session.info[flag] = True
+
+    def do_orm_execute(state):
+        mapper = state.bind_mapper
+        if (state.is_insert or state.is_update or state.is_delete) and mapper is not None \
+                and issubclass(mapper.class_, models):
+            state.session.info[flag] = True
+
+    def after_commit(session):
+        if session.get_nested_transaction() is None and session.info.pop(flag, False):
+            for cache in caches:
+                cache.invalidate()
+
+    def after_rollback(session):
+        if session.get_nested_transaction() is None:
+            session.info.pop(flag, None)
+
+    def after_transaction_end(session, transaction):
+        if transaction.parent is None and not transaction.nested:
+            session.info.pop(flag, None)  # 未提交就关闭会话
+
+    event.listen(session_factory, "before_flush", before_flush)
+    event.listen(session_factory, "do_orm_execute", do_orm_execute)
+    event.listen(session_factory, "after_commit", after_commit)
+    event.listen(session_factory, "after_rollback", after_rollback)
+    event.listen(session_factory, "after_transaction_end", after_transaction_end)
@@ -0,0 +1,177 @@
+# compression.py
+"""
+响应压缩
+
+纯 ASGI 中间件，按 Accept-Encoding 协商 br / zstd / gzip（q 值高者优先，相同时按此顺序），
+只压缩 JSON、文本、NDJSON/CSV 等类型且超过 minimum_size 的响应；图片等已压缩的类型、
+已带 Content-Encoding 的响应（导出接口自行 gzip、缓存的预压缩响应）原样透传。
+流式响应逐块压缩并 flush，客户端可以边收边解。
+
+brotli、zstandard 已列入 requirements.txt；部署环境缺少时不提供对应编码（也接受 brotlicffi），gzip 始终可用。
+
+cached_response 把整段 JSON 响应体放进 TTLCache，各编码的压缩结果随条目一起缓存，
+同一份数据只压缩一次。
+"""
+import zlib
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时尝试 brotlicffi（接口相同）
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时不提供 zstd
+    zstandard = None
+
+COMPRESSION_CONFIG = {
+    "minimum_size": 1024,     # 小于该字节数的响应不压缩
+    "gzip_level": 6,
+    "brotli_quality": 5,      # 在线压缩取中等质量，11 太慢
+    "zstd_level": 3,
+    "compressible_types": (
+        "application/json",
+        "application/x-ndjson",
+        "application/javascript",
+        "application/xml",
+        "text/",
+    ),
+}
+
+# 服务端偏好顺序
+ENCODINGS = tuple(name for name, available in (
+    ("br", brotli is not None),
+    ("zstd", zstandard is not None),
+    ("gzip", True),
+) if available)
+
+
+def negotiate(accept_encoding):
+    """返回选中的编码，客户端不接受任何可用编码时返回 None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressor(encoding):
+    """返回 (compress, flush, finish)：flush 输出已压缩的数据但不结束流，finish 结束流"""
+    if encoding == "br":
+        c = brotli.Compressor(quality=COMPRESSION_CONFIG["brotli_quality"])
+        return c.process, c.flush, c.finish
+    if encoding == "zstd":
+        c = zstandard.ZstdCompressor(level=COMPRESSION_CONFIG["zstd_level"]).compressobj()
+        return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+    c = zlib.compressobj(COMPRESSION_CONFIG["gzip_level"], zlib.DEFLATED, 31)
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def compress(encoding, body):
+    process, _, finish = _compressor(encoding)
+    return process(body) + finish()
+
+
+def is_compressible(headers):
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSION_CONFIG["compressible_types"])
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=None):
+        self.app = app
+        self.minimum_size = COMPRESSION_CONFIG["minimum_size"] if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        stream = None   # 流式压缩时为 (compress, flush, finish)；None 表示原样透传
+
+        async def send_wrapper(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                start = message  # 看到第一段响应体后再决定是否压缩
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                message_start, start = start, None
+                headers = MutableHeaders(raw=list(message_start["headers"]))
+                if not is_compressible(headers) or (not more_body and len(body) < self.minimum_size):
+                    await send(message_start)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    stream = _compressor(encoding)
+                    body = stream[0](body) + stream[1]()
+                else:
+                    body = compress(encoding, body)
+                    headers["Content-Length"] = str(len(body))
+                message_start["headers"] = headers.raw
+                await send(message_start)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if stream is None:
+                await send(message)
+                return
+            process, flush, finish = stream
+            body = process(body) + (flush() if more_body else finish())
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def cached_response(cache, key, accept_encoding, build):
+    """
+    从 cache 返回预压缩的 JSON 响应；未命中时调用 build() 生成响应体（bytes）。
+    条目为 {编码: 响应体}，首次以某种编码请求时压缩一次并存回条目
+    """
+    entry = cache.get_or_load(key, lambda: {"identity": build()})
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(accept_encoding)
+    if encoding is None or len(entry["identity"]) < COMPRESSION_CONFIG["minimum_size"]:
+        return Response(entry["identity"], media_type="application/json", headers=headers)
+
+    body = entry.get(encoding)
+    if body is None:
+        body = entry[encoding] = compress(encoding, entry["identity"])
+    headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
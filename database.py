@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 # 请根据您的MySQL配置修改以下信息
 DATABASE_CONFIG = {
@@ -8,7 +8,8 @@ DATABASE_CONFIG = {
     "port": 3306,
     "user": "root",  # 改为您的MySQL用户名
     "password": "",  # 改为您的MySQL密码
-    "database": "panorama_system"
+    "database": "panorama_system",
+    "echo": False  # 输出每条SQL，仅在本地排查时开启；请求级统计见 sql_profiler.py
 }
 
 # 创建数据库连接URL
@@ -21,7 +22,7 @@ engine = create_engine(
     pool_recycle=3600,
     max_overflow=20,
     pool_size=10,
-    echo=True
+    echo=DATABASE_CONFIG["echo"]
 )
 
 # 创建SessionLocal类
@@ -30,6 +31,53 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # 创建Base类
 Base = declarative_base()
 
+# 提交后执行的副作用（操作日志入队、搜索索引更新等），回滚时丢弃。
+# 只在最外层事务提交时执行：释放保存点也会触发 after_commit，需排除；
+# 回滚保存点只丢弃保存点开始后登记的，回滚或未提交就关闭整个事务时全部丢弃
+def run_after_commit(db, callback):
+    """当前事务提交后调用 callback()；callback 中不能再用该会话访问数据库"""
+    db.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        marks = session.info.setdefault("after_commit_marks", {})
+        marks[transaction] = len(session.info.get("after_commit", []))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session):
+    if session.get_nested_transaction() is not None:
+        return  # 释放保存点
+    for callback in session.info.pop("after_commit", []):
+        try:
+            callback()
+        except Exception as e:
+            print(f"提交后处理失败: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(session):
+    callbacks = session.info.get("after_commit")
+    if not callbacks:
+        return
+    nested = session.get_nested_transaction()
+    if nested is None:
+        callbacks.clear()
+    else:
+        del callbacks[session.info.get("after_commit_marks", {}).get(nested, len(callbacks)):]
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _end_transaction(session, transaction):
+    if transaction.nested:
+        session.info.get("after_commit_marks", {}).pop(transaction, None)
+    elif transaction.parent is None:
+        session.info.pop("after_commit", None)
+        session.info.pop("after_commit_marks", None)
+
+
 # 依赖函数
 def get_db():
     db = SessionLocal()
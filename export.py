@@ -0,0 +1,232 @@
+# export.py
+"""
+数据导出
+
+全景图、执法任务、店铺和操作日志按 NDJSON 或 CSV 流式导出。查询使用服务端游标
+（stream_results + yield_per），每次从数据库取一批行、编码后立即发送，内存占用与
+导出的总行数无关；客户端支持 gzip 时边编码边压缩。筛选条件与对应的列表接口相同（见 list_filters.py）。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from database import engine
+from log_partitions import iter_archived_logs
+from models_db import GovernmentUser, LawEnforcementTask, Location, OperationLog, Panorama, Shop
+
+EXPORT_CONFIG = {
+    "batch_rows": 1000,   # 每次从游标读取并发送的行数
+    "gzip_level": 6,
+}
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _time(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+# ---------- 各类数据的查询与行格式 ----------
+def panoramas(conditions):
+    location_name = select(Location.name).where(Location.panorama_id == Panorama.panorama_id) \
+        .limit(1).scalar_subquery()
+    statement = select(
+        Panorama.panorama_id, Panorama.status, Panorama.shoot_time, Panorama.longitude, Panorama.latitude,
+        Panorama.description, Panorama.thumbnail_image_id, Panorama.created_by, Panorama.created_at,
+        location_name.label("location")
+    ).where(*conditions).order_by(Panorama.panorama_id)
+    fields = ["id", "status", "shootTime", "location", "longitude", "latitude", "description",
+              "thumbnail", "createdBy", "createdAt"]
+
+    def to_dict(row):
+        return {
+            "id": row.panorama_id,
+            "status": row.status,
+            "shootTime": _time(row.shoot_time),
+            "location": row.location or "未使用",
+            "longitude": row.longitude,
+            "latitude": row.latitude,
+            "description": row.description,
+            "thumbnail": f"/api/images/{row.thumbnail_image_id}",
+            "createdBy": row.created_by,
+            "createdAt": _time(row.created_at)
+        }
+    return statement, fields, to_dict
+
+
+def tasks(conditions):
+    t = LawEnforcementTask
+    assignee = aliased(GovernmentUser)
+    creator = aliased(GovernmentUser)
+    statement = select(
+        t.task_id, t.task_code, t.title, t.description, t.task_type, t.priority, t.status,
+        t.longitude, t.latitude, t.address, t.assigned_to, t.created_by, t.deadline,
+        t.completion_time, t.remarks, t.created_at, t.updated_at,
+        assignee.username.label("assignee_name"), assignee.department.label("assignee_department"),
+        creator.username.label("creator_name")
+    ).select_from(t) \
+        .outerjoin(assignee, t.assigned_to == assignee.gov_user_id) \
+        .outerjoin(creator, t.created_by == creator.gov_user_id) \
+        .where(*conditions).order_by(t.task_id)
+    fields = ["id", "task_code", "title", "description", "task_type", "priority", "status",
+              "longitude", "latitude", "address", "assigned_to_id", "assigned_to_name",
+              "assigned_to_department", "created_by_id", "created_by_name", "deadline",
+              "completion_time", "remarks", "created_at", "updated_at"]
+
+    def to_dict(row):
+        return {
+            "id": row.task_id,
+            "task_code": row.task_code,
+            "title": row.title,
+            "description": row.description,
+            "task_type": row.task_type,
+            "priority": row.priority,
+            "status": row.status,
+            "longitude": row.longitude,
+            "latitude": row.latitude,
+            "address": row.address,
+            "assigned_to_id": row.assigned_to,
+            "assigned_to_name": row.assignee_name,
+            "assigned_to_department": row.assignee_department,
+            "created_by_id": row.created_by,
+            "created_by_name": row.creator_name,
+            "deadline": _time(row.deadline),
+            "completion_time": _time(row.completion_time),
+            "remarks": row.remarks,
+            "created_at": _time(row.created_at),
+            "updated_at": _time(row.updated_at)
+        }
+    return statement, fields, to_dict
+
+
+def shops(conditions):
+    statement = select(
+        Shop.shop_id, Shop.username, Shop.email, Shop.province, Shop.city, Shop.district, Shop.size,
+        Shop.role, Shop.status, Shop.audit_status, Shop.last_login_time, Shop.created_at
+    ).where(*conditions).order_by(Shop.shop_id)
+    fields = ["id", "username", "email", "province", "city", "district", "size", "role", "status",
+              "auditStatus", "lastLoginTime", "createdAt"]
+
+    def to_dict(row):
+        return {
+            "id": row.shop_id,
+            "username": row.username,
+            "email": row.email,  # 这里实际是地点
+            "province": row.province,
+            "city": row.city,
+            "district": row.district,
+            "size": row.size,
+            "role": row.role,
+            "status": bool(row.status),
+            "auditStatus": row.audit_status or "pending",
+            "lastLoginTime": _time(row.last_login_time),
+            "createdAt": _time(row.created_at)
+        }
+    return statement, fields, to_dict
+
+
+LOG_FIELDS = ["id", "operator", "action", "target", "time", "ip", "result", "details"]
+
+
+def operation_logs(conditions):
+    statement = select(
+        OperationLog.log_id, OperationLog.operator, OperationLog.action, OperationLog.target,
+        OperationLog.operation_time, OperationLog.ip_address, OperationLog.result, OperationLog.details
+    ).where(*conditions).order_by(OperationLog.operation_time.desc())
+
+    def to_dict(row):
+        return {
+            "id": row.log_id,
+            "operator": row.operator,
+            "action": row.action,
+            "target": row.target,
+            "time": _time(row.operation_time),
+            "ip": row.ip_address,
+            "result": row.result,
+            "details": row.details
+        }
+    return statement, LOG_FIELDS, to_dict
+
+
+def archived_logs(start_dt, end_dt, operator, action):
+    """归档段中的日志（都早于在线数据），行格式与 operation_logs 相同"""
+    for item in iter_archived_logs(start_dt, end_dt, operator, action):
+        yield {
+            "id": item["log_id"],
+            "operator": item["operator"],
+            "action": item["action"],
+            "target": item["target"],
+            "time": item["operation_time"],
+            "ip": item["ip_address"],
+            "result": item["result"],
+            "details": item.get("details")
+        }
+
+
+# ---------- 流式输出 ----------
+def _batches(statement, to_dict, extra=None):
+    batch_rows = EXPORT_CONFIG["batch_rows"]
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_rows).execute(statement)
+        for partition in result.partitions():
+            yield [to_dict(row) for row in partition]
+    if extra is not None:
+        batch = []
+        for item in extra:
+            batch.append(item)
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _encode(batches, fmt, fields):
+    if fmt == "csv":
+        # 带 BOM，Excel 打开时能正确识别中文
+        yield ("\ufeff" + ",".join(fields) + "\r\n").encode("utf-8")
+        for batch in batches:
+            buffer = io.StringIO()
+            csv.DictWriter(buffer, fields).writerows(batch)
+            yield buffer.getvalue().encode("utf-8")
+    else:
+        for batch in batches:
+            yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch).encode("utf-8")
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(EXPORT_CONFIG["gzip_level"], zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def export_response(entity, fmt, query, accept_encoding=None, extra=None):
+    """query 为 panoramas()/tasks() 等返回的 (statement, fields, to_dict)"""
+    statement, fields, to_dict = query
+    body = _encode(_batches(statement, to_dict, extra), fmt, fields)
+    filename = f"{entity}-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=FORMATS[fmt], headers=headers)
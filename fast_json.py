@@ -0,0 +1,57 @@
+# fast_json.py
+"""
+JSON 序列化
+
+使用 orjson 编码响应（未安装时退回标准库 json）。datetime 统一在序列化时格式化为
+"%Y-%m-%d %H:%M:%S"，接口构建数据时可以直接放入 datetime 对象。
+
+默认情况下 FastAPI 会用 response_model 把接口返回的整棵数据重新校验、转换一遍再编码；
+大列表接口的数据都是内部构建的，用 trusted_response 直接编码返回，跳过这一步。
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库 json
+    orjson = None
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, date):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def trusted_response(data=None, msg="成功", code="200"):
+    """内部构建的数据直接编码为 BaseResponse 格式，不经过 response_model 校验"""
+    return FastJSONResponse({"code": code, "msg": msg, "data": data})
@@ -0,0 +1,64 @@
+# fieldsets.py
+"""
+列表接口的稀疏字段
+
+接口用 FieldSet 声明每个输出字段需要查询哪些列、怎样从查询结果行取值，以及命名的字段组合
+（如 marker / card / full）。请求的 fields 参数可以是组合名、字段名或二者混合（逗号分隔），
+接口只 SELECT 选中字段用到的列，也只序列化这些字段；不传时为 full，输出与原来相同。
+"""
+
+
+class Field:
+    """
+    columns: 输出该字段需要查询的列（可为 label）
+    value: value(row, ctx) 从查询结果行取值，默认取第一列
+    needs: 需要接口额外准备的关联（如外连接、批量加载用户），由接口自行处理
+    """
+    __slots__ = ("columns", "value", "needs")
+
+    def __init__(self, columns, value=None, needs=()):
+        self.columns = tuple(columns)
+        if value is None:
+            key = self.columns[0].key
+            value = lambda row, ctx: getattr(row, key)
+        self.value = value
+        self.needs = frozenset(needs)
+
+
+class Selection:
+    """一次请求选中的字段，按 FieldSet 中的定义顺序输出"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        columns = {}
+        for field in fields.values():
+            for column in field.columns:
+                columns.setdefault(column.key, column)
+        self.columns = list(columns.values())
+        self.needs = frozenset().union(*(field.needs for field in fields.values()))
+
+    def to_dict(self, row, ctx=None):
+        return {name: field.value(row, ctx) for name, field in self.fields.items()}
+
+
+class FieldSet:
+    def __init__(self, fields, profiles, required=("id",)):
+        self.fields = fields
+        self.profiles = {"full": tuple(fields), **profiles}
+        self.required = tuple(required)
+
+    def select(self, spec=None):
+        """解析 fields 参数；出现未知的字段或组合名时抛出 ValueError"""
+        names = set(self.required)
+        for part in (spec or "full").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if part in self.profiles:
+                names.update(self.profiles[part])
+            elif part in self.fields:
+                names.add(part)
+            else:
+                raise ValueError(f"未知字段: {part}（可用组合: {', '.join(self.profiles)}；"
+                                 f"可用字段: {', '.join(self.fields)}）")
+        return Selection({name: field for name, field in self.fields.items() if name in names})
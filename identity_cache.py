@@ -0,0 +1,50 @@
+# identity_cache.py
+"""
+用户身份缓存
+
+按主键缓存 User / GovernmentUser 对象。缓存中的对象已从加载它的会话中移除（detached），
+所有列在加载时已读出，可以跨请求只读使用；修改用户的接口需调用 invalidate_*。
+"""
+from cache import TTLCache
+from models_db import GovernmentUser, User
+
+IDENTITY_CACHE_CONFIG = {
+    "ttl_seconds": 60,
+    "maxsize": 10000,
+}
+
+user_cache = TTLCache("users", ttl=IDENTITY_CACHE_CONFIG["ttl_seconds"],
+                      maxsize=IDENTITY_CACHE_CONFIG["maxsize"])
+gov_user_cache = TTLCache("government_users", ttl=IDENTITY_CACHE_CONFIG["ttl_seconds"],
+                          maxsize=IDENTITY_CACHE_CONFIG["maxsize"])
+
+
+def _load(db, model, cache, key):
+    obj = cache.get(key)
+    if obj is not None:
+        return obj
+    # 本会话已加载（可能正在修改）的对象直接使用，不放入缓存
+    attached = db.identity_map.get(db.identity_key(model, key))
+    if attached is not None:
+        return attached
+    obj = db.get(model, key)
+    if obj is not None:
+        db.expunge(obj)
+        cache.set(key, obj)
+    return obj
+
+
+def get_user(db, user_id):
+    return _load(db, User, user_cache, user_id)
+
+
+def get_gov_user(db, gov_user_id):
+    return _load(db, GovernmentUser, gov_user_cache, gov_user_id)
+
+
+def invalidate_user(user_id):
+    user_cache.invalidate(user_id)
+
+
+def invalidate_gov_user(gov_user_id):
+    gov_user_cache.invalidate(gov_user_id)
@@ -0,0 +1,307 @@
+# index_advisor.py
+"""
+索引顾问：捕获热点接口实际发出的查询，在已初始化数据的库上执行 EXPLAIN，
+找出全表扫描并给出复合索引建议，生成可在线执行的迁移 SQL。
+
+用法:
+    python index_advisor.py            # 分析并输出迁移文件
+    python index_advisor.py --apply    # 分析后直接执行迁移
+    python index_advisor.py --check    # 存在热点查询全表扫描或热点接口调用失败时以非零状态退出（用于CI）
+
+tests/test_index_advisor.py 以 pytest 执行同样的检查（未连接 MySQL 时跳过）。
+
+需要 init_db.py 初始化的管理员（users.role=admin）和政府管理员（government_users.role=admin），
+用它们签发真实令牌调用接口。
+"""
+import os
+import re
+import sys
+import traceback
+from datetime import datetime
+
+from sqlalchemy import event, inspect, text
+
+from auth_tokens import issue_token
+from database import engine, Base, SessionLocal
+from models_db import *
+
+# 需要分析的热点只读接口: (方法, 路径, 查询参数)
+HOT_ENDPOINTS = [
+    ("GET", "/api/panorama/locations", {}),
+    ("GET", "/api/panorama/panoramas", {}),
+    ("GET", "/api/panorama/available", {}),
+    ("GET", "/api/panorama/timemachine/1", {}),
+    ("GET", "/api/panorama/locations/1", {}),
+    ("GET", "/api/panorama/1/previews", {}),
+    ("GET", "/api/manager/data/list", {"status": "pending"}),
+    ("GET", "/api/manager/data/1", {}),
+    ("GET", "/api/manager/monitor/logs", {"actionType": "数据审核"}),
+    ("GET", "/api/shop/list", {}),
+    ("GET", "/api/admin/shop-audit/list", {"status": "pending"}),
+    ("GET", "/api/government/panoramas/all", {}),
+    ("GET", "/api/government/tasks", {"status": "pending"}),
+    ("GET", "/api/government/tasks", {"assigned_to": 1}),
+    ("GET", "/api/government/tasks/statistics", {"period": "week"}),
+    ("GET", "/api/government/tasks/1", {}),
+    ("GET", "/api/government/users", {}),
+    ("GET", "/api/government/dashboard", {}),
+]
+
+# 数据量小、允许全表扫描的表
+SCAN_ALLOWED_TABLES = {"users", "government_users", "service_status"}
+
+MIGRATION_DIR = "database_migrations"
+
+_COLUMN_REF = r"`?(\w+)`?\.`?(\w+)`?"
+_EQ_PATTERN = re.compile(_COLUMN_REF + r"\s*(?:=\s*[%?:]|IN\s*\(|IS\s+(?:NOT\s+)?NULL)", re.I)
+_RANGE_PATTERN = re.compile(_COLUMN_REF + r"\s*(?:>=|<=|>|<|BETWEEN)", re.I)
+
+
+def issue_tokens():
+    """为初始化数据中的管理员和政府管理员签发令牌: {"user": ..., "gov": ...}"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.role == "admin", User.status == True).first()
+        gov_user = db.query(GovernmentUser).filter(
+            GovernmentUser.role == "admin", GovernmentUser.status == True
+        ).first()
+    finally:
+        db.close()
+    if user is None or gov_user is None:
+        raise RuntimeError("库中缺少启用的管理员或政府管理员，请先运行 init_db.py")
+    return {
+        "user": issue_token("user", user.user_id, user.role, user.token_version),
+        "gov": issue_token("gov", gov_user.gov_user_id, gov_user.role, gov_user.token_version),
+    }
+
+
+def capture_queries():
+    """
+    调用热点接口并记录每个接口发出的 SELECT 语句
+    返回 ([(接口, 语句, 参数)], [(接口, 状态码)])，后者为返回 >= 400 的接口
+    """
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        print("缺少 httpx 库，无法调用接口，请安装: pip install httpx")
+        raise
+
+    import main
+
+    tokens = issue_tokens()
+    captured = []
+    failed = []
+    current = {"endpoint": None}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current["endpoint"] and statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current["endpoint"], statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        client = TestClient(main.app)
+        for method, path, params in HOT_ENDPOINTS:
+            current["endpoint"] = f"{method} {path}"
+            token = tokens["gov"] if path.startswith("/api/government/") else tokens["user"]
+            response = client.request(method, path, params={"token": token, **params})
+            if response.status_code >= 400:
+                print(f"  ! {method} {path} 返回 {response.status_code}")
+                failed.append((current["endpoint"], response.status_code))
+        current["endpoint"] = None
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    # 同一语句只分析一次
+    unique = {}
+    for endpoint, statement, parameters in captured:
+        unique.setdefault(statement, (endpoint, statement, parameters))
+    return list(unique.values()), failed
+
+
+def explain(conn, statement, parameters):
+    """执行 EXPLAIN，返回计划行（字典列表）"""
+    result = conn.exec_driver_sql("EXPLAIN " + statement, parameters or ())
+    return [dict(row._mapping) for row in result]
+
+
+def _clauses(statement):
+    """拆出语句中的 WHERE 与 ORDER BY 片段"""
+    def find(keyword, start=0):
+        match = re.compile(r"\s" + keyword + r"\s", re.I).search(statement, start)
+        return match.start() if match else -1
+
+    where = ""
+    order_by = ""
+    w = find("WHERE")
+    o = find(r"ORDER\s+BY")
+    if w >= 0:
+        ends = [i for i in (find(r"GROUP\s+BY", w), o, find("LIMIT", w)) if i > w]
+        where = statement[w:min(ends) if ends else len(statement)]
+    if o >= 0:
+        end = find("LIMIT", o)
+        order_by = statement[o:end if end > o else len(statement)]
+    return where, order_by
+
+
+def propose_index(statement, table):
+    """按 等值列 -> 第一个范围/排序列 的顺序为 table 组合索引列"""
+    where, order_by = _clauses(statement)
+
+    columns = []
+    for tbl, col in _EQ_PATTERN.findall(where):
+        if tbl == table and col not in columns:
+            columns.append(col)
+    tail = [col for tbl, col in _RANGE_PATTERN.findall(where) if tbl == table]
+    tail += [col for tbl, col in re.findall(_COLUMN_REF, order_by) if tbl == table]
+    for col in tail:
+        if col not in columns:
+            columns.append(col)
+            break
+    return tuple(columns)
+
+
+def existing_indexes(inspector, table):
+    indexes = [tuple(ix["column_names"]) for ix in inspector.get_indexes(table)]
+    pk = inspector.get_pk_constraint(table).get("constrained_columns") or []
+    if pk:
+        indexes.append(tuple(pk))
+    return indexes
+
+
+def _covered(columns, indexes):
+    return any(ix[:len(columns)] == columns for ix in indexes)
+
+
+def declared_missing_indexes(inspector):
+    """模型中声明但数据库里还没有的索引（旧库升级）"""
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        indexes = existing_indexes(inspector, table.name)
+        for index in table.indexes:
+            columns = tuple(c.name for c in index.columns)
+            if not _covered(columns, indexes):
+                missing.append((table.name, columns, "模型声明", index.name))
+    return missing
+
+
+def analyze():
+    """返回 (全表扫描列表, 索引建议列表, 调用失败的接口)，建议项为 (表, 列, 来源, 索引名)"""
+    queries, failed = capture_queries()
+    print(f"捕获 {len(queries)} 条不同的查询语句")
+
+    inspector = inspect(engine)
+    full_scans = []
+    proposals = declared_missing_indexes(inspector)
+
+    with engine.connect() as conn:
+        for endpoint, statement, parameters in queries:
+            for row in explain(conn, statement, parameters):
+                table = row.get("table")
+                if row.get("type") != "ALL" or not table or table in SCAN_ALLOWED_TABLES:
+                    continue
+                if row.get("possible_keys"):
+                    continue
+                columns = propose_index(statement, table)
+                if not columns:
+                    # 无筛选条件的列表查询，扫描整表是预期行为
+                    continue
+                full_scans.append((endpoint, table, columns, statement))
+                if not _covered(columns, existing_indexes(inspector, table)) and \
+                        (table, columns) not in [(p[0], p[1]) for p in proposals]:
+                    proposals.append((table, columns, endpoint, index_name(table, columns)))
+
+    return full_scans, proposals, failed
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"[:64]
+
+
+def migration_statements(proposals):
+    """在线 DDL（InnoDB 支持 INPLACE 建索引，不阻塞读写）"""
+    statements = []
+    for table, columns, source, name in proposals:
+        cols = ", ".join(f"`{c}`" for c in columns)
+        statements.append(
+            f"ALTER TABLE `{table}` ADD INDEX `{name}` ({cols}), "
+            f"ALGORITHM=INPLACE, LOCK=NONE"
+        )
+    return statements
+
+
+def render_migration(proposals):
+    lines = [
+        "-- 索引顾问生成的在线迁移",
+        f"-- 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        ""
+    ]
+    for (table, columns, source, name), statement in zip(proposals, migration_statements(proposals)):
+        lines.append(f"-- 来源: {source}")
+        lines.append(statement + ";")
+    return "\n".join(lines) + "\n"
+
+
+def write_migration(sql):
+    if not os.path.exists(MIGRATION_DIR):
+        os.makedirs(MIGRATION_DIR)
+    path = os.path.join(MIGRATION_DIR, f"add_indexes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sql)
+    return path
+
+
+def apply_migration(proposals):
+    with engine.connect() as conn:
+        for statement in migration_statements(proposals):
+            print(f"执行: {statement}")
+            conn.execute(text(statement))
+        conn.commit()
+
+
+def main():
+    apply = "--apply" in sys.argv
+    check = "--check" in sys.argv
+
+    print("=" * 60)
+    print("索引顾问")
+    print("=" * 60)
+
+    try:
+        full_scans, proposals, failed = analyze()
+    except Exception as e:
+        print(f"✗ 分析失败: {e}")
+        traceback.print_exc()
+        sys.exit(2)
+
+    if failed:
+        print(f"\n✗ {len(failed)} 个热点接口调用失败，其查询未被分析:")
+        for endpoint, status_code in failed:
+            print(f"  - {endpoint}: {status_code}")
+
+    if full_scans:
+        print(f"\n发现 {len(full_scans)} 处热点查询全表扫描:")
+        for endpoint, table, columns, statement in full_scans:
+            print(f"  - {endpoint}: {table} 按 ({', '.join(columns)}) 筛选无可用索引")
+    else:
+        print("\n✓ 热点查询均可使用索引")
+
+    if proposals:
+        sql = render_migration(proposals)
+        print("\n建议的索引:")
+        print(sql)
+        if apply:
+            apply_migration(proposals)
+            print("✓ 迁移已执行")
+        else:
+            print(f"✓ 迁移文件已生成: {write_migration(sql)}")
+    else:
+        print("✓ 无需新增索引")
+
+    if check and (full_scans or failed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
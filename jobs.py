@@ -0,0 +1,323 @@
+# jobs.py
+"""
+后台批量作业
+
+批量发布/删除、批量审核、缩略图重建、导入等耗时操作提交为作业后立即返回作业ID，
+由后台任务按块处理。条目存放在 bulk_job_items 中，每次只按序号读取当前块。
+处理函数只写入不提交，每块的业务写入与进度（检查点）、成功/失败数和失败条目在同一事务中
+提交到 bulk_jobs，客户端通过 /api/jobs/{id} 查询进度、预计剩余时间和部分结果，也可以取消。
+
+多进程部署时每个进程都运行处理循环，通过条件 UPDATE 认领作业；处理中的进程定期
+刷新 heartbeat_at。进程正常退出时把作业放回队列；进程崩溃后心跳超过 lease_seconds
+的作业由其他进程（或重启后的进程）从最后一个检查点继续处理。崩溃时未提交的块随事务
+回滚，不会被重复写入；检查点按 (处理进程, 原进度) 条件更新，作业已被其他进程接手时
+本块整体回滚。
+"""
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, inspect, or_, select, update
+
+from batch_ops import (PANORAMA_ACTIONS, SHOP_AUDIT_ACTIONS, audit_shops, batch_panoramas,
+                       regenerate_thumbnails)
+from bulk_import import ENTITIES as IMPORT_ENTITIES, import_job_handler
+from database import engine, SessionLocal
+from models_db import BulkJob, BulkJobItem
+
+JOB_CONFIG = {
+    "chunk_size": 200,               # 默认每块处理的条目数
+    "poll_interval_seconds": 2,      # 空闲时检查新作业的间隔
+    "lease_seconds": 120,            # 心跳超过该时间的运行中作业视为处理进程已退出
+    "max_items": 100000,             # 单个作业的条目上限
+    "max_results": 1000,             # 保存的失败条目上限
+    "insert_batch": 1000,            # 提交作业时每条 INSERT 写入的条目数
+    "shutdown_timeout_seconds": 30,  # 退出时等待当前块处理完的时间
+}
+
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class JobRunner:
+    def __init__(self, config):
+        self.config = config
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {}
+        self._task = None
+        self._wakeup = None
+        self._stopping = False
+
+    # ---------- 作业类型 ----------
+    def register(self, job_type, handler, validate=None, chunk_size=None, admin_only=False):
+        """
+        注册作业类型。handler(db, params, items, operator) 处理一块条目，
+        返回 [{"id": ..., "success": bool, "msg": ...}]；handler 不能提交（由 _step 与检查点一起提交），
+        单条失败需要隔离时用保存点。validate(params, items) 校验失败时抛出 ValueError
+        """
+        self.handlers[job_type] = {
+            "handler": handler,
+            "validate": validate,
+            "chunk_size": chunk_size or self.config["chunk_size"],
+            "admin_only": admin_only,
+        }
+
+    # ---------- 接口调用 ----------
+    def submit(self, db, job_type, items, params, operator):
+        """校验并创建作业，参数不合法时抛出 ValueError"""
+        spec = self.handlers.get(job_type)
+        if spec is None:
+            raise ValueError(f"不支持的作业类型: {job_type}")
+        if not items:
+            raise ValueError("作业没有待处理的条目")
+        if len(items) > self.config["max_items"]:
+            raise ValueError(f"单个作业最多 {self.config['max_items']} 条")
+        params = params or {}
+        if spec["validate"] is not None:
+            spec["validate"](params, items)
+
+        job = BulkJob(job_type=job_type, status="pending", params=params,
+                      total=len(items), results=[], created_by=operator)
+        db.add(job)
+        db.flush()
+        size = self.config["insert_batch"]
+        for start in range(0, len(items), size):
+            db.execute(insert(BulkJobItem), [
+                {"job_id": job.job_id, "seq": seq, "item": item}
+                for seq, item in enumerate(items[start:start + size], start)
+            ])
+        db.commit()
+        db.refresh(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def cancel(self, db, job):
+        """未开始的作业直接取消；运行中的作业在当前块处理完后停止"""
+        if job.status in FINISHED:
+            return job
+        db.execute(update(BulkJob).where(BulkJob.job_id == job.job_id, BulkJob.status == "pending")
+                   .values(status="cancelled", finished_at=datetime.now()))
+        db.execute(update(BulkJob).where(BulkJob.job_id == job.job_id, BulkJob.status == "running")
+                   .values(cancel_requested=True))
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def describe(self, job, with_results=True):
+        progress = round(job.processed * 100 / job.total, 1) if job.total else 100.0
+        eta = None
+        if job.status == "running" and job.processed and job.started_at and job.heartbeat_at:
+            elapsed = (job.heartbeat_at - job.started_at).total_seconds()
+            if elapsed > 0:
+                eta = round((job.total - job.processed) * elapsed / job.processed)
+        fmt = lambda t: t.strftime("%Y-%m-%d %H:%M:%S") if t else None
+        data = {
+            "id": job.job_id,
+            "type": job.job_type,
+            "status": job.status,
+            "params": job.params or {},
+            "total": job.total,
+            "processed": job.processed,
+            "succeeded": job.succeeded,
+            "failed": job.failed,
+            "progress": progress,
+            "etaSeconds": eta,
+            "cancelRequested": bool(job.cancel_requested),
+            "error": job.error,
+            "createdBy": job.created_by,
+            "createdAt": fmt(job.created_at),
+            "startedAt": fmt(job.started_at),
+            "finishedAt": fmt(job.finished_at),
+        }
+        if with_results:
+            data["results"] = job.results or []
+        return data
+
+    # ---------- 处理 ----------
+    def _claimable(self, now):
+        stale = now - timedelta(seconds=self.config["lease_seconds"])
+        return or_(BulkJob.status == "pending",
+                   (BulkJob.status == "running") & (BulkJob.heartbeat_at < stale))
+
+    def _claim(self):
+        """认领一个待处理或处理进程已失联的作业，返回作业ID"""
+        now = datetime.now()
+        with engine.begin() as conn:
+            candidates = conn.execute(
+                select(BulkJob.job_id).where(self._claimable(now)).order_by(BulkJob.job_id).limit(5)
+            ).scalars().all()
+            for job_id in candidates:
+                claimed = conn.execute(
+                    update(BulkJob).where(BulkJob.job_id == job_id, self._claimable(now))
+                    .values(status="running", worker=self.worker_id, heartbeat_at=now)
+                ).rowcount
+                if claimed:
+                    conn.execute(update(BulkJob).where(BulkJob.job_id == job_id, BulkJob.started_at.is_(None))
+                                 .values(started_at=now))
+                    return job_id
+        return None
+
+    def _finish(self, db, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.now()
+        job.heartbeat_at = job.finished_at
+        db.commit()
+
+    def _step(self, job_id):
+        """处理作业的下一块并写检查点，返回是否还有后续块"""
+        db = SessionLocal()
+        try:
+            job = db.get(BulkJob, job_id)
+            if job is None or job.status != "running" or job.worker != self.worker_id:
+                return False
+            if job.cancel_requested:
+                self._finish(db, job, "cancelled")
+                return False
+            spec = self.handlers.get(job.job_type)
+            if spec is None:
+                self._finish(db, job, "failed", f"不支持的作业类型: {job.job_type}")
+                return False
+            if job.processed >= job.total:
+                self._finish(db, job, "completed")
+                return False
+
+            start = job.processed
+            chunk = db.execute(
+                select(BulkJobItem.item)
+                .where(BulkJobItem.job_id == job_id, BulkJobItem.seq >= start,
+                       BulkJobItem.seq < start + spec["chunk_size"])
+                .order_by(BulkJobItem.seq)
+            ).scalars().all()
+            params, operator, saved_results = job.params or {}, job.created_by, job.results or []
+            try:
+                results = spec["handler"](db, params, chunk, operator)
+                failures = [r for r in results if not r["success"]]
+                values = {
+                    "processed": start + len(chunk),
+                    "succeeded": BulkJob.succeeded + len(results) - len(failures),
+                    "failed": BulkJob.failed + len(failures),
+                    "heartbeat_at": datetime.now(),
+                }
+                room = self.config["max_results"] - len(saved_results)
+                if failures and room > 0:
+                    values["results"] = saved_results + failures[:room]
+                # 检查点与本块的写入在同一事务中提交；作业已被其他进程接手时整块回滚
+                saved = db.execute(
+                    update(BulkJob)
+                    .where(BulkJob.job_id == job_id, BulkJob.worker == self.worker_id,
+                           BulkJob.status == "running", BulkJob.processed == start)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not saved:
+                    db.rollback()
+                    print(f"作业 {job_id} 已被其他进程接手，放弃本块")
+                    return False
+                db.commit()
+                return True
+            except Exception as e:
+                db.rollback()
+                job = db.get(BulkJob, job_id)
+                self._finish(db, job, "failed", f"处理第 {start + 1}-{start + len(chunk)} 条时出错: {e}")
+                print(f"作业 {job_id} 处理失败: {e}")
+                return False
+        finally:
+            db.close()
+
+    def _release(self, job_id):
+        """正常退出时把未完成的作业放回队列"""
+        with engine.begin() as conn:
+            conn.execute(update(BulkJob).where(BulkJob.job_id == job_id, BulkJob.status == "running",
+                                               BulkJob.worker == self.worker_id)
+                         .values(status="pending", worker=None))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                job_id = await loop.run_in_executor(None, self._claim)
+                if job_id is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.config["poll_interval_seconds"])
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    continue
+                while await loop.run_in_executor(None, self._step, job_id):
+                    if self._stopping:
+                        await loop.run_in_executor(None, self._release, job_id)
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"批量作业处理失败: {e}")
+                await asyncio.sleep(self.config["poll_interval_seconds"])
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """等待当前块处理完，把作业放回队列后退出"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, self.config["shutdown_timeout_seconds"])
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+
+def ensure_schema():
+    inspector = inspect(engine)
+    for model in (BulkJob, BulkJobItem):
+        if not inspector.has_table(model.__tablename__):
+            model.__table__.create(bind=engine)
+
+
+jobs = JobRunner(JOB_CONFIG)
+
+
+# ---------- 作业类型 ----------
+def _validate_ids(items):
+    if not all(isinstance(i, int) for i in items):
+        raise ValueError("条目必须是整数ID")
+
+
+def _validate_action(actions):
+    def validate(params, items):
+        if params.get("action") not in actions:
+            raise ValueError("无效的操作类型")
+        _validate_ids(items)
+    return validate
+
+
+def _panorama_batch(db, params, items, operator):
+    return batch_panoramas(db, params["action"], items, operator, commit=False)
+
+
+def _shop_audit(db, params, items, operator):
+    action = params["action"]
+    audited, not_found = audit_shops(db, action, items, operator, "批量店铺审核",
+                                     f"批量审核操作: {action}, 状态: {SHOP_AUDIT_ACTIONS[action]}",
+                                     commit=False)
+    return [{"id": shop_id, "success": True, "msg": "成功"} for shop_id, _ in audited] + \
+        [{"id": shop_id, "success": False, "msg": "店铺不存在"} for shop_id in not_found]
+
+
+def _thumbnail_regenerate(db, params, items, operator):
+    return regenerate_thumbnails(db, items, commit=False)
+
+
+jobs.register("panorama_batch", _panorama_batch, _validate_action(PANORAMA_ACTIONS))
+jobs.register("shop_audit", _shop_audit, _validate_action(SHOP_AUDIT_ACTIONS), admin_only=True)
+jobs.register("thumbnail_regenerate", _thumbnail_regenerate, lambda params, items: _validate_ids(items),
+              chunk_size=20)
+for entity in IMPORT_ENTITIES:
+    # 条目由 /api/import/{entity}?background=true 校验后提交
+    jobs.register(f"import_{entity}", import_job_handler(entity))
@@ -0,0 +1,99 @@
+# list_filters.py
+"""
+列表接口的筛选条件
+
+分页列表和导出接口共用，保证同样的参数筛出同样的数据。
+每个函数返回条件列表，调用方用 query.filter(*conditions) 或 select(...).where(*conditions)。
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from models_db import LawEnforcementTask, OperationLog, Panorama, Shop
+
+
+def parse_date_range(start_date, end_date):
+    """YYYY-MM-DD 日期范围，结束日期包含当天；格式错误时抛出 ValueError"""
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) if end_date else None
+    return start_dt, end_dt
+
+
+def panorama_conditions(status="all", keyword=None):
+    conditions = []
+    if status and status != "all":
+        conditions.append(Panorama.status == status)
+    if keyword:
+        conditions.append(or_(
+            Panorama.panorama_id.like(f"%{keyword}%"),
+            Panorama.description.like(f"%{keyword}%")
+        ))
+    return conditions
+
+
+def task_conditions(status=None, task_type=None, priority=None, assigned_to=None,
+                    start_date=None, end_date=None, keyword=None):
+    conditions = []
+    if status:
+        conditions.append(LawEnforcementTask.status == status)
+    if task_type:
+        conditions.append(LawEnforcementTask.task_type == task_type)
+    if priority:
+        conditions.append(LawEnforcementTask.priority == priority)
+    if assigned_to:
+        conditions.append(LawEnforcementTask.assigned_to == assigned_to)
+
+    # 日期范围筛选
+    start_dt, end_dt = parse_date_range(start_date, end_date)
+    if start_dt:
+        conditions.append(LawEnforcementTask.created_at >= start_dt)
+    if end_dt:
+        conditions.append(LawEnforcementTask.created_at < end_dt)
+
+    # 关键词搜索
+    if keyword:
+        conditions.append(or_(
+            LawEnforcementTask.title.like(f"%{keyword}%"),
+            LawEnforcementTask.description.like(f"%{keyword}%"),
+            LawEnforcementTask.task_code.like(f"%{keyword}%")
+        ))
+    return conditions
+
+
+def shop_audit_conditions(keyword=None, status=None):
+    conditions = []
+    if keyword:
+        conditions.append(or_(
+            Shop.username.ilike(f"%{keyword}%"),
+            Shop.email.ilike(f"%{keyword}%"),
+            Shop.province.ilike(f"%{keyword}%"),
+            Shop.city.ilike(f"%{keyword}%"),
+            Shop.district.ilike(f"%{keyword}%")
+        ))
+
+    # 审核状态筛选
+    if status:
+        if status == 'pending':
+            # 未审核：audit_status 为 None 或空字符串
+            conditions.append(or_(
+                Shop.audit_status == None,
+                Shop.audit_status == '',
+                Shop.audit_status == 'pending'
+            ))
+        else:
+            conditions.append(Shop.audit_status == status)
+    return conditions
+
+
+def log_conditions(operator=None, action=None, start_dt=None, end_dt=None):
+    conditions = []
+    if operator:
+        conditions.append(OperationLog.operator.contains(operator))
+    if action:
+        conditions.append(OperationLog.action == action)
+    # 带时间范围时只扫描命中的月份分区
+    if start_dt:
+        conditions.append(OperationLog.operation_time >= start_dt)
+    if end_dt:
+        conditions.append(OperationLog.operation_time < end_dt)
+    return conditions
@@ -0,0 +1,361 @@
+# log_partitions.py
+"""
+operation_logs 按月分区与保留策略
+
+- 表按 TO_DAYS(operation_time) 做 RANGE 分区，每月一个分区（p202501 ...），末尾保留 pmax
+- 超出保留期的月份导出为 gzip 压缩的 NDJSON 段文件后删除对应分区；清单记录每段已覆盖的最大 log_id，
+  删除前中断后重新归档时跳过已归档的行，不会重复
+- 归档段仍可通过 /api/manager/monitor/logs 按时间范围查询
+- 归档目录必须是所有应用实例都能访问的同一个绝对路径（如共享存储挂载点），由 LOG_ARCHIVE_DIR 指定；
+  未配置时不归档。只有分区表才归档，应用内定时维护需显式开启 auto_maintenance
+
+用法:
+    python log_partitions.py               # 查看分区与归档状态
+    python log_partitions.py --partition   # 将现有表转换为分区表（一次性）
+    python log_partitions.py --maintain    # 创建未来分区并归档过期分区
+"""
+import gzip
+import heapq
+import json
+import os
+import sys
+import traceback
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import engine
+from models_db import OperationLog
+
+LOG_RETENTION_CONFIG = {
+    "retention_months": 6,              # 在线保留的月数（含当月）
+    "premake_months": 2,                # 提前创建的未来月份分区数
+    "archive_dir": os.environ.get("LOG_ARCHIVE_DIR", ""),  # 归档段文件目录，所有实例共享的绝对路径
+    "auto_maintenance": os.environ.get("LOG_AUTO_MAINTENANCE") == "1",  # 是否在应用内定时维护
+    "maintenance_interval_hours": 24,   # 应用内自动维护的间隔
+}
+
+TABLE = OperationLog.__tablename__
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_MANIFEST = "manifest.json"
+_COLUMNS = ["log_id", "operator", "action", "target", "operation_time", "ip_address", "result", "details"]
+
+
+# ---------- 月份工具 ----------
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt, months):
+    index = dt.year * 12 + dt.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def month_key(dt):
+    return dt.strftime("%Y%m")
+
+
+def retention_cutoff(now=None):
+    """早于该时间的日志应归档"""
+    return add_months(month_start(now or datetime.now()), 1 - LOG_RETENTION_CONFIG["retention_months"])
+
+
+# ---------- 分区管理 ----------
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table": TABLE})
+    return [row[0] for row in rows]
+
+
+def _partition_clause(month):
+    upper = add_months(month, 1).strftime("%Y-%m-%d")
+    return f"PARTITION p{month_key(month)} VALUES LESS THAN (TO_DAYS('{upper}'))"
+
+
+def partition_table(conn):
+    """把普通表转换为按月分区表（分区键必须包含在主键中）"""
+    if list_partitions(conn):
+        print("✓ operation_logs 已是分区表")
+        return
+
+    oldest = conn.execute(text(f"SELECT MIN(operation_time) FROM {TABLE}")).scalar()
+    first = month_start(oldest or datetime.now())
+    last = add_months(month_start(datetime.now()), LOG_RETENTION_CONFIG["premake_months"])
+
+    clauses = []
+    month = first
+    while month <= last:
+        clauses.append(_partition_clause(month))
+        month = add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    print("调整主键为 (log_id, operation_time)...")
+    conn.execute(text(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, operation_time)"))
+    print(f"创建 {len(clauses)} 个分区...")
+    conn.execute(text(
+        f"ALTER TABLE {TABLE} PARTITION BY RANGE (TO_DAYS(operation_time)) ({', '.join(clauses)})"
+    ))
+    conn.commit()
+    print("✓ 分区转换完成")
+
+
+def ensure_future_partitions(conn):
+    """从 pmax 中拆出未来几个月的分区"""
+    partitions = list_partitions(conn)
+    if not partitions:
+        return []
+
+    last = add_months(month_start(datetime.now()), LOG_RETENTION_CONFIG["premake_months"])
+    existing = {name[1:] for name in partitions if name != "pmax"}
+    month = month_start(datetime.now())
+    if existing:
+        month = max(month, add_months(datetime.strptime(max(existing), "%Y%m"), 1))
+
+    clauses = []
+    while month <= last:
+        clauses.append(_partition_clause(month))
+        month = add_months(month, 1)
+    if clauses:
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO "
+            f"({', '.join(clauses)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+        conn.commit()
+    return clauses
+
+
+# ---------- 归档 ----------
+def archive_configured():
+    return bool(LOG_RETENTION_CONFIG["archive_dir"])
+
+
+def archive_dir():
+    """归档目录；未配置或不是绝对路径时抛出 ValueError（相对路径随进程工作目录变化，其他实例读不到）"""
+    path = LOG_RETENTION_CONFIG["archive_dir"]
+    if not path or not os.path.isabs(path):
+        raise ValueError("archive_dir 须配置为所有实例共享的绝对路径（环境变量 LOG_ARCHIVE_DIR）")
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+def load_manifest():
+    if not archive_configured():
+        return {}
+    path = os.path.join(LOG_RETENTION_CONFIG["archive_dir"], _MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    path = os.path.join(archive_dir(), _MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def segment_path(key):
+    return os.path.join(LOG_RETENTION_CONFIG["archive_dir"], f"{TABLE}_{key}.ndjson.gz")
+
+
+def _segment_key(item):
+    return item["operation_time"], item["log_id"]
+
+
+def _read_segment(path, max_log_id):
+    """逐行读取已有段中 log_id 不超过 max_log_id 的行（更大的是上次中断时写入、清单未确认的行）"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            if item["log_id"] <= max_log_id:
+                yield item
+
+
+def _segment_max_log_id(path):
+    """旧版清单没有 max_log_id 时从段文件中计算"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return max((json.loads(line)["log_id"] for line in f), default=0)
+
+
+def archive_month(conn, month):
+    """
+    导出一个月的日志为段文件（按时间倒序），再删除该月的在线数据。
+    同一月份重复归档（补写的迟到日志，或上次在删除前中断）时只导出 log_id 大于清单记录的行，
+    与已有段按时间倒序归并
+    """
+    start, end = month, add_months(month, 1)
+    key = month_key(month)
+    path = os.path.join(archive_dir(), f"{TABLE}_{key}.ndjson.gz")
+
+    manifest = load_manifest()
+    previous = manifest.get(key)
+    max_log_id = 0
+    if previous:
+        max_log_id = previous.get("max_log_id")
+        if max_log_id is None:
+            max_log_id = _segment_max_log_id(path)
+
+    result = conn.execution_options(stream_results=True).execute(text(
+        f"SELECT {', '.join(_COLUMNS)} FROM {TABLE} "
+        f"WHERE operation_time >= :start AND operation_time < :end AND log_id > :after "
+        f"ORDER BY operation_time DESC, log_id DESC"
+    ), {"start": start, "end": end, "after": max_log_id})
+
+    def new_rows():
+        for row in result:
+            item = dict(row._mapping)
+            item["operation_time"] = item["operation_time"].strftime(TIME_FORMAT)
+            yield item
+
+    rows = new_rows()
+    if previous:
+        rows = heapq.merge(rows, _read_segment(path, max_log_id), key=_segment_key, reverse=True)
+
+    count = 0
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        for item in rows:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            max_log_id = max(max_log_id, item["log_id"])
+            count += 1
+    result.close()
+
+    os.replace(path + ".tmp", path)
+    manifest[key] = {"rows": count, "file": os.path.basename(path), "max_log_id": max_log_id}
+    _save_manifest(manifest)
+
+    if f"p{key}" in list_partitions(conn):
+        conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION p{key}"))
+    else:
+        conn.execute(text(
+            f"DELETE FROM {TABLE} WHERE operation_time >= :start AND operation_time < :end"
+        ), {"start": start, "end": end})
+    conn.commit()
+    return count
+
+
+def archive_expired(conn):
+    """归档所有早于保留期的月份，返回 {月份: 行数}"""
+    cutoff = retention_cutoff()
+    oldest = conn.execute(text(
+        f"SELECT MIN(operation_time) FROM {TABLE} WHERE operation_time < :cutoff"
+    ), {"cutoff": cutoff}).scalar()
+
+    archived = {}
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        archived[month_key(month)] = archive_month(conn, month)
+        month = add_months(month, 1)
+    return archived
+
+
+def run_maintenance():
+    """
+    创建未来分区并归档过期数据；多进程部署时用 GET_LOCK 保证只有一个进程执行。
+    表未分区或未配置归档目录时不归档（不做大批量 DELETE，也不把日志写到本机目录）
+    """
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT GET_LOCK('operation_logs_maintenance', 0)")).scalar():
+            return None
+        try:
+            if not list_partitions(conn):
+                return {"created_partitions": 0, "archived": {}, "skipped": "表未分区"}
+            created = ensure_future_partitions(conn)
+            if not archive_configured():
+                return {"created_partitions": len(created), "archived": {}, "skipped": "未配置归档目录"}
+            archive_dir()
+            archived = archive_expired(conn)
+            return {"created_partitions": len(created), "archived": archived}
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK('operation_logs_maintenance')"))
+
+
+# ---------- 归档查询 ----------
+def archived_months(start=None, end=None):
+    """与 [start, end) 有交集的归档月份，按时间倒序"""
+    keys = []
+    for key in load_manifest():
+        month = datetime.strptime(key, "%Y%m")
+        if start and add_months(month, 1) <= start:
+            continue
+        if end and month >= end:
+            continue
+        keys.append(key)
+    return sorted(keys, reverse=True)
+
+
+def iter_archived_logs(start=None, end=None, operator=None, action=None):
+    """按时间倒序逐行读取归档日志，过滤条件与在线查询一致"""
+    start_text = start.strftime(TIME_FORMAT) if start else None
+    end_text = end.strftime(TIME_FORMAT) if end else None
+    for key in archived_months(start, end):
+        with gzip.open(segment_path(key), "rt", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                if start_text and item["operation_time"] < start_text:
+                    continue
+                if end_text and item["operation_time"] >= end_text:
+                    continue
+                if operator and operator not in item["operator"]:
+                    continue
+                if action and item["action"] != action:
+                    continue
+                yield item
+
+
+def query_archived_logs(start, end, operator, action, offset, limit):
+    """返回 (匹配总数, 当前页数据)"""
+    manifest = load_manifest()
+    months = archived_months(start, end)
+    if not months:
+        return 0, []
+
+    full_months = not operator and not action and all(
+        (not start or datetime.strptime(k, "%Y%m") >= start) and
+        (not end or add_months(datetime.strptime(k, "%Y%m"), 1) <= end)
+        for k in months
+    )
+
+    page = []
+    total = 0
+    for item in iter_archived_logs(start, end, operator, action):
+        if offset <= total < offset + limit:
+            page.append(item)
+        total += 1
+        if full_months and total >= offset + limit:
+            # 整月命中且无过滤条件时，总数直接取自清单，无需读完所有段
+            total = sum(manifest[k]["rows"] for k in months)
+            break
+    return total, page
+
+
+def show_status():
+    with engine.connect() as conn:
+        partitions = list_partitions(conn)
+    print(f"在线分区 ({len(partitions)} 个): {', '.join(partitions) if partitions else '未分区'}")
+    manifest = load_manifest()
+    print(f"归档段 ({len(manifest)} 个):")
+    for key in sorted(manifest):
+        print(f"  {key}: {manifest[key]['rows']} 行 -> {manifest[key]['file']}")
+
+
+def main():
+    try:
+        if "--partition" in sys.argv:
+            with engine.connect() as conn:
+                partition_table(conn)
+        if "--maintain" in sys.argv:
+            result = run_maintenance()
+            print(f"✓ 维护完成: {result}" if result is not None else "其他进程正在维护，已跳过")
+        show_status()
+    except Exception as e:
+        print(f"✗ 操作失败: {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,46 @@
-from fastapi import FastAPI, HTTPException, Query, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Query, Depends, status, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, PlainTextResponse
 from typing import List, Optional
 import uuid
-import random
+import asyncio
 
 import base64
-from io import BytesIO
-from PIL import Image
-import io
 
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, case
+from sqlalchemy import func, and_, or_, case, select
 
 from models import *
 from models_db import *
-from database import get_db
-
-app = FastAPI(title="全景系统API", description="全景系统后端接口", version="1.0.0")
+from database import get_db, SessionLocal, engine
+from suggest_index import name_index
+from audit_log import audit_log
+from log_partitions import LOG_RETENTION_CONFIG, query_archived_logs, run_maintenance
+from system_metrics import sampler, query_rollups, ensure_schema as ensure_monitoring_schema
+from request_metrics import request_metrics, RequestMetricsMiddleware
+from sql_profiler import sql_profiler, SqlProfilerMiddleware
+from analytics import analytics, ensure_schema as ensure_analytics_schema
+import rollups
+from cache import TTLCache, invalidate_on_commit, cache_stats
+from batch_loader import BatchLoader
+from task_codes import task_codes, ensure_schema as ensure_task_code_schema
+from batch_ops import batch_panoramas, audit_shops, make_thumbnail, PANORAMA_ACTIONS, SHOP_AUDIT_ACTIONS
+from jobs import jobs, ensure_schema as ensure_jobs_schema
+from fast_json import FastJSONResponse, trusted_response
+from compression import CompressionMiddleware, cached_response
+import export
+import bulk_import
+from fieldsets import Field, FieldSet
+from list_filters import (parse_date_range, panorama_conditions, task_conditions, shop_audit_conditions,
+                          log_conditions)
+from passwords import hash_password, verify_password, needs_rehash
+from auth_tokens import issue_token, verify_token, revoke, ensure_schema as ensure_token_schema
+from identity_cache import get_user, get_gov_user, gov_user_cache, invalidate_user, invalidate_gov_user
+
+# 响应统一用 orjson 编码；大列表接口用 trusted_response 跳过 response_model 校验（见 fast_json.py）
+app = FastAPI(title="全景系统API", description="全景系统后端接口", version="1.0.0",
+              default_response_class=FastJSONResponse)
 
 # CORS 配置
 app.add_middleware(
@@ -29,6 +51,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩（br/zstd/gzip 协商，见 compression.py）；在耗时统计之内，统计的是压缩后的字节数
+app.add_middleware(CompressionMiddleware)
+
+# 接口耗时统计（/metrics）
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+sampler.latency_source = request_metrics.window_mean_ms
+
+# 按请求统计SQL（/api/manager/monitor/sql）
+sql_profiler.install(engine)
+app.add_middleware(SqlProfilerMiddleware, profiler=sql_profiler)
+rollups.install(SessionLocal)
+
+
+@app.on_event("startup")
+def ensure_user_token_columns():
+    """为旧库补充 token_version 列（需在任何用户查询之前执行）"""
+    try:
+        ensure_token_schema()
+    except Exception as e:
+        print(f"用户表结构检查失败: {e}")
+
+
+@app.on_event("startup")
+def ensure_task_tables():
+    """为旧库创建统计汇总表和任务编号计数表（任务的新增和修改依赖这两张表）"""
+    try:
+        rollups.ensure_schema()
+        ensure_task_code_schema()
+    except Exception as e:
+        print(f"stat_rollups / task_code_sequences 表结构检查失败: {e}")
+
+
+@app.on_event("startup")
+def build_suggest_index():
+    """启动时全量构建搜索联想索引"""
+    db = SessionLocal()
+    try:
+        name_index.rebuild(db)
+        print(f"搜索联想索引构建完成: {name_index.stats()}")
+    except Exception as e:
+        print(f"搜索联想索引构建失败: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def start_audit_log_writer():
+    await audit_log.start()
+
+
+@app.on_event("shutdown")
+async def stop_audit_log_writer():
+    """停止前把队列中的操作日志写完"""
+    await audit_log.stop()
+
+
+async def _operation_log_maintenance_loop():
+    interval = LOG_RETENTION_CONFIG["maintenance_interval_hours"] * 3600
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            result = await loop.run_in_executor(None, run_maintenance)
+            if result:
+                print(f"操作日志分区维护完成: {result}")
+        except Exception as e:
+            print(f"操作日志分区维护失败: {e}")
+        await asyncio.sleep(interval)
+
+
+@app.on_event("startup")
+async def start_operation_log_maintenance():
+    """定期创建未来分区并归档超出保留期的操作日志；需在配置中开启 auto_maintenance"""
+    if LOG_RETENTION_CONFIG["auto_maintenance"]:
+        asyncio.create_task(_operation_log_maintenance_loop())
+
+
+@app.on_event("startup")
+async def start_metrics_sampler():
+    try:
+        ensure_monitoring_schema()
+    except Exception as e:
+        print(f"system_monitoring 表结构检查失败: {e}")
+    await sampler.start()
+
+
+@app.on_event("shutdown")
+async def stop_metrics_sampler():
+    await sampler.stop()
+
+
+async def _rollup_reconcile_loop():
+    interval = rollups.ROLLUP_CONFIG["reconcile_interval_minutes"] * 60
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            result = await loop.run_in_executor(None, rollups.run_reconcile)
+            if result is not None:
+                print(f"统计汇总校正完成: {result} 行")
+        except Exception as e:
+            print(f"统计汇总校正失败: {e}")
+        await asyncio.sleep(interval)
+
+
+@app.on_event("startup")
+async def start_rollup_reconcile():
+    """定期用源表校正最近几天的小时/天汇总"""
+    asyncio.create_task(_rollup_reconcile_loop())
+
+
+@app.on_event("startup")
+async def start_analytics():
+    try:
+        ensure_analytics_schema()
+        await analytics.start()
+    except Exception as e:
+        print(f"浏览/收藏统计启动失败: {e}")
+
+
+@app.on_event("shutdown")
+async def stop_analytics():
+    await analytics.stop()
+
+
+@app.on_event("startup")
+async def start_bulk_jobs():
+    """后台批量作业处理（包括继续处理上次未完成的作业）"""
+    try:
+        ensure_jobs_schema()
+    except Exception as e:
+        print(f"bulk_jobs 表结构检查失败: {e}")
+    await jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_bulk_jobs():
+    await jobs.stop()
+
 
 # 工具函数
 def wgs84_to_gcj02(lng: float, lat: float):
@@ -63,11 +222,14 @@ async def get_current_user(token: str = Query(...), db: Session = Depends(get_db
     if not token:
         raise HTTPException(status_code=401, detail="未授权")
 
-    # 实际应用中应该验证token的有效性
-    # 这里简化处理：根据用户token查询用户（需要完善token验证逻辑）
-    user = db.query(User).filter(User.user_id == 1).first()  # 临时方案
+    # 令牌签名与有效期只做CPU校验；用户对象和令牌版本来自身份缓存
+    claims = verify_token(token, "user")
+    if claims is None:
+        raise HTTPException(status_code=401, detail="用户不存在或token无效")
+
+    user = get_user(db, claims["uid"])
 
-    if not user:
+    if not user or not user.status or (user.token_version or 0) != claims["ver"]:
         raise HTTPException(status_code=401, detail="用户不存在或token无效")
 
     return user
@@ -78,13 +240,19 @@ async def get_current_user(token: str = Query(...), db: Session = Depends(get_db
 async def login(request: LoginRequest, db: Session = Depends(get_db)):
     user = db.query(User).filter(
         User.username == request.username,
-        User.password == request.password,
         User.status == True
     ).first()
 
+    # 密码校验在独立线程池中进行，不阻塞事件循环
+    if not await verify_password(request.password, user.password if user else None):
+        user = None
+
     if user:
+        if needs_rehash(user.password):
+            user.password = await hash_password(request.password)
         user.last_login_time = datetime.now()
         db.commit()
+        invalidate_user(user.user_id)
 
         user_info = UserInfo(
             userId=user.user_id,
@@ -93,7 +261,7 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
             phone=user.phone or "",
             permission=user.permission,
             role=user.role,
-            token=generate_guid()
+            token=issue_token("user", user.user_id, user.role, user.token_version)
         )
         return LoginResponse(data=user_info)
     else:
@@ -103,93 +271,107 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
 # ========== 用户退出接口 ==========
 @app.post("/api/users/logout", response_model=BaseResponse)
 async def logout(
+        token: str = Query(...),
         current_user: User = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
+    # 吊销当前令牌
+    revoke(verify_token(token, "user"))
+
     # 记录操作日志
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="用户退出",
         target=current_user.username,
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details="用户安全退出系统"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(msg="退出成功")
 
 
 # ========== 全景系统接口 ==========
+# 地点列表和全景图列表不分页、所有人看到的都一样，整段响应体（含各编码的压缩结果）缓存起来；
+# 本进程内地点、全景图、预览图的写入提交后立即清空。其他进程（多 worker、作业进程）的写入
+# 无法通知到这里，有效期取 5 秒，与仪表盘快照相同
+PANORAMA_LIST_CACHE_TTL = 5
+panorama_list_cache = TTLCache("panorama_lists", ttl=PANORAMA_LIST_CACHE_TTL, maxsize=2)
+invalidate_on_commit(SessionLocal, (Location, Panorama, PanoramaPreviewImages), panorama_list_cache)
+
+
 @app.get("/api/panorama/locations", response_model=BaseResponse)
 async def get_locations(
+        request: Request,
         db: Session = Depends(get_db)
 ):
     """
     获取所有地点列表（修改为包含全景图和预览图）
     """
     try:
-        locations_data = db.query(Location).all()
-
-        locations = []
-        for loc in locations_data:
-            location_info = {
-                "id": loc.location_id,
-                "name": loc.name,
-                "longitude": loc.longitude,
-                "latitude": loc.latitude,
-                "rating": float(loc.rating) if loc.rating else None,
-                "category": loc.category,
-                "description": loc.description,
-                "address": loc.address
-            }
-
-            # 如果有全景图关联
-            if loc.panorama_id:
-                panorama = db.query(Panorama).filter(
-                    Panorama.panorama_id == loc.panorama_id
-                ).first()
-
-                if panorama:
-                    # 获取全景图和缩略图URL
-                    panorama_image_url = f"/api/images/{panorama.panorama_image_id}"
-                    thumbnail_url = f"/api/images/{panorama.thumbnail_image_id}"
-
-                    location_info["panorama"] = {
-                        "id": panorama.panorama_id,
-                        "panorama_image": panorama_image_url,
-                        "thumbnail": thumbnail_url,
-                        "description": panorama.description,
-                        "shoot_time": panorama.shoot_time.strftime(
-                            "%Y-%m-%d %H:%M:%S") if panorama.shoot_time else None,
-                        "longitude": float(panorama.longitude) if panorama.longitude else None,
-                        "latitude": float(panorama.latitude) if panorama.latitude else None,
-                        "status": panorama.status
-                    }
-
-                    # 获取预览图
-                    preview_images = db.query(PanoramaPreviewImages, ImageStorage).join(
-                        ImageStorage,
-                        PanoramaPreviewImages.preview_image_id == ImageStorage.image_id
-                    ).filter(
-                        PanoramaPreviewImages.panorama_id == panorama.panorama_id
-                    ).order_by(PanoramaPreviewImages.sort_order).all()
-
-                    preview_urls = []
-                    for preview, image_storage in preview_images:
-                        preview_urls.append(f"/api/images/{image_storage.image_id}")
-
-                    location_info["preview_images"] = preview_urls
-
-            locations.append(location_info)
-
-        return BaseResponse(data=locations)
+        return cached_response(panorama_list_cache, "locations", request.headers.get("accept-encoding"),
+                               lambda: build_locations_body(db))
     except Exception as e:
         return BaseResponse(code="500", msg=f"获取地点列表失败: {str(e)}")
 
 
+def build_locations_body(db: Session) -> bytes:
+    locations_data = db.query(Location).all()
+
+    locations = []
+    for loc in locations_data:
+        location_info = {
+            "id": loc.location_id,
+            "name": loc.name,
+            "longitude": loc.longitude,
+            "latitude": loc.latitude,
+            "rating": float(loc.rating) if loc.rating else None,
+            "category": loc.category,
+            "description": loc.description,
+            "address": loc.address
+        }
+
+        # 如果有全景图关联
+        if loc.panorama_id:
+            panorama = db.query(Panorama).filter(
+                Panorama.panorama_id == loc.panorama_id
+            ).first()
+
+            if panorama:
+                # 获取全景图和缩略图URL
+                panorama_image_url = f"/api/images/{panorama.panorama_image_id}"
+                thumbnail_url = f"/api/images/{panorama.thumbnail_image_id}"
+
+                location_info["panorama"] = {
+                    "id": panorama.panorama_id,
+                    "panorama_image": panorama_image_url,
+                    "thumbnail": thumbnail_url,
+                    "description": panorama.description,
+                    "shoot_time": panorama.shoot_time,
+                    "longitude": float(panorama.longitude) if panorama.longitude else None,
+                    "latitude": float(panorama.latitude) if panorama.latitude else None,
+                    "status": panorama.status
+                }
+
+                # 获取预览图
+                preview_images = db.query(PanoramaPreviewImages, ImageStorage).join(
+                    ImageStorage,
+                    PanoramaPreviewImages.preview_image_id == ImageStorage.image_id
+                ).filter(
+                    PanoramaPreviewImages.panorama_id == panorama.panorama_id
+                ).order_by(PanoramaPreviewImages.sort_order).all()
+
+                preview_urls = []
+                for preview, image_storage in preview_images:
+                    preview_urls.append(f"/api/images/{image_storage.image_id}")
+
+                location_info["preview_images"] = preview_urls
+
+        locations.append(location_info)
+
+    return trusted_response(locations).body
+
+
 @app.post("/api/panorama/locations", response_model=BaseResponse)
 async def create_location(
         request: LocationCreate,
@@ -240,6 +422,7 @@ async def create_location(
         db.add(location)
         db.commit()
         db.refresh(location)
+        name_index.upsert_location(location)
 
         # 关联预览图（如果提供了）
         if request.preview_image_ids and panorama_id:
@@ -259,17 +442,14 @@ async def create_location(
             db.commit()
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="创建地点",
             target=request.name,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"创建新地点: {request.name}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="地点创建成功",
@@ -362,19 +542,17 @@ async def update_location(
                     db.add(panorama_preview)
 
         db.commit()
+        name_index.upsert_location(location)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="更新地点",
             target=location.name,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"更新地点信息: {location.name}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="地点更新成功", data={"id": location_id})
     except Exception as e:
@@ -408,19 +586,17 @@ async def delete_location(
         # 删除地点（会自动解除外键关联）
         db.delete(location)
         db.commit()
+        name_index.remove_location(location_id)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="地点删除",
             target=f"地点: {location_name}",
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"删除地点 '{location_name}'，解除与全景图 {panorama_id} 的关联" if panorama_id else f"删除地点 '{location_name}'"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="地点删除成功",
@@ -531,17 +707,14 @@ async def attach_panorama_to_location(
         db.commit()
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="关联全景图",
             target=location.name,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"为地点 '{location.name}' 关联全景图 {panorama_id}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="全景图关联成功",
@@ -588,17 +761,14 @@ async def detach_panorama_from_location(
         db.commit()
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="解除全景图关联",
             target=location.name,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"解除地点 '{location.name}' 与全景图 {panorama_id} 的关联"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="全景图关联已解除",
@@ -613,8 +783,13 @@ async def detach_panorama_from_location(
 
 
 @app.get("/api/panorama/panoramas", response_model=BaseResponse)
-async def get_panoramas(db: Session = Depends(get_db)):
+async def get_panoramas(request: Request, db: Session = Depends(get_db)):
     """获取所有全景图（包括关联信息）"""
+    return cached_response(panorama_list_cache, "panoramas", request.headers.get("accept-encoding"),
+                           lambda: build_panoramas_body(db))
+
+
+def build_panoramas_body(db: Session) -> bytes:
     panoramas_data = db.query(Panorama).all()
 
     panoramas = []
@@ -645,7 +820,7 @@ async def get_panoramas(db: Session = Depends(get_db)):
             "panoramaImage": panorama_image_url,
             "thumbnail": thumbnail_url,
             "description": panorama.description,
-            "timestamp": panorama.shoot_time.strftime("%Y-%m-%d %H:%M:%S") if panorama.shoot_time else None,
+            "timestamp": panorama.shoot_time,
             "longitude": gcj_lng,
             "latitude": gcj_lat,
             "status": panorama.status,
@@ -653,12 +828,12 @@ async def get_panoramas(db: Session = Depends(get_db)):
             "is_used": location is not None,
             "location_id": location.location_id if location else None,
             "location_name": location.name if location else None,
-            "created_at": panorama.created_at.strftime("%Y-%m-%d %H:%M:%S") if panorama.created_at else None
+            "created_at": panorama.created_at
         }
 
         panoramas.append(panorama_info)
 
-    return BaseResponse(data=panoramas)
+    return trusted_response(panoramas).body
 
 
 @app.get("/api/panorama/timemachine/{location_id}", response_model=BaseResponse)
@@ -701,6 +876,20 @@ async def get_timemachine_data(location_id: int, db: Session = Depends(get_db)):
     return BaseResponse(data=result)
 
 
+# ========== 搜索联想接口 ==========
+@app.get("/api/suggest", response_model=BaseResponse)
+async def suggest(
+        q: str = Query(..., min_length=1, description="输入前缀（支持拼音和首字母）"),
+        limit: int = Query(10, ge=1, le=50),
+        types: Optional[str] = Query(None, description="类型筛选，逗号分隔: location,shop,province,city,district")
+):
+    """
+    地图搜索框联想（内存前缀索引，不访问数据库）
+    """
+    type_set = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    return BaseResponse(data=name_index.search(q, limit, type_set))
+
+
 # ========== 管理员端接口 ==========
 @app.get("/api/manager/dashboard/stats", response_model=BaseResponse)
 async def get_dashboard_stats(
@@ -726,6 +915,8 @@ async def get_dashboard_stats(
     locations_with_panorama = db.query(Location).filter(Location.panorama_id.isnot(None)).count()
     total_locations = db.query(Location).count()
 
+    health = sampler.latest()
+
     stats = {
         "totalPanoramas": total_panoramas,
         "pendingReview": pending_review,
@@ -735,9 +926,9 @@ async def get_dashboard_stats(
         "locationsWithPanorama": locations_with_panorama,
         "totalLocations": total_locations,
         "systemHealth": {
-            "cpu": round(random.uniform(20, 80), 1),
-            "memory": round(random.uniform(40, 90), 1),
-            "disk": round(random.uniform(60, 95), 1)
+            "cpu": health["cpu"],
+            "memory": health["memory"],
+            "disk": health["disk"]
         }
     }
     return BaseResponse(data=stats)
@@ -752,18 +943,7 @@ async def get_data_list(
         current_user: User = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
-    query = db.query(Panorama)
-
-    if status != "all":
-        query = query.filter(Panorama.status == status)
-
-    if keyword:
-        query = query.filter(
-            or_(
-                Panorama.panorama_id.like(f"%{keyword}%"),
-                Panorama.description.like(f"%{keyword}%")
-            )
-        )
+    query = db.query(Panorama).filter(*panorama_conditions(status, keyword))
 
     total = query.count()
     data_items = query.offset((page - 1) * pageSize).limit(pageSize).all()
@@ -862,17 +1042,14 @@ async def review_data(
     panorama.status = new_status
     db.commit()
 
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="数据审核",
         target=f"全景图数据{data_id}",
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details=f"审核操作: {request.action}, 备注: {request.comment}"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(
         msg="审核通过" if request.action == "approve" else "审核拒绝",
@@ -909,17 +1086,14 @@ async def delete_data(
         db.delete(panorama)
         db.commit()
 
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="数据删除",
             target=f"全景图数据{data_id}",
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details="删除全景图数据及相关关联数据"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="删除成功", data={"id": data_id})
 
@@ -970,10 +1144,14 @@ async def update_user(
         raise HTTPException(status_code=404, detail="用户不存在")
 
     update_data = request.model_dump(exclude_unset=True)
+    if any(getattr(user, field) != value for field, value in update_data.items()):
+        # 角色或状态变化后，已签发的令牌全部失效
+        user.token_version = (user.token_version or 0) + 1
     for field, value in update_data.items():
         setattr(user, field, value)
 
     db.commit()
+    invalidate_user(user_id)
 
     return BaseResponse(msg="更新成功", data={"id": user_id, **request.model_dump()})
 
@@ -984,33 +1162,72 @@ async def get_performance_data(
         current_user: User = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
-    data = []
+    """
+    性能监控数据（来自采样器写入 system_monitoring 的分钟/小时/天级汇总）
+    """
     now = datetime.now()
 
     if timeRange == "1h":
-        points = 60
-        interval = timedelta(minutes=1)
+        granularity, since = "minute", now - timedelta(hours=1)
     elif timeRange == "today":
-        points = 24
-        interval = timedelta(hours=1)
+        granularity, since = "hour", now - timedelta(hours=24)
     else:
-        points = 7
-        interval = timedelta(days=1)
+        granularity, since = "day", now - timedelta(days=7)
 
-    for i in range(points):
-        time_point = now - (points - 1 - i) * interval
+    data = []
+    for row in query_rollups(db, granularity, since):
         data.append({
-            "time": time_point.isoformat(),
-            "cpu": round(random.uniform(20, 80), 1),
-            "memory": round(random.uniform(40, 90), 1),
-            "disk": round(random.uniform(60, 95), 1),
-            "diskIOPS": random.randint(100, 1000),
-            "apiResponseTime": round(random.uniform(50, 500), 1)
+            "time": row.recorded_at.isoformat(),
+            "cpu": round(row.cpu_usage, 1),
+            "memory": round(row.memory_usage, 1),
+            "disk": round(row.disk_usage, 1),
+            "diskIOPS": row.disk_iops,
+            "processRss": round(row.process_rss_mb, 1) if row.process_rss_mb is not None else None,
+            "apiResponseTime": round(row.api_response_time, 1)
         })
 
     return BaseResponse(data=data)
 
 
+@app.get("/api/manager/monitor/performance/routes", response_model=BaseResponse)
+async def get_route_performance(
+        current_user: User = Depends(get_current_user)
+):
+    """
+    各接口的请求数、平均耗时及 p50/p95/p99（毫秒），自进程启动起累计
+    """
+    return BaseResponse(data={
+        "inFlight": request_metrics.in_flight,
+        "routes": request_metrics.summary()
+    })
+
+
+@app.get("/api/manager/monitor/sql", response_model=BaseResponse)
+async def get_sql_profile(
+        current_user: User = Depends(get_current_user)
+):
+    """
+    各接口的平均查询数、数据库耗时、返回行数，以及最近的 N+1 模式和慢查询
+    """
+    return BaseResponse(data=sql_profiler.summary())
+
+
+@app.get("/api/manager/monitor/cache", response_model=BaseResponse)
+async def get_cache_stats(
+        current_user: User = Depends(get_current_user)
+):
+    """
+    进程内各缓存的条目数与命中率
+    """
+    return BaseResponse(data=cache_stats())
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 抓取接口"""
+    return PlainTextResponse(request_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/manager/monitor/services", response_model=BaseResponse)
 async def get_service_status(
         current_user: User = Depends(get_current_user),
@@ -1037,20 +1254,21 @@ async def get_operation_logs(
         pageSize: int = Query(10, ge=1),
         operator: str = Query(None),
         actionType: str = Query(None),
+        startDate: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD"),
+        endDate: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含当天）"),
         current_user: User = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
-    query = db.query(OperationLog)
+    try:
+        start_dt, end_dt = parse_date_range(startDate, endDate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
 
-    if operator:
-        query = query.filter(OperationLog.operator.contains(operator))
-    if actionType:
-        query = query.filter(OperationLog.action == actionType)
+    query = db.query(OperationLog).filter(*log_conditions(operator, actionType, start_dt, end_dt))
 
+    offset = (page - 1) * pageSize
     total = query.count()
-    logs = query.order_by(OperationLog.operation_time.desc()).offset(
-        (page - 1) * pageSize
-    ).limit(pageSize).all()
+    logs = query.order_by(OperationLog.operation_time.desc()).offset(offset).limit(pageSize).all()
 
     log_list = []
     for log in logs:
@@ -1064,6 +1282,25 @@ async def get_operation_logs(
             "result": log.result
         })
 
+    # 指定了开始日期时，超出在线保留期的部分从归档段读取（归档数据都早于在线数据）；
+    # 读 gzip 段是阻塞 IO，放到线程池执行
+    if start_dt:
+        archived_total, archived_logs = await asyncio.get_running_loop().run_in_executor(
+            None, query_archived_logs, start_dt, end_dt, operator, actionType,
+            max(offset - total, 0), pageSize - len(log_list)
+        )
+        for item in archived_logs:
+            log_list.append({
+                "id": item["log_id"],
+                "operator": item["operator"],
+                "action": item["action"],
+                "target": item["target"],
+                "time": item["operation_time"],
+                "ip": item["ip_address"],
+                "result": item["result"]
+            })
+        total += archived_total
+
     return LogListResponse(data={
         "list": log_list,
         "total": total,
@@ -1081,46 +1318,20 @@ async def batch_operation(
 ):
     if not request.data_ids:
         raise HTTPException(status_code=400, detail="请选择要操作的数据")
+    if request.action not in PANORAMA_ACTIONS:
+        raise HTTPException(status_code=400, detail="不支持的操作类型")
 
-    success_count = 0
-    failed_count = 0
-
-    for data_id in request.data_ids:
-        try:
-            panorama = db.query(Panorama).filter(Panorama.panorama_id == data_id).first()
-            if panorama:
-                if request.action == "delete":
-                    # 检查是否被地点使用
-                    location = db.query(Location).filter(Location.panorama_id == data_id).first()
-                    if location:
-                        location.panorama_id = None
-                    db.delete(panorama)
-                elif request.action == "publish":
-                    panorama.status = "published"
-                db.commit()
-                success_count += 1
-
-                # 记录操作日志
-                log = OperationLog(
-                    operator=current_user.username,
-                    action=f"批量{request.action}",
-                    target=f"全景图数据{data_id}",
-                    operation_time=datetime.now(),
-                    ip_address="192.168.1.1",
-                    result="成功",
-                    details=f"批量操作: {request.action}"
-                )
-                db.add(log)
-
-        except Exception as e:
-            failed_count += 1
-            print(f"操作数据 {data_id} 失败: {e}")
-
-    db.commit()
+    try:
+        results = batch_panoramas(db, request.action, request.data_ids, current_user.username)
+    except Exception as e:
+        print(f"批量操作失败: {e}")
+        return BaseResponse(code="500", msg=f"批量操作失败: {str(e)}")
 
+    success_count = sum(1 for r in results if r["success"])
+    failed_count = len(results) - success_count
     return BaseResponse(
         msg=f"批量操作完成，成功: {success_count}，失败: {failed_count}",
-        data={"success": success_count, "failed": failed_count}
+        data={"success": success_count, "failed": failed_count, "results": results}
     )
 
 
@@ -1226,19 +1437,18 @@ async def upload_panorama_data(
             location.panorama_id = panorama.panorama_id
 
         db.commit()
+        if location_name and not location_id:
+            name_index.upsert_location(location)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="数据上传",
             target=f"全景图数据{panorama.panorama_id}",
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details="上传新的全景图数据"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="数据上传成功，等待审核",
@@ -1277,17 +1487,14 @@ async def update_panorama_data(
     db.commit()
 
     # 记录操作日志
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="数据编辑",
         target=f"全景图数据{data_id}",
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details="编辑全景图数据信息"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(msg="数据更新成功", data={"id": data_id})
 
@@ -1310,7 +1517,7 @@ async def create_user(
     # 创建新用户
     user = User(
         username=request.username,
-        password=request.password,  # 实际应用中应该加密
+        password=await hash_password(request.password),
         email=request.email,
         phone=request.phone,
         role=request.role,
@@ -1322,17 +1529,14 @@ async def create_user(
     db.commit()
 
     # 记录操作日志
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="用户创建",
         target=request.username,
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details=f"创建新用户，角色: {request.role}"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(msg="用户创建成功", data={"id": user.user_id})
 
@@ -1354,19 +1558,17 @@ async def delete_user(
     username = user.username
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
 
     # 记录操作日志
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="用户删除",
         target=username,
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details="删除用户账户"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(msg="用户删除成功", data={"id": user_id})
 
@@ -1382,26 +1584,91 @@ async def update_user_permissions(
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
 
+    if user.role != request.role:
+        user.token_version = (user.token_version or 0) + 1
     user.role = request.role
     # 这里可以添加更细粒度的权限控制字段
     db.commit()
+    invalidate_user(user_id)
 
     # 记录操作日志
-    log = OperationLog(
+    audit_log.record(
         operator=current_user.username,
         action="权限修改",
         target=user.username,
-        operation_time=datetime.now(),
         ip_address="192.168.1.1",
         result="成功",
         details=f"修改用户权限，新角色: {request.role}"
     )
-    db.add(log)
-    db.commit()
 
     return BaseResponse(msg="权限更新成功", data={"id": user_id})
 
 
+# ========== 批量作业接口 ==========
+@app.post("/api/jobs", response_model=BaseResponse)
+async def submit_job(
+        request: JobSubmitRequest,
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """提交后台批量作业，立即返回作业ID"""
+    spec = jobs.handlers.get(request.job_type)
+    if spec is not None and spec["admin_only"] and current_user.role not in ['admin']:
+        return BaseResponse(code="403", msg="权限不足")
+    try:
+        job = jobs.submit(db, request.job_type, request.items, request.params, current_user.username)
+    except ValueError as e:
+        return BaseResponse(code="400", msg=str(e))
+    except Exception as e:
+        db.rollback()
+        return BaseResponse(code="500", msg=f"提交作业失败: {str(e)}")
+
+    audit_log.record(
+        operator=current_user.username,
+        action="提交批量作业",
+        target=f"作业{job.job_id}",
+        ip_address="192.168.1.1",
+        result="成功",
+        details=f"作业类型: {job.job_type}, 条目数: {job.total}"
+    )
+    return BaseResponse(msg="作业已提交", data=jobs.describe(job, with_results=False))
+
+
+@app.get("/api/jobs/{job_id}", response_model=BaseResponse)
+async def get_job(
+        job_id: int,
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """作业进度、预计剩余时间和失败条目；只有提交人和管理员可以查看"""
+    job = db.get(BulkJob, job_id)
+    if not job:
+        return BaseResponse(code="404", msg="作业不存在")
+    if job.created_by != current_user.username and current_user.role not in ['admin']:
+        return BaseResponse(code="403", msg="权限不足")
+    return BaseResponse(data=jobs.describe(job))
+
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=BaseResponse)
+async def cancel_job(
+        job_id: int,
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    job = db.get(BulkJob, job_id)
+    if not job:
+        return BaseResponse(code="404", msg="作业不存在")
+    if job.created_by != current_user.username and current_user.role not in ['admin']:
+        return BaseResponse(code="403", msg="权限不足")
+    try:
+        job = jobs.cancel(db, job)
+    except Exception as e:
+        db.rollback()
+        return BaseResponse(code="500", msg=f"取消作业失败: {str(e)}")
+    return BaseResponse(msg="已取消" if job.status == "cancelled" else "作业将在当前批次处理完后停止",
+                        data=jobs.describe(job, with_results=False))
+
+
 # ========== 图片管理接口 ==========
 @app.post("/api/images/upload", response_model=ImageUploadResponse)
 async def upload_image(
@@ -1425,12 +1692,7 @@ async def upload_image(
 
         # 如果是缩略图，自动生成缩略版本
         if image_type == 'thumbnail':
-            # 使用PIL生成缩略图
-            image = Image.open(BytesIO(file_data))
-            image.thumbnail((200, 200))
-            thumb_io = BytesIO()
-            image.save(thumb_io, format='JPEG')
-            file_data = thumb_io.getvalue()
+            file_data = make_thumbnail(file_data)
             file_size = len(file_data)
 
         # 保存到数据库
@@ -1448,17 +1710,14 @@ async def upload_image(
         db.refresh(image_storage)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="图片上传",
             target=file.filename,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"上传{image_type}类型图片，大小: {file_size}字节"
         )
-        db.add(log)
-        db.commit()
 
         image_info = ImageInfo(
             imageId=image_storage.image_id,
@@ -1828,30 +2087,25 @@ async def get_timemachine_previews(
 
 # ========== 新增收藏/浏览统计接口 ==========
 
+@app.post("/api/analytics/events", response_model=BaseResponse)
+async def ingest_analytics_events(request: AnalyticsEventBatch):
+    """
+    上报浏览/收藏事件（支持批量），只在内存中计数，由后台任务定期写库
+    """
+    accepted, rejected = analytics.ingest(request.events)
+    return BaseResponse(data={"accepted": accepted, "rejected": rejected})
+
+
 @app.get("/api/shop/analytics/stats", response_model=BaseResponse)
 async def get_analytics_stats(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        targetType: Optional[str] = Query(None),
+        current_user: User = Depends(get_current_user)
 ):
     """
     获取收藏和浏览的统计数据
     """
     try:
-        # 模拟数据，实际项目中应该从数据库统计
-        import random
-        from datetime import datetime, timedelta
-
-        # 生成模拟数据
-        stats = {
-            "favoriteTotal": random.randint(1000, 5000),
-            "favoritesToday": random.randint(10, 100),
-            "viewsTotal": random.randint(5000, 20000),
-            "viewsToday": random.randint(100, 500),
-            "weeklyFavorites": [random.randint(5, 50) for _ in range(7)],
-            "weeklyViews": [random.randint(50, 200) for _ in range(7)]
-        }
-
-        return BaseResponse(data=stats)
+        return BaseResponse(data=analytics.stats(targetType))
     except Exception as e:
         return BaseResponse(code="500", msg=f"获取统计数据失败: {str(e)}")
 
@@ -1859,63 +2113,16 @@ async def get_analytics_stats(
 @app.get("/api/shop/analytics/trends", response_model=BaseResponse)
 async def get_analytics_trends(
         timeRange: str = Query("today"),
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        targetType: Optional[str] = Query(None),
+        current_user: User = Depends(get_current_user)
 ):
     """
     获取收藏和浏览趋势数据
     """
     try:
-        import random
-        from datetime import datetime, timedelta
-
-        # 根据时间范围生成数据
-        if timeRange == "today":
-            points = 24  # 24小时
-            data = []
-            for i in range(points):
-                hour = (datetime.now() - timedelta(hours=23 - i)).strftime("%H:00")
-                data.append({
-                    "time": hour,
-                    "favorites": random.randint(0, 20),
-                    "views": random.randint(0, 100)
-                })
-        elif timeRange == "7d":
-            points = 7  # 7天
-            data = []
-            for i in range(points):
-                date = (datetime.now() - timedelta(days=6 - i)).strftime("%m-%d")
-                data.append({
-                    "date": date,
-                    "favorites": random.randint(10, 50),
-                    "views": random.randint(50, 200)
-                })
-        elif timeRange == "30d":
-            points = 30  # 30天
-            data = []
-            for i in range(points):
-                date = (datetime.now() - timedelta(days=29 - i)).strftime("%m-%d")
-                data.append({
-                    "date": date,
-                    "favorites": random.randint(5, 30),
-                    "views": random.randint(30, 150)
-                })
-        else:
-            data = []
-
-        return BaseResponse(data=data)
+        return BaseResponse(data=analytics.trends(timeRange, targetType))
     except Exception as e:
-        # 返回模拟数据作为备选
-        mock_data = [
-            {"date": "01-10", "favorites": 12, "views": 85},
-            {"date": "01-11", "favorites": 8, "views": 92},
-            {"date": "01-12", "favorites": 15, "views": 120},
-            {"date": "01-13", "favorites": 20, "views": 150},
-            {"date": "01-14", "favorites": 18, "views": 135},
-            {"date": "01-15", "favorites": 25, "views": 180},
-            {"date": "01-16", "favorites": 22, "views": 165}
-        ]
-        return BaseResponse(data=mock_data)
+        return BaseResponse(code="500", msg=f"获取趋势数据失败: {str(e)}")
 
 
 # ========== 商铺管理接口 ==========
@@ -2030,19 +2237,17 @@ async def create_shop(
         db.add(shop)
         db.commit()
         db.refresh(shop)
+        name_index.upsert_shop(shop)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="商铺创建",
             target=shop.username,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"创建新商铺，类型: {shop.role}，规模: {shop.size}，审核状态: 待审核"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="商铺创建成功，等待审核", data={"id": shop.shop_id})
     except Exception as e:
@@ -2073,19 +2278,17 @@ async def update_shop(
 
         shop.updated_at = datetime.now()
         db.commit()
+        name_index.upsert_shop(shop)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="商铺更新",
             target=shop.username,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"更新商铺信息，规模: {shop.size}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="商铺更新成功")
     except Exception as e:
@@ -2111,19 +2314,17 @@ async def update_shop_status(
         shop.status = status
         shop.updated_at = datetime.now()
         db.commit()
+        name_index.upsert_shop(shop)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="商铺状态修改",
             target=shop.username,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"将商铺状态修改为: {'显示' if status else '隐藏'}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg=f"商铺已{'显示' if status else '隐藏'}")
     except Exception as e:
@@ -2148,19 +2349,17 @@ async def delete_shop(
         shop_name = shop.username
         db.delete(shop)
         db.commit()
+        name_index.remove_shop(shop_id)
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="商铺删除",
             target=shop_name,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details="删除商铺"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="商铺删除成功")
     except Exception as e:
@@ -2170,27 +2369,13 @@ async def delete_shop(
 
 @app.get("/api/shop/analytics/stats", response_model=BaseResponse)
 async def get_shop_analytics_stats(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: User = Depends(get_current_user)
 ):
     """
     获取商铺统计数据（收藏和浏览）
     """
     try:
-        import random
-        from datetime import datetime, timedelta
-
-        # 生成模拟数据
-        stats = {
-            "favoriteTotal": random.randint(1000, 5000),
-            "favoritesToday": random.randint(10, 100),
-            "viewsTotal": random.randint(5000, 20000),
-            "viewsToday": random.randint(100, 500),
-            "weeklyFavorites": [random.randint(5, 50) for _ in range(7)],
-            "weeklyViews": [random.randint(50, 200) for _ in range(7)]
-        }
-
-        return BaseResponse(data=stats)
+        return BaseResponse(data=analytics.stats("shop"))
     except Exception as e:
         # 如果出错，返回默认数据
         return BaseResponse(data={
@@ -2253,10 +2438,13 @@ async def get_current_gov_user(token: str = Query(...), db: Session = Depends(ge
     if not token:
         raise HTTPException(status_code=401, detail="未授权")
 
-    # 简化处理，实际应该验证token
-    user = db.query(GovernmentUser).filter(GovernmentUser.gov_user_id == 1).first()  # 临时方案
+    claims = verify_token(token, "gov")
+    if claims is None:
+        raise HTTPException(status_code=401, detail="用户不存在或token无效")
 
-    if not user:
+    user = get_gov_user(db, claims["uid"])
+
+    if not user or not user.status or (user.token_version or 0) != claims["ver"]:
         raise HTTPException(status_code=401, detail="用户不存在或token无效")
 
     return user
@@ -2267,13 +2455,18 @@ async def government_login(request: GovernmentLoginRequest, db: Session = Depend
     """政府执法人员登录"""
     user = db.query(GovernmentUser).filter(
         GovernmentUser.username == request.username,
-        GovernmentUser.password == request.password,
         GovernmentUser.status == True
     ).first()
 
+    if not await verify_password(request.password, user.password if user else None):
+        user = None
+
     if user:
+        if needs_rehash(user.password):
+            user.password = await hash_password(request.password)
         user.last_login_time = datetime.now()
         db.commit()
+        invalidate_gov_user(user.gov_user_id)
 
         user_info = GovernmentUserInfo(
             userId=user.gov_user_id,
@@ -2284,17 +2477,67 @@ async def government_login(request: GovernmentLoginRequest, db: Session = Depend
             position=user.position or "",
             role=user.role,
             permissions=user.permissions,
-            token=generate_guid()
+            token=issue_token("gov", user.gov_user_id, user.role, user.token_version)
         )
         return GovernmentLoginResponse(data=user_info)
     else:
         return GovernmentLoginResponse(code="400", msg="用户名或密码错误", data=None)
 
 
+@app.post("/api/government/logout", response_model=BaseResponse)
+async def government_logout(
+        token: str = Query(...),
+        current_user: GovernmentUser = Depends(get_current_gov_user)
+):
+    """政府执法人员退出登录（吊销当前令牌）"""
+    revoke(verify_token(token, "gov"))
+    return BaseResponse(msg="退出成功")
+
+
+# 政府端全景列表的字段；地图标点用 marker，列表卡片用 card
+_panorama_location_id = Location.location_id.label("location_id")
+_panorama_location_name = Location.name.label("location_name")
+_panorama_location_address = Location.address.label("location_address")
+
+GOV_PANORAMA_FIELDS = FieldSet({
+    "id": Field([Panorama.panorama_id]),
+    "panorama_image": Field([Panorama.panorama_image_id],
+                            lambda row, ctx: f"/api/images/{row.panorama_image_id}"),
+    "thumbnail": Field([Panorama.thumbnail_image_id], lambda row, ctx: f"/api/images/{row.thumbnail_image_id}"),
+    "description": Field([Panorama.description]),
+    "shoot_time": Field([Panorama.shoot_time]),
+    "longitude": Field([Panorama.longitude, Panorama.latitude],
+                       lambda row, ctx: wgs84_to_gcj02(row.longitude, row.latitude)[0]),
+    "latitude": Field([Panorama.longitude, Panorama.latitude],
+                      lambda row, ctx: wgs84_to_gcj02(row.longitude, row.latitude)[1]),
+    "original_longitude": Field([Panorama.longitude]),
+    "original_latitude": Field([Panorama.latitude]),
+    "status": Field([Panorama.status]),
+    "is_used": Field([_panorama_location_id], lambda row, ctx: row.location_id is not None, needs=["location"]),
+    "location_info": Field(
+        [_panorama_location_id, _panorama_location_name, _panorama_location_address],
+        lambda row, ctx: {
+            "id": row.location_id,
+            "name": row.location_name,
+            "address": row.location_address
+        } if row.location_id is not None else None,
+        needs=["location"]
+    ),
+    "metadata": Field([Panorama.image_metadata], lambda row, ctx: row.image_metadata or {}),
+}, profiles={
+    "marker": ("id", "longitude", "latitude", "status", "thumbnail"),
+    "card": ("id", "longitude", "latitude", "status", "thumbnail", "description", "shoot_time", "is_used",
+             "location_info"),
+})
+
+FIELDS_DESCRIPTION = "返回字段：逗号分隔的字段名或组合名（marker/card/full），默认 full"
+
+
 @app.get("/api/government/panoramas/all", response_model=BaseResponse)
 async def get_all_panoramas_gov(
         zoom_level: Optional[int] = Query(None, description="地图缩放级别"),
         bounds: Optional[str] = Query(None, description="地图边界 minLng,minLat,maxLng,maxLat"),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
         current_user: GovernmentUser = Depends(get_current_gov_user),
         db: Session = Depends(get_db)
 ):
@@ -2302,7 +2545,12 @@ async def get_all_panoramas_gov(
     政府端：获取所有全景数据（支持地图范围筛选）
     """
     try:
-        query = db.query(Panorama).filter(Panorama.status == "published")
+        selection = GOV_PANORAMA_FIELDS.select(fields)
+    except ValueError as e:
+        return BaseResponse(code="400", msg=str(e))
+
+    try:
+        query = select(*selection.columns).select_from(Panorama).where(Panorama.status == "published")
 
         # 如果提供了地图边界，进行空间筛选
         if bounds:
@@ -2310,63 +2558,37 @@ async def get_all_panoramas_gov(
                 bounds_list = [float(x.strip()) for x in bounds.split(',')]
                 if len(bounds_list) == 4:
                     min_lng, min_lat, max_lng, max_lat = bounds_list
-                    query = query.filter(
+                    query = query.where(
                         Panorama.longitude.between(min_lng, max_lng),
                         Panorama.latitude.between(min_lat, max_lat)
                     )
             except:
                 pass
 
-        panoramas_data = query.all()
+        # 地点信息用外连接一并查出，不再逐条查询
+        if "location" in selection.needs:
+            query = query.outerjoin(Location, Location.panorama_id == Panorama.panorama_id)
 
         result = []
-        for panorama in panoramas_data:
-            # 获取地点信息
-            location = db.query(Location).filter(Location.panorama_id == panorama.panorama_id).first()
-
-            # 获取图片URL
-            panorama_image_url = f"/api/images/{panorama.panorama_image_id}"
-            thumbnail_url = f"/api/images/{panorama.thumbnail_image_id}"
-
-            # 坐标转换
-            gcj_lng, gcj_lat = wgs84_to_gcj02(panorama.longitude, panorama.latitude)
-
-            panorama_info = {
-                "id": panorama.panorama_id,
-                "panorama_image": panorama_image_url,
-                "thumbnail": thumbnail_url,
-                "description": panorama.description,
-                "shoot_time": panorama.shoot_time.strftime("%Y-%m-%d %H:%M:%S") if panorama.shoot_time else None,
-                "longitude": gcj_lng,
-                "latitude": gcj_lat,
-                "original_longitude": panorama.longitude,
-                "original_latitude": panorama.latitude,
-                "status": panorama.status,
-                "is_used": location is not None,
-                "location_info": {
-                    "id": location.location_id if location else None,
-                    "name": location.name if location else None,
-                    "address": location.address if location else None
-                } if location else None,
-                "metadata": panorama.image_metadata or {}
-            }
-
-            result.append(panorama_info)
+        seen = set()
+        for row in db.execute(query):
+            # 一张全景图只取一个地点
+            if row.panorama_id in seen:
+                continue
+            seen.add(row.panorama_id)
+            result.append(selection.to_dict(row))
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="查看全景数据",
             target="所有全景图",
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"政府用户查看全景数据，数量: {len(result)}"
         )
-        db.add(log)
-        db.commit()
 
-        return BaseResponse(data=result)
+        return trusted_response(result)
     except Exception as e:
         return BaseResponse(code="500", msg=f"获取全景数据失败: {str(e)}")
 
@@ -2381,13 +2603,8 @@ async def create_law_enforcement_task(
     创建执法任务（在地图上标点发布）
     """
     try:
-        # 生成任务编号
-        today = datetime.now().strftime("%Y%m%d")
-        task_count = db.query(LawEnforcementTask).filter(
-            func.date(LawEnforcementTask.created_at) == datetime.now().date()
-        ).count() + 1
-
-        task_code = f"TASK-{today}-{str(task_count).zfill(3)}"
+        # 生成任务编号（按天序列分配，见 task_codes.py）
+        task_code = task_codes.next_code()
 
         # 解析截止时间
         deadline_dt = None
@@ -2428,19 +2645,17 @@ async def create_law_enforcement_task(
             new_status="pending"
         )
         db.add(history)
+        db.commit()
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="创建执法任务",
             target=task_code,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"创建{request.task_type}类型任务，优先级: {request.priority}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(
             msg="任务创建成功",
@@ -2455,6 +2670,54 @@ async def create_law_enforcement_task(
         return BaseResponse(code="500", msg=f"创建任务失败: {str(e)}")
 
 
+def _task_user(key, with_department):
+    def value(row, ctx):
+        user = ctx["users"].get(getattr(row, key))
+        if not user:
+            return None
+        info = {"id": user.gov_user_id, "name": user.username}
+        if with_department:
+            info["department"] = user.department
+        return info
+    return value
+
+
+# 执法任务列表的字段；指派人、创建人由接口批量加载后放在 ctx["users"]
+TASK_LIST_FIELDS = FieldSet({
+    "id": Field([LawEnforcementTask.task_id]),
+    "task_code": Field([LawEnforcementTask.task_code]),
+    "title": Field([LawEnforcementTask.title]),
+    "description": Field([LawEnforcementTask.description]),
+    "task_type": Field([LawEnforcementTask.task_type]),
+    "priority": Field([LawEnforcementTask.priority]),
+    "status": Field([LawEnforcementTask.status]),
+    "longitude": Field([LawEnforcementTask.longitude]),
+    "latitude": Field([LawEnforcementTask.latitude]),
+    "address": Field([LawEnforcementTask.address]),
+    "assigned_to": Field([LawEnforcementTask.assigned_to], _task_user("assigned_to", True), needs=["users"]),
+    "created_by": Field([LawEnforcementTask.created_by], _task_user("created_by", False), needs=["users"]),
+    "deadline": Field([LawEnforcementTask.deadline]),
+    "completion_time": Field([LawEnforcementTask.completion_time]),
+    "attachments": Field([LawEnforcementTask.attachments],
+                         lambda row, ctx: [f"/api/images/{img_id}" for img_id in row.attachments or []]),
+    "remarks": Field([LawEnforcementTask.remarks]),
+    "created_at": Field([LawEnforcementTask.created_at]),
+    "updated_at": Field([LawEnforcementTask.updated_at]),
+}, profiles={
+    "marker": ("id", "longitude", "latitude", "status", "priority", "task_type"),
+    "card": ("id", "task_code", "title", "task_type", "priority", "status", "address", "assigned_to",
+             "deadline", "created_at"),
+})
+
+
+def _load_task_users(db: Session, rows, keys):
+    """按选中的字段批量加载指派人/创建人"""
+    users = BatchLoader(db, GovernmentUser, cache=gov_user_cache)
+    for row in rows:
+        users.want(*(getattr(row, key, None) for key in keys))
+    return users
+
+
 @app.get("/api/government/tasks", response_model=BaseResponse)
 async def get_law_enforcement_tasks(
         status: Optional[str] = Query(None),
@@ -2466,6 +2729,7 @@ async def get_law_enforcement_tasks(
         keyword: Optional[str] = Query(None),
         page: int = Query(1, ge=1),
         pageSize: int = Query(10, ge=1),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
         current_user: GovernmentUser = Depends(get_current_gov_user),
         db: Session = Depends(get_db)
 ):
@@ -2473,95 +2737,32 @@ async def get_law_enforcement_tasks(
     获取执法任务列表（支持多种筛选条件）
     """
     try:
-        query = db.query(LawEnforcementTask)
+        selection = TASK_LIST_FIELDS.select(fields)
+    except ValueError as e:
+        return BaseResponse(code="400", msg=str(e))
 
-        # 应用筛选条件
-        if status:
-            query = query.filter(LawEnforcementTask.status == status)
-        if task_type:
-            query = query.filter(LawEnforcementTask.task_type == task_type)
-        if priority:
-            query = query.filter(LawEnforcementTask.priority == priority)
-        if assigned_to:
-            query = query.filter(LawEnforcementTask.assigned_to == assigned_to)
-
-        # 日期范围筛选
-        if start_date:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.filter(LawEnforcementTask.created_at >= start_dt)
-        if end_date:
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-            query = query.filter(LawEnforcementTask.created_at < end_dt)
-
-        # 关键词搜索
-        if keyword:
-            query = query.filter(
-                or_(
-                    LawEnforcementTask.title.like(f"%{keyword}%"),
-                    LawEnforcementTask.description.like(f"%{keyword}%"),
-                    LawEnforcementTask.task_code.like(f"%{keyword}%")
-                )
-            )
+    try:
+        conditions = task_conditions(status, task_type, priority, assigned_to, start_date, end_date, keyword)
 
         # 计算总数
-        total = query.count()
+        total = db.query(func.count(LawEnforcementTask.task_id)).filter(*conditions).scalar()
 
-        # 分页查询
-        tasks = query.order_by(LawEnforcementTask.created_at.desc()) \
-            .offset((page - 1) * pageSize) \
-            .limit(pageSize) \
-            .all()
+        # 分页查询，只查选中字段用到的列
+        rows = db.execute(
+            select(*selection.columns).where(*conditions)
+            .order_by(LawEnforcementTask.created_at.desc())
+            .offset((page - 1) * pageSize)
+            .limit(pageSize)
+        ).all()
 
-        result = []
-        for task in tasks:
-            # 获取指派人和创建人信息
-            assigned_user = None
-            if task.assigned_to:
-                assigned_user = db.query(GovernmentUser).filter(
-                    GovernmentUser.gov_user_id == task.assigned_to
-                ).first()
+        # 指派人和创建人一次查询加载
+        ctx = None
+        if "users" in selection.needs:
+            ctx = {"users": _load_task_users(db, rows, ("assigned_to", "created_by"))}
 
-            created_user = db.query(GovernmentUser).filter(
-                GovernmentUser.gov_user_id == task.created_by
-            ).first()
+        result = [selection.to_dict(row, ctx) for row in rows]
 
-            # 获取附件URL
-            attachment_urls = []
-            if task.attachments:
-                for img_id in task.attachments:
-                    attachment_urls.append(f"/api/images/{img_id}")
-
-            task_info = {
-                "id": task.task_id,
-                "task_code": task.task_code,
-                "title": task.title,
-                "description": task.description,
-                "task_type": task.task_type,
-                "priority": task.priority,
-                "status": task.status,
-                "longitude": task.longitude,
-                "latitude": task.latitude,
-                "address": task.address,
-                "assigned_to": {
-                    "id": assigned_user.gov_user_id if assigned_user else None,
-                    "name": assigned_user.username if assigned_user else None,
-                    "department": assigned_user.department if assigned_user else None
-                } if assigned_user else None,
-                "created_by": {
-                    "id": created_user.gov_user_id if created_user else None,
-                    "name": created_user.username if created_user else None
-                } if created_user else None,
-                "deadline": task.deadline.strftime("%Y-%m-%d %H:%M:%S") if task.deadline else None,
-                "completion_time": task.completion_time.strftime("%Y-%m-%d %H:%M:%S") if task.completion_time else None,
-                "attachments": attachment_urls,
-                "remarks": task.remarks,
-                "created_at": task.created_at.strftime("%Y-%m-%d %H:%M:%S") if task.created_at else None,
-                "updated_at": task.updated_at.strftime("%Y-%m-%d %H:%M:%S") if task.updated_at else None
-            }
-
-            result.append(task_info)
-
-        return BaseResponse(data={
+        return trusted_response({
             "list": result,
             "total": total,
             "page": page,
@@ -2571,6 +2772,37 @@ async def get_law_enforcement_tasks(
         return BaseResponse(code="500", msg=f"获取任务列表失败: {str(e)}")
 
 
+def _task_user_name(row, ctx):
+    user = ctx["users"].get(row.assigned_to)
+    return user.username if user else None
+
+
+# 地图任务点的字段（执行人只返回用户名，日期只到天）
+TASK_MAP_FIELDS = FieldSet({
+    "id": Field([LawEnforcementTask.task_id]),
+    "task_code": Field([LawEnforcementTask.task_code]),
+    "title": Field([LawEnforcementTask.title]),
+    "task_type": Field([LawEnforcementTask.task_type]),
+    "priority": Field([LawEnforcementTask.priority]),
+    "status": Field([LawEnforcementTask.status]),
+    "longitude": Field([LawEnforcementTask.longitude, LawEnforcementTask.latitude],
+                       lambda row, ctx: wgs84_to_gcj02(row.longitude, row.latitude)[0]),
+    "latitude": Field([LawEnforcementTask.longitude, LawEnforcementTask.latitude],
+                      lambda row, ctx: wgs84_to_gcj02(row.longitude, row.latitude)[1]),
+    "original_longitude": Field([LawEnforcementTask.longitude]),
+    "original_latitude": Field([LawEnforcementTask.latitude]),
+    "address": Field([LawEnforcementTask.address]),
+    "assigned_to": Field([LawEnforcementTask.assigned_to], _task_user_name, needs=["users"]),
+    "deadline": Field([LawEnforcementTask.deadline], lambda row, ctx: row.deadline.date() if row.deadline else None),
+    "created_at": Field([LawEnforcementTask.created_at],
+                        lambda row, ctx: row.created_at.date() if row.created_at else None),
+}, profiles={
+    "marker": ("id", "longitude", "latitude", "status", "priority", "task_type"),
+    "card": ("id", "longitude", "latitude", "status", "priority", "task_type", "task_code", "title", "address",
+             "assigned_to", "deadline"),
+})
+
+
 @app.get("/api/government/tasks/map", response_model=BaseResponse)
 async def get_tasks_for_map(
         min_longitude: float = Query(...),
@@ -2579,6 +2811,7 @@ async def get_tasks_for_map(
         max_latitude: float = Query(...),
         status: Optional[str] = Query(None),
         task_type: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
         current_user: GovernmentUser = Depends(get_current_gov_user),
         db: Session = Depends(get_db)
 ):
@@ -2586,54 +2819,93 @@ async def get_tasks_for_map(
     获取地图范围内的任务点（用于地图展示）
     """
     try:
-        query = db.query(LawEnforcementTask).filter(
+        selection = TASK_MAP_FIELDS.select(fields)
+    except ValueError as e:
+        return BaseResponse(code="400", msg=str(e))
+
+    try:
+        query = select(*selection.columns).where(
             LawEnforcementTask.longitude.between(min_longitude, max_longitude),
             LawEnforcementTask.latitude.between(min_latitude, max_latitude)
         )
 
         if status:
-            query = query.filter(LawEnforcementTask.status == status)
+            query = query.where(LawEnforcementTask.status == status)
         if task_type:
-            query = query.filter(LawEnforcementTask.task_type == task_type)
-
-        tasks = query.all()
-
-        result = []
-        for task in tasks:
-            # 获取执行人信息
-            assigned_user = None
-            if task.assigned_to:
-                assigned_user = db.query(GovernmentUser).filter(
-                    GovernmentUser.gov_user_id == task.assigned_to
-                ).first()
+            query = query.where(LawEnforcementTask.task_type == task_type)
 
-            # 坐标转换
-            gcj_lng, gcj_lat = wgs84_to_gcj02(task.longitude, task.latitude)
+        rows = db.execute(query).all()
 
-            task_point = {
-                "id": task.task_id,
-                "task_code": task.task_code,
-                "title": task.title,
-                "task_type": task.task_type,
-                "priority": task.priority,
-                "status": task.status,
-                "longitude": gcj_lng,
-                "latitude": gcj_lat,
-                "original_longitude": task.longitude,
-                "original_latitude": task.latitude,
-                "address": task.address,
-                "assigned_to": assigned_user.username if assigned_user else None,
-                "deadline": task.deadline.strftime("%Y-%m-%d") if task.deadline else None,
-                "created_at": task.created_at.strftime("%Y-%m-%d") if task.created_at else None
-            }
+        ctx = None
+        if "users" in selection.needs:
+            ctx = {"users": _load_task_users(db, rows, ("assigned_to",))}
 
-            result.append(task_point)
-
-        return BaseResponse(data=result)
+        return trusted_response([selection.to_dict(row, ctx) for row in rows])
     except Exception as e:
         return BaseResponse(code="500", msg=f"获取地图任务点失败: {str(e)}")
 
 
+# 按 (统计周期, 部门) 缓存的任务统计；本进程内提交了任务的增删改（包括批量导入、后台作业）后整体失效。
+# 其他进程的写入通知不到这里，有效期与地点列表、仪表盘相同取 5 秒
+TASK_STATISTICS_CACHE_TTL = 5
+task_statistics_cache = TTLCache("task_statistics", ttl=TASK_STATISTICS_CACHE_TTL, maxsize=64)
+invalidate_on_commit(SessionLocal, (LawEnforcementTask,), task_statistics_cache)
+
+
+def compute_task_statistics(db: Session, period: str, department: Optional[str]) -> dict:
+    """一次分组扫描同时得到总数、各状态数、按类型和按优先级的分布"""
+    end_date = datetime.now()
+    if period == "day":
+        start_date = end_date - timedelta(days=1)
+    elif period == "week":
+        start_date = end_date - timedelta(days=7)
+    elif period == "year":
+        start_date = end_date - timedelta(days=365)
+    else:  # month
+        start_date = end_date - timedelta(days=30)
+
+    status = LawEnforcementTask.status
+    query = db.query(
+        LawEnforcementTask.task_type,
+        LawEnforcementTask.priority,
+        func.count(LawEnforcementTask.task_id),
+        func.sum(case((status == "pending", 1), else_=0)),
+        func.sum(case((status == "in_progress", 1), else_=0)),
+        func.sum(case((status == "completed", 1), else_=0))
+    ).filter(LawEnforcementTask.created_at >= start_date)
+
+    if department:
+        # 按负责人所属部门过滤
+        query = query.join(
+            GovernmentUser, LawEnforcementTask.assigned_to == GovernmentUser.gov_user_id
+        ).filter(GovernmentUser.department == department)
+
+    total_tasks = pending_tasks = in_progress_tasks = completed_tasks = 0
+    type_stats = {}
+    priority_stats = {}
+    for task_type, priority, count, pending, in_progress, completed in query.group_by(
+            LawEnforcementTask.task_type, LawEnforcementTask.priority).all():
+        total_tasks += count
+        pending_tasks += int(pending or 0)
+        in_progress_tasks += int(in_progress or 0)
+        completed_tasks += int(completed or 0)
+        type_stats[task_type] = type_stats.get(task_type, 0) + count
+        priority_stats[priority] = priority_stats.get(priority, 0) + count
+
+    return {
+        "period": period,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "total": total_tasks,
+        "pending": pending_tasks,
+        "in_progress": in_progress_tasks,
+        "completed": completed_tasks,
+        "completion_rate": round(completed_tasks / total_tasks * 100, 2) if total_tasks > 0 else 0,
+        "by_type": type_stats,
+        "by_priority": priority_stats
+    }
+
+
 @app.get("/api/government/tasks/statistics", response_model=BaseResponse)
 async def get_task_statistics(
         period: str = Query("month", description="统计周期: day/week/month/year"),
@@ -2645,66 +2917,10 @@ async def get_task_statistics(
     获取任务统计信息
     """
     try:
-        # 计算日期范围
-        end_date = datetime.now()
-        if period == "day":
-            start_date = end_date - timedelta(days=1)
-        elif period == "week":
-            start_date = end_date - timedelta(days=7)
-        elif period == "year":
-            start_date = end_date - timedelta(days=365)
-        else:  # month
-            start_date = end_date - timedelta(days=30)
-
-        # 基础查询
-        query = db.query(LawEnforcementTask).filter(
-            LawEnforcementTask.created_at >= start_date
+        statistics = task_statistics_cache.get_or_load(
+            (period, department or None),
+            lambda: compute_task_statistics(db, period, department)
         )
-
-        if department:
-            # 需要关联用户表查询部门
-            pass
-
-        total_tasks = query.count()
-
-        # 按状态统计
-        pending_tasks = query.filter(LawEnforcementTask.status == "pending").count()
-        in_progress_tasks = query.filter(LawEnforcementTask.status == "in_progress").count()
-        completed_tasks = query.filter(LawEnforcementTask.status == "completed").count()
-
-        # 按类型统计
-        type_stats = {}
-        task_types = db.query(LawEnforcementTask.task_type,
-                              func.count(LawEnforcementTask.task_id)) \
-            .filter(LawEnforcementTask.created_at >= start_date) \
-            .group_by(LawEnforcementTask.task_type).all()
-
-        for task_type, count in task_types:
-            type_stats[task_type] = count
-
-        # 按优先级统计
-        priority_stats = {}
-        priorities = db.query(LawEnforcementTask.priority,
-                              func.count(LawEnforcementTask.task_id)) \
-            .filter(LawEnforcementTask.created_at >= start_date) \
-            .group_by(LawEnforcementTask.priority).all()
-
-        for priority, count in priorities:
-            priority_stats[priority] = count
-
-        statistics = {
-            "period": period,
-            "start_date": start_date.strftime("%Y-%m-%d"),
-            "end_date": end_date.strftime("%Y-%m-%d"),
-            "total": total_tasks,
-            "pending": pending_tasks,
-            "in_progress": in_progress_tasks,
-            "completed": completed_tasks,
-            "completion_rate": round(completed_tasks / total_tasks * 100, 2) if total_tasks > 0 else 0,
-            "by_type": type_stats,
-            "by_priority": priority_stats
-        }
-
         return BaseResponse(data=statistics)
     except Exception as e:
         return BaseResponse(code="500", msg=f"获取统计信息失败: {str(e)}")
@@ -2724,23 +2940,6 @@ async def get_task_detail(
         if not task:
             return BaseResponse(code="404", msg="任务不存在")
 
-        # 获取相关人员信息
-        assigned_user = None
-        if task.assigned_to:
-            assigned_user = db.query(GovernmentUser).filter(
-                GovernmentUser.gov_user_id == task.assigned_to
-            ).first()
-
-        assigned_by_user = None
-        if task.assigned_by:
-            assigned_by_user = db.query(GovernmentUser).filter(
-                GovernmentUser.gov_user_id == task.assigned_by
-            ).first()
-
-        created_user = db.query(GovernmentUser).filter(
-            GovernmentUser.gov_user_id == task.created_by
-        ).first()
-
         # 获取附件URL
         attachment_urls = []
         if task.attachments:
@@ -2752,11 +2951,25 @@ async def get_task_detail(
             TaskHistory.task_id == task_id
         ).order_by(TaskHistory.performed_at.desc()).all()
 
+        # 获取评论
+        comments = db.query(TaskComment).filter(
+            TaskComment.task_id == task_id
+        ).order_by(TaskComment.created_at.desc()).all()
+
+        # 任务、历史、评论涉及的人员一次查询加载
+        users = BatchLoader(db, GovernmentUser, cache=gov_user_cache)
+        users.want(task.assigned_to, task.assigned_by, task.created_by)
+        users.want(*(h.performed_by for h in history))
+        users.want(*(c.created_by for c in comments))
+
+        # 获取相关人员信息
+        assigned_user = users.get(task.assigned_to)
+        assigned_by_user = users.get(task.assigned_by)
+        created_user = users.get(task.created_by)
+
         history_list = []
         for h in history:
-            performer = db.query(GovernmentUser).filter(
-                GovernmentUser.gov_user_id == h.performed_by
-            ).first()
+            performer = users.get(h.performed_by)
 
             history_list.append({
                 "id": h.history_id,
@@ -2768,16 +2981,9 @@ async def get_task_detail(
                 "new_status": h.new_status
             })
 
-        # 获取评论
-        comments = db.query(TaskComment).filter(
-            TaskComment.task_id == task_id
-        ).order_by(TaskComment.created_at.desc()).all()
-
         comment_list = []
         for c in comments:
-            commenter = db.query(GovernmentUser).filter(
-                GovernmentUser.gov_user_id == c.created_by
-            ).first()
+            commenter = users.get(c.created_by)
 
             comment_attachments = []
             if c.attachments:
@@ -2880,19 +3086,17 @@ async def update_task(
             metadata={"updated_fields": update_fields}
         )
         db.add(history)
+        db.commit()
 
         # 记录操作日志
-        log = OperationLog(
+        audit_log.record(
             operator=current_user.username,
             action="更新执法任务",
             target=task.task_code,
-            operation_time=datetime.now(),
             ip_address="192.168.1.1",
             result="成功",
             details=f"更新任务状态: {old_status} -> {task.status}"
         )
-        db.add(log)
-        db.commit()
 
         return BaseResponse(msg="任务更新成功")
     except Exception as e:
@@ -2962,13 +3166,33 @@ async def get_government_users(
 
         users = query.order_by(GovernmentUser.department, GovernmentUser.username).all()
 
+        # 一次分组查询得到每人各状态的未完成任务数和逾期数
+        open_statuses = ["pending", "assigned", "in_progress"]
+        workload = {}
+        if users:
+            status = LawEnforcementTask.status
+            rows = db.query(
+                LawEnforcementTask.assigned_to,
+                func.sum(case((status == "pending", 1), else_=0)),
+                func.sum(case((status == "assigned", 1), else_=0)),
+                func.sum(case((status == "in_progress", 1), else_=0)),
+                func.sum(case((LawEnforcementTask.deadline < datetime.now(), 1), else_=0))
+            ).filter(
+                LawEnforcementTask.assigned_to.in_([user.gov_user_id for user in users]),
+                status.in_(open_statuses)
+            ).group_by(LawEnforcementTask.assigned_to).all()
+            for user_id, pending, assigned, in_progress, overdue in rows:
+                workload[user_id] = {
+                    "pending": int(pending or 0),
+                    "assigned": int(assigned or 0),
+                    "in_progress": int(in_progress or 0),
+                    "overdue": int(overdue or 0)
+                }
+
         user_list = []
         for user in users:
-            # 统计用户的任务数
-            assigned_tasks = db.query(LawEnforcementTask).filter(
-                LawEnforcementTask.assigned_to == user.gov_user_id,
-                LawEnforcementTask.status.in_(["pending", "assigned", "in_progress"])
-            ).count()
+            counts = workload.get(user.gov_user_id, {"pending": 0, "assigned": 0, "in_progress": 0, "overdue": 0})
+            assigned_tasks = counts["pending"] + counts["assigned"] + counts["in_progress"]
 
             user_info = {
                 "id": user.gov_user_id,
@@ -2979,6 +3203,12 @@ async def get_government_users(
                 "position": user.position,
                 "role": user.role,
                 "assigned_tasks": assigned_tasks,
+                "task_breakdown": {
+                    "pending": counts["pending"],
+                    "assigned": counts["assigned"],
+                    "in_progress": counts["in_progress"]
+                },
+                "overdue_tasks": counts["overdue"],
                 "last_login": user.last_login_time.strftime("%Y-%m-%d %H:%M:%S") if user.last_login_time else None
             }
 
@@ -2989,6 +3219,53 @@ async def get_government_users(
         return BaseResponse(code="500", msg=f"获取用户列表失败: {str(e)}")
 
 
+# 仪表板中与用户无关的部分，所有用户共享，几秒刷新一次
+DASHBOARD_SNAPSHOT_TTL = 5
+dashboard_cache = TTLCache("government_dashboard", ttl=DASHBOARD_SNAPSHOT_TTL, maxsize=1)
+
+
+def build_dashboard_snapshot(db: Session) -> dict:
+    """用分组聚合一次算出任务总数/待处理/紧急数、7天趋势和部门分布"""
+    open_statuses = ["pending", "assigned", "in_progress"]
+    total_tasks, pending_tasks, urgent_tasks = db.query(
+        func.count(LawEnforcementTask.task_id),
+        func.sum(case((LawEnforcementTask.status == "pending", 1), else_=0)),
+        func.sum(case((and_(LawEnforcementTask.priority == "urgent",
+                            LawEnforcementTask.status.in_(open_statuses)), 1), else_=0))
+    ).one()
+    total_tasks = total_tasks or 0
+    pending_tasks = int(pending_tasks or 0)
+    urgent_tasks = int(urgent_tasks or 0)
+
+    # 最近7天任务趋势（读取按天汇总）
+    seven_days_ago = rollups.truncate("day", datetime.now() - timedelta(days=7))
+    daily_counts = rollups.series(db, "tasks", "day", seven_days_ago,
+                                  seven_days_ago + timedelta(days=7), "status")
+    daily_tasks = [{"date": day.strftime("%m-%d"), "count": count}
+                   for day, count in sorted(daily_counts.items())]
+
+    # 各部门任务分布（没有任务的部门计为0）
+    dept_rows = db.query(
+        GovernmentUser.department, func.count(LawEnforcementTask.task_id)
+    ).outerjoin(
+        LawEnforcementTask, LawEnforcementTask.assigned_to == GovernmentUser.gov_user_id
+    ).filter(
+        GovernmentUser.department.isnot(None), GovernmentUser.department != ""
+    ).group_by(GovernmentUser.department).all()
+    dept_tasks = [{"department": dept, "count": count} for dept, count in dept_rows]
+
+    return {
+        "task_stats": {
+            "total": total_tasks,
+            "pending": pending_tasks,
+            "urgent": urgent_tasks,
+            "completion_rate": round((total_tasks - pending_tasks) / total_tasks * 100, 2) if total_tasks > 0 else 0
+        },
+        "daily_trends": daily_tasks,
+        "department_distribution": dept_tasks
+    }
+
+
 @app.get("/api/government/dashboard", response_model=BaseResponse)
 async def get_government_dashboard(
         current_user: GovernmentUser = Depends(get_current_gov_user),
@@ -2998,50 +3275,7 @@ async def get_government_dashboard(
     政府执法端仪表板数据
     """
     try:
-        # 任务统计
-        total_tasks = db.query(LawEnforcementTask).count()
-        pending_tasks = db.query(LawEnforcementTask).filter(
-            LawEnforcementTask.status == "pending"
-        ).count()
-        urgent_tasks = db.query(LawEnforcementTask).filter(
-            LawEnforcementTask.priority == "urgent",
-            LawEnforcementTask.status.in_(["pending", "assigned", "in_progress"])
-        ).count()
-
-        # 最近7天任务趋势
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        daily_tasks = []
-        for i in range(7):
-            date = seven_days_ago + timedelta(days=i)
-            day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-
-            count = db.query(LawEnforcementTask).filter(
-                LawEnforcementTask.created_at >= day_start,
-                LawEnforcementTask.created_at < day_end
-            ).count()
-
-            daily_tasks.append({
-                "date": day_start.strftime("%m-%d"),
-                "count": count
-            })
-
-        # 各部门任务分布
-        dept_tasks = []
-        departments = db.query(GovernmentUser.department).distinct().all()
-        for dept, in departments:
-            if dept:
-                count = db.query(LawEnforcementTask).join(
-                    GovernmentUser,
-                    LawEnforcementTask.assigned_to == GovernmentUser.gov_user_id
-                ).filter(
-                    GovernmentUser.department == dept
-                ).count()
-
-                dept_tasks.append({
-                    "department": dept,
-                    "count": count
-                })
+        snapshot = dashboard_cache.get_or_load("snapshot", lambda: build_dashboard_snapshot(db))
 
         # 待办事项（当前用户的未完成任务）
         my_pending_tasks = db.query(LawEnforcementTask).filter(
@@ -3069,14 +3303,9 @@ async def get_government_dashboard(
             })
 
         dashboard_data = {
-            "task_stats": {
-                "total": total_tasks,
-                "pending": pending_tasks,
-                "urgent": urgent_tasks,
-                "completion_rate": round((total_tasks - pending_tasks) / total_tasks * 100, 2) if total_tasks > 0 else 0
-            },
-            "daily_trends": daily_tasks,
-            "department_distribution": dept_tasks,
+            "task_stats": snapshot["task_stats"],
+            "daily_trends": snapshot["daily_trends"],
+            "department_distribution": snapshot["department_distribution"],
             "my_pending_tasks": pending_list,
             "system_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
@@ -3105,32 +3334,7 @@ async def get_shop_audit_list(
         if current_user.role not in ['admin']:
             return BaseResponse(code="403", msg="权限不足")
 
-        query = db.query(Shop)
-
-        # 关键词搜索
-        if keyword:
-            keyword_lower = keyword.lower()
-            query = query.filter(
-                or_(
-                    Shop.username.ilike(f"%{keyword}%"),
-                    Shop.email.ilike(f"%{keyword}%"),
-                    Shop.province.ilike(f"%{keyword}%"),
-                    Shop.city.ilike(f"%{keyword}%"),
-                    Shop.district.ilike(f"%{keyword}%")
-                )
-            )
-
-        # 审核状态筛选
-        if status:
-            if status == 'pending':
-                # 未审核：audit_status 为 None 或空字符串
-                query = query.filter(or_(
-                    Shop.audit_status == None,
-                    Shop.audit_status == '',
-                    Shop.audit_status == 'pending'
-                ))
-            else:
-                query = query.filter(Shop.audit_status == status)
+        query = db.query(Shop).filter(*shop_audit_conditions(keyword, status))
 
         # 计算总数
         total = query.count()
@@ -3221,34 +3425,17 @@ async def audit_shop(
         if current_user.role not in ['admin']:
             return BaseResponse(code="403", msg="权限不足")
 
-        shop = db.query(Shop).filter(Shop.shop_id == shop_id).first()
-        if not shop:
-            return BaseResponse(code="404", msg="店铺不存在")
-
         action = request.get("action")  # approve 或 reject
         remark = request.get("remark", "")
 
-        if action not in ["approve", "reject"]:
+        if action not in SHOP_AUDIT_ACTIONS:
             return BaseResponse(code="400", msg="无效的操作类型")
 
-        # 更新审核状态
-        new_status = "approved" if action == "approve" else "rejected"
-        shop.audit_status = new_status
-        shop.updated_at = datetime.now()
-
-        # 记录审核日志
-        log = OperationLog(
-            operator=current_user.username,
-            action="店铺审核",
-            target=shop.username,
-            operation_time=datetime.now(),
-            ip_address="192.168.1.1",  # 实际项目中应从请求中获取
-            result="成功",
-            details=f"审核操作: {action}, 状态: {new_status}, 备注: {remark}"
-        )
-        db.add(log)
-
-        db.commit()
+        new_status = SHOP_AUDIT_ACTIONS[action]
+        _, not_found = audit_shops(db, action, [shop_id], current_user.username, "店铺审核",
+                                   f"审核操作: {action}, 状态: {new_status}, 备注: {remark}")
+        if not_found:
+            return BaseResponse(code="404", msg="店铺不存在")
 
         return BaseResponse(
             msg=f"店铺审核{'通过' if action == 'approve' else '拒绝'}成功",
@@ -3281,40 +3468,16 @@ async def batch_audit_shop(
 
         if not shop_ids:
             return BaseResponse(code="400", msg="请选择要操作的店铺")
+        if not isinstance(shop_ids, list):
+            return BaseResponse(code="400", msg="shopIds 必须是数组")
 
-        if action not in ["approve", "reject"]:
+        if action not in SHOP_AUDIT_ACTIONS:
             return BaseResponse(code="400", msg="无效的操作类型")
 
-        new_status = "approved" if action == "approve" else "rejected"
-        success_count = 0
-        failed_ids = []
-
-        for shop_id in shop_ids:
-            try:
-                shop = db.query(Shop).filter(Shop.shop_id == shop_id).first()
-                if shop:
-                    shop.audit_status = new_status
-                    shop.updated_at = datetime.now()
-                    success_count += 1
-
-                    # 记录审核日志
-                    log = OperationLog(
-                        operator=current_user.username,
-                        action="批量店铺审核",
-                        target=shop.username,
-                        operation_time=datetime.now(),
-                        ip_address="192.168.1.1",
-                        result="成功",
-                        details=f"批量审核操作: {action}, 状态: {new_status}"
-                    )
-                    db.add(log)
-                else:
-                    failed_ids.append(shop_id)
-            except Exception as e:
-                print(f"审核店铺 {shop_id} 失败: {e}")
-                failed_ids.append(shop_id)
-
-        db.commit()
+        new_status = SHOP_AUDIT_ACTIONS[action]
+        audited, failed_ids = audit_shops(db, action, shop_ids, current_user.username, "批量店铺审核",
+                                          f"批量审核操作: {action}, 状态: {new_status}")
+        success_count = len(audited)
 
         return BaseResponse(
             msg=f"批量审核完成，成功: {success_count}，失败: {len(failed_ids)}",
@@ -3328,6 +3491,178 @@ async def batch_audit_shop(
         return BaseResponse(code="500", msg=f"批量审核失败: {str(e)}")
 
 
+# ========== 数据导出接口 ==========
+EXPORT_FORMAT = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+
+
+def _record_export(operator, entity, fmt, filters):
+    audit_log.record(
+        operator=operator,
+        action="数据导出",
+        target=entity,
+        ip_address="192.168.1.1",
+        result="成功",
+        details=f"格式: {fmt}, 条件: {', '.join(f'{k}={v}' for k, v in filters.items() if v) or '无'}"
+    )
+
+
+@app.get("/api/export/panoramas")
+async def export_panoramas(
+        request: Request,
+        fmt: str = EXPORT_FORMAT,
+        status: str = Query("all"),
+        keyword: str = Query(None),
+        current_user: User = Depends(get_current_user)
+):
+    """流式导出全景图数据，筛选条件同 /api/manager/data/list"""
+    _record_export(current_user.username, "panoramas", fmt, {"status": status, "keyword": keyword})
+    return export.export_response("panoramas", fmt, export.panoramas(panorama_conditions(status, keyword)),
+                                  request.headers.get("accept-encoding"))
+
+
+@app.get("/api/export/tasks")
+async def export_tasks(
+        request: Request,
+        fmt: str = EXPORT_FORMAT,
+        status: Optional[str] = Query(None),
+        task_type: Optional[str] = Query(None),
+        priority: Optional[str] = Query(None),
+        assigned_to: Optional[int] = Query(None),
+        start_date: Optional[str] = Query(None),
+        end_date: Optional[str] = Query(None),
+        keyword: Optional[str] = Query(None),
+        current_user: GovernmentUser = Depends(get_current_gov_user)
+):
+    """流式导出执法任务，筛选条件同 /api/government/tasks"""
+    try:
+        conditions = task_conditions(status, task_type, priority, assigned_to, start_date, end_date, keyword)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+    _record_export(current_user.username, "tasks", fmt, {
+        "status": status, "task_type": task_type, "priority": priority, "assigned_to": assigned_to,
+        "start_date": start_date, "end_date": end_date, "keyword": keyword
+    })
+    return export.export_response("tasks", fmt, export.tasks(conditions), request.headers.get("accept-encoding"))
+
+
+@app.get("/api/export/shops")
+async def export_shops(
+        request: Request,
+        fmt: str = EXPORT_FORMAT,
+        keyword: Optional[str] = None,
+        status: Optional[str] = None,
+        current_user: User = Depends(get_current_user)
+):
+    """流式导出店铺（管理员专用），筛选条件同 /api/admin/shop-audit/list"""
+    if current_user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="权限不足")
+    _record_export(current_user.username, "shops", fmt, {"keyword": keyword, "status": status})
+    return export.export_response("shops", fmt, export.shops(shop_audit_conditions(keyword, status)),
+                                  request.headers.get("accept-encoding"))
+
+
+@app.get("/api/export/logs")
+async def export_operation_logs(
+        request: Request,
+        fmt: str = EXPORT_FORMAT,
+        operator: str = Query(None),
+        actionType: str = Query(None),
+        startDate: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD"),
+        endDate: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含当天）"),
+        current_user: User = Depends(get_current_user)
+):
+    """流式导出操作日志，筛选条件同 /api/manager/monitor/logs；指定开始日期时包含归档段"""
+    try:
+        start_dt, end_dt = parse_date_range(startDate, endDate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+    _record_export(current_user.username, "logs", fmt, {
+        "operator": operator, "actionType": actionType, "startDate": startDate, "endDate": endDate
+    })
+    archived = export.archived_logs(start_dt, end_dt, operator, actionType) if start_dt else None
+    return export.export_response("logs", fmt,
+                                  export.operation_logs(log_conditions(operator, actionType, start_dt, end_dt)),
+                                  request.headers.get("accept-encoding"), archived)
+
+
+# ========== 批量导入接口 ==========
+IMPORT_FORMAT = Query(None, alias="format", pattern="^(ndjson|csv)$")
+
+
+async def _run_import(request: Request, db: Session, entity, fmt, dry_run, background, operator, context):
+    """流式解析请求体并导入；background 时只做格式校验，通过的行提交为后台作业"""
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    try:
+        report = await bulk_import.run_import(db, entity, request.stream(), fmt, context, dry_run, background)
+        data = report.to_dict()
+        if background and not dry_run and report.rows:
+            job = await asyncio.get_running_loop().run_in_executor(
+                None, jobs.submit, db, f"import_{entity}", report.rows, context, operator)
+            data["job"] = jobs.describe(job, with_results=False)
+    except Exception as e:
+        db.rollback()
+        return BaseResponse(code="500", msg=f"批量导入失败: {str(e)}")
+
+    if not dry_run:
+        audit_log.record(
+            operator=operator,
+            action="批量导入",
+            target=entity,
+            ip_address="192.168.1.1",
+            result="成功",
+            details=f"格式: {fmt}, 共 {report.total} 行, "
+                    f"{'提交作业' if background else '成功'} {report.succeeded} 行, 失败 {report.failed} 行"
+        )
+
+    if dry_run:
+        msg = f"校验完成，通过: {report.succeeded}，失败: {report.failed}"
+    elif background:
+        msg = f"已提交后台作业，待导入: {report.succeeded}，格式错误: {report.failed}"
+    else:
+        msg = f"导入完成，成功: {report.succeeded}，失败: {report.failed}"
+    return BaseResponse(msg=msg, data=data)
+
+
+@app.post("/api/import/locations", response_model=BaseResponse)
+async def import_locations(
+        request: Request,
+        fmt: Optional[str] = IMPORT_FORMAT,
+        dry_run: bool = Query(False),
+        background: bool = Query(False),
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """批量导入地点（NDJSON 或 CSV），字段同 LocationCreate"""
+    return await _run_import(request, db, "locations", fmt, dry_run, background, current_user.username, {})
+
+
+@app.post("/api/import/shops", response_model=BaseResponse)
+async def import_shops(
+        request: Request,
+        fmt: Optional[str] = IMPORT_FORMAT,
+        dry_run: bool = Query(False),
+        background: bool = Query(False),
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """批量导入商铺（NDJSON 或 CSV），字段同 ShopCreate，导入后为待审核状态"""
+    return await _run_import(request, db, "shops", fmt, dry_run, background, current_user.username, {})
+
+
+@app.post("/api/import/tasks", response_model=BaseResponse)
+async def import_tasks(
+        request: Request,
+        fmt: Optional[str] = IMPORT_FORMAT,
+        dry_run: bool = Query(False),
+        background: bool = Query(False),
+        current_user: GovernmentUser = Depends(get_current_gov_user),
+        db: Session = Depends(get_db)
+):
+    """批量导入执法任务（NDJSON 或 CSV），字段同 LawEnforcementTaskCreate，创建人为当前用户"""
+    return await _run_import(request, db, "tasks", fmt, dry_run, background, current_user.username,
+                             {"gov_user_id": current_user.gov_user_id})
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -213,6 +213,17 @@ class LocationCreate(BaseModel):
     preview_image_ids: Optional[List[int]] = None  # 预览图ID列表
 
 
+class ShopCreate(BaseModel):
+    """创建商铺请求模型"""
+    username: str
+    email: str  # 这里实际是地点
+    province: Optional[str] = None
+    city: Optional[str] = None
+    district: Optional[str] = None
+    size: Optional[str] = "small"  # small/medium/large
+    role: Optional[str] = "admin"  # admin(饭店)/advanced(商超)/user(酒店)
+
+
 # 新增全景图详细模型
 class PanoramaDetail(BaseModel):
     id: int
@@ -231,7 +242,14 @@ class PanoramaDetail(BaseModel):
 # 批量操作请求模型
 class BatchOperationRequest(BaseModel):
     data_ids: List[int]
-    action: str  # delete, publish
+    action: str  # delete, publish, reject
+
+
+# 批量作业提交请求模型
+class JobSubmitRequest(BaseModel):
+    job_type: str  # panorama_batch, shop_audit, thumbnail_regenerate
+    items: List[Any]  # 待处理的ID（导入作业为数据行）
+    params: Optional[Dict[str, Any]] = None  # 如 {"action": "publish"}
 
 
 # 数据上传请求模型 - 修改为支持图片上传
@@ -378,4 +396,15 @@ class TaskHistoryResponse(BaseModel):
     performed_at: str
     old_status: Optional[str] = None
     new_status: Optional[str] = None
-    history_metadata: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    history_metadata: Optional[Dict[str, Any]] = None
+
+# 浏览/收藏事件上报模型
+class AnalyticsEvent(BaseModel):
+    target_type: str  # location, panorama, shop
+    target_id: int
+    event_type: str  # view, favorite
+    count: int = 1
+
+
+class AnalyticsEventBatch(BaseModel):
+    events: List[AnalyticsEvent]
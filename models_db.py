@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, JSON, Enum, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, JSON, Enum, ForeignKey, LargeBinary, Index
 from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.sql import func
 from database import Base
@@ -16,6 +16,7 @@ class User(Base):
     role = Column(Enum('admin', 'advanced', 'user'), default='user')
     status = Column(Boolean, default=True)
     last_login_time = Column(DateTime)
+    token_version = Column(Integer, nullable=False, default=0)  # 递增后已签发的令牌全部失效
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -32,7 +33,7 @@ class Location(Base):
     description = Column(Text)
     address = Column(Text)
     # 新增：直接关联一张全景图
-    panorama_id = Column(Integer, ForeignKey('panoramas.panorama_id'), nullable=True)
+    panorama_id = Column(Integer, ForeignKey('panoramas.panorama_id'), nullable=True, index=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -71,6 +72,9 @@ class Panorama(Base):
 
 class PanoramaPreviewImages(Base):
     __tablename__ = "panorama_preview_images"
+    __table_args__ = (
+        Index("ix_panorama_preview_images_panorama_sort", "panorama_id", "sort_order"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     panorama_id = Column(Integer, ForeignKey('panoramas.panorama_id'), nullable=False)
@@ -83,8 +87,8 @@ class TimeMachineData(Base):
     __tablename__ = "time_machine_data"
 
     time_machine_id = Column(String(50), primary_key=True)
-    location_id = Column(Integer, ForeignKey('locations.location_id'), nullable=False)
-    panorama_id = Column(Integer, ForeignKey('panoramas.panorama_id'), nullable=False)
+    location_id = Column(Integer, ForeignKey('locations.location_id'), nullable=False, index=True)
+    panorama_id = Column(Integer, ForeignKey('panoramas.panorama_id'), nullable=False, index=True)
     year = Column(Integer, nullable=False)
     month = Column(Integer, nullable=False)
     label = Column(String(100), nullable=False)
@@ -97,12 +101,18 @@ class TimeMachineData(Base):
 
 class SystemMonitoring(Base):
     __tablename__ = "system_monitoring"
+    __table_args__ = (
+        Index("ux_system_monitoring_granularity_time", "granularity", "recorded_at", unique=True),
+    )
 
     monitor_id = Column(Integer, primary_key=True, index=True)
+    # 汇总粒度：分钟记录由采样器写入，小时/天记录由下一级汇总得出
+    granularity = Column(Enum('minute', 'hour', 'day'), nullable=False, default='minute')
     cpu_usage = Column(Float, nullable=False)
     memory_usage = Column(Float, nullable=False)
     disk_usage = Column(Float, nullable=False)
     disk_iops = Column(Integer, nullable=False)
+    process_rss_mb = Column(Float)  # 应用进程常驻内存
     api_response_time = Column(Float, nullable=False)
     recorded_at = Column(DateTime, default=func.now())
 
@@ -122,12 +132,16 @@ class ServiceStatus(Base):
 
 class OperationLog(Base):
     __tablename__ = "operation_logs"
+    __table_args__ = (
+        Index("ix_operation_logs_action_time", "action", "operation_time"),
+    )
 
-    log_id = Column(Integer, primary_key=True, index=True)
-    operator = Column(String(50), nullable=False)
+    log_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    operator = Column(String(50), nullable=False, index=True)
     action = Column(String(100), nullable=False)
     target = Column(String(100), nullable=False)
-    operation_time = Column(DateTime, nullable=False)
+    # 按月分区的分区键，必须包含在主键中（见 log_partitions.py）
+    operation_time = Column(DateTime, primary_key=True, nullable=False, index=True)
     ip_address = Column(String(45), nullable=False)
     result = Column(Enum('成功', '失败'), nullable=False)
     details = Column(Text)
@@ -167,6 +181,7 @@ class GovernmentUser(Base):
     role = Column(Enum('admin', 'supervisor', 'officer'), default='officer')  # 角色
     status = Column(Boolean, default=True)
     last_login_time = Column(DateTime)
+    token_version = Column(Integer, nullable=False, default=0)  # 递增后已签发的令牌全部失效
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -174,6 +189,10 @@ class GovernmentUser(Base):
 class LawEnforcementTask(Base):
     """执法任务表"""
     __tablename__ = "law_enforcement_tasks"
+    __table_args__ = (
+        Index("ix_law_enforcement_tasks_status_created", "status", "created_at"),
+        Index("ix_law_enforcement_tasks_assigned_status", "assigned_to", "status"),
+    )
 
     task_id = Column(Integer, primary_key=True, index=True)
     task_code = Column(String(50), unique=True, index=True, nullable=False)  # 任务编号
@@ -192,13 +211,16 @@ class LawEnforcementTask(Base):
     attachments = Column(JSON)  # 附件（图片等）
     remarks = Column(Text)  # 备注
     created_by = Column(Integer, ForeignKey('government_users.gov_user_id'))
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
 
 class TaskHistory(Base):
     """任务历史记录表"""
     __tablename__ = "task_history"
+    __table_args__ = (
+        Index("ix_task_history_task_performed", "task_id", "performed_at"),
+    )
 
     history_id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey('law_enforcement_tasks.task_id'), nullable=False)
@@ -214,6 +236,9 @@ class TaskHistory(Base):
 class TaskComment(Base):
     """任务评论/沟通记录"""
     __tablename__ = "task_comments"
+    __table_args__ = (
+        Index("ix_task_comments_task_created", "task_id", "created_at"),
+    )
 
     comment_id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey('law_enforcement_tasks.task_id'), nullable=False)
@@ -221,4 +246,81 @@ class TaskComment(Base):
     comment_type = Column(Enum('comment', 'update', 'reminder'), default='comment')
     created_by = Column(Integer, ForeignKey('government_users.gov_user_id'), nullable=False)
     created_at = Column(DateTime, default=func.now())
-    attachments = Column(JSON)  # 附件
\ No newline at end of file
+    attachments = Column(JSON)  # 附件
+
+class AnalyticsEventCount(Base):
+    """浏览/收藏事件按分钟聚合的计数"""
+    __tablename__ = "analytics_event_counts"
+    __table_args__ = (
+        Index("ux_analytics_event_counts_bucket", "bucket_minute", "target_type", "target_id", "event_type",
+              unique=True),
+        Index("ix_analytics_event_counts_target", "target_type", "target_id", "bucket_minute"),
+    )
+
+    count_id = Column(Integer, primary_key=True, index=True)
+    bucket_minute = Column(DateTime, nullable=False)  # 所属分钟（秒数为0）
+    target_type = Column(Enum('location', 'panorama', 'shop'), nullable=False)
+    target_id = Column(Integer, nullable=False)
+    event_type = Column(Enum('view', 'favorite'), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class StatRollup(Base):
+    """按小时/天预聚合的统计计数（任务、全景图、浏览/收藏事件）"""
+    __tablename__ = "stat_rollups"
+    __table_args__ = (
+        Index("ux_stat_rollups_bucket", "metric", "granularity", "bucket_start", "scope", "dimension", "value",
+              unique=True),
+    )
+
+    rollup_id = Column(Integer, primary_key=True, index=True)
+    metric = Column(String(20), nullable=False)  # tasks / panoramas / analytics
+    granularity = Column(Enum('hour', 'day'), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # 所属小时/天的起始时间
+    scope = Column(String(50), nullable=False, default='')  # 任务为负责人所属部门，其他指标为空
+    dimension = Column(String(20), nullable=False)  # 统计维度，如 status / task_type / priority
+    value = Column(String(50), nullable=False)  # 维度取值
+    count = Column(Integer, nullable=False, default=0)
+
+
+class TaskCodeSequence(Base):
+    """任务编号的按天序列，next_value 为下一个未分配的序号"""
+    __tablename__ = "task_code_sequences"
+
+    seq_date = Column(String(8), primary_key=True)  # YYYYMMDD
+    next_value = Column(Integer, nullable=False, default=1)
+
+
+class BulkJob(Base):
+    """后台批量作业（批量发布/删除、批量审核、缩略图重建、导入等），按块处理并记录检查点"""
+    __tablename__ = "bulk_jobs"
+    __table_args__ = (
+        Index("ix_bulk_jobs_status", "status", "heartbeat_at"),
+    )
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False)
+    status = Column(Enum('pending', 'running', 'completed', 'failed', 'cancelled'), nullable=False, default='pending')
+    params = Column(JSON)  # 作业参数，如 {"action": "publish"}（条目见 bulk_job_items）
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)  # 检查点：已处理的条目数
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    results = Column(JSON)  # 失败条目的结果（有上限）
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_by = Column(String(50))
+    worker = Column(String(100))  # 当前处理该作业的进程
+    heartbeat_at = Column(DateTime)  # 处理进程最近一次写检查点的时间
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class BulkJobItem(Base):
+    """作业的待处理条目（id 或导入行），按序号分块读取"""
+    __tablename__ = "bulk_job_items"
+
+    job_id = Column(Integer, ForeignKey('bulk_jobs.job_id', ondelete='CASCADE'), primary_key=True)
+    seq = Column(Integer, primary_key=True, autoincrement=False)  # 从 0 开始的序号
+    item = Column(JSON, nullable=False)
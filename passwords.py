@@ -0,0 +1,94 @@
+# passwords.py
+"""
+密码哈希
+
+使用标准库 hashlib.scrypt，哈希格式为 scrypt$n$r$p$盐$摘要（盐和摘要为 base64）。
+scrypt 计算约几十到上百毫秒且会释放 GIL，因此放在独立的有界线程池中执行，
+不占用事件循环；同时等待计算的请求数也有上限，登录高峰不会拖慢其他接口。
+
+旧数据中的明文密码在首次登录成功时自动改写为哈希；成本参数调整后，
+旧参数的哈希同样在下次登录时重新计算。
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD_CONFIG = {
+    "n": 2 ** 14,      # CPU/内存成本
+    "r": 8,            # 块大小
+    "p": 1,            # 并行度
+    "salt_bytes": 16,
+    "hash_bytes": 32,
+    "workers": 4,      # 哈希线程数
+    "max_pending": 64, # 同时排队/计算的哈希请求上限
+}
+
+_PREFIX = "scrypt"
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_CONFIG["workers"], thread_name_prefix="password-hash")
+_slots = None
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * n * r * 2, dklen=PASSWORD_CONFIG["hash_bytes"])
+
+
+def hash_password_sync(password):
+    n, r, p = PASSWORD_CONFIG["n"], PASSWORD_CONFIG["r"], PASSWORD_CONFIG["p"]
+    salt = os.urandom(PASSWORD_CONFIG["salt_bytes"])
+    return f"{_PREFIX}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(_PREFIX + "$")
+
+
+def needs_rehash(stored):
+    """明文密码或成本参数与当前配置不同的哈希"""
+    if not is_hashed(stored):
+        return True
+    _, n, r, p, _, _ = stored.split("$")
+    return (int(n), int(r), int(p)) != (PASSWORD_CONFIG["n"], PASSWORD_CONFIG["r"], PASSWORD_CONFIG["p"])
+
+
+def verify_password_sync(password, stored):
+    if not stored:
+        return False
+    if not is_hashed(stored):
+        # 旧数据：明文比较
+        return hmac.compare_digest(password.encode(), stored.encode())
+    _, n, r, p, salt, digest = stored.split("$")
+    actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(actual, base64.b64decode(digest))
+
+
+# 用户名不存在时也计算一次哈希，避免通过响应时间判断用户名是否存在
+_DUMMY_HASH = hash_password_sync(os.urandom(8).hex())
+
+
+async def _run(func, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_CONFIG["max_pending"])
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def hash_password(password):
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(password, stored):
+    """校验密码；stored 为 None（用户不存在）时同样耗时并返回 False"""
+    if stored is None:
+        await _run(verify_password_sync, password, _DUMMY_HASH)
+        return False
+    return await _run(verify_password_sync, password, stored)
@@ -0,0 +1,170 @@
+# request_metrics.py
+"""
+接口请求统计
+
+纯 ASGI 中间件，按路由模板记录耗时直方图、请求/响应字节数、状态码计数和并发中的请求数，
+以 Prometheus 文本格式从 /metrics 导出。每个请求只做几次计数和一次二分查找，不加锁
+（所有记录都发生在事件循环线程中）。
+"""
+import bisect
+import time
+
+# 耗时直方图的桶上界（秒），与 Prometheus 客户端默认值一致
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    __slots__ = ("buckets", "count", "total", "request_bytes", "response_bytes", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = {}
+
+    def percentile(self, q):
+        """按直方图线性插值估算分位数（秒）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.buckets):
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return BUCKETS[-1]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.routes = {}        # (method, 路由模板) -> RouteStats
+        self.in_flight = 0
+        self._paths = None      # endpoint 函数 -> 路由模板
+        self._window = (0, 0.0)
+
+    def route_path(self, app, endpoint):
+        if self._paths is None:
+            self._paths = {getattr(r, "endpoint", None): r.path for r in app.routes}
+        return self._paths.get(endpoint, "UNMATCHED")
+
+    def observe(self, method, path, status, elapsed, request_bytes, response_bytes):
+        key = (method, path)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteStats()
+        stats.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+        stats.count += 1
+        stats.total += elapsed
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def window_mean_ms(self):
+        """自上次调用以来所有请求的平均耗时（毫秒），供系统指标采样器使用"""
+        count = sum(s.count for s in self.routes.values())
+        total = sum(s.total for s in self.routes.values())
+        last_count, last_total = self._window
+        self._window = (count, total)
+        if count == last_count:
+            return 0.0
+        return (total - last_total) / (count - last_count) * 1000
+
+    def summary(self):
+        """各路由的请求数与 p50/p95/p99（毫秒）"""
+        result = []
+        for (method, path), stats in sorted(self.routes.items(), key=lambda kv: -kv[1].count):
+            result.append({
+                "method": method,
+                "route": path,
+                "count": stats.count,
+                "avg": round(stats.total / stats.count * 1000, 2) if stats.count else 0,
+                "p50": round(stats.percentile(0.50) * 1000, 2),
+                "p95": round(stats.percentile(0.95) * 1000, 2),
+                "p99": round(stats.percentile(0.99) * 1000, 2),
+                "requestBytes": stats.request_bytes,
+                "responseBytes": stats.response_bytes,
+                "statuses": {str(k): v for k, v in sorted(stats.statuses.items())}
+            })
+        return result
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        items = sorted(self.routes.items())
+        for (method, path), stats in items:
+            labels = f'method="{method}",route="{path}"'
+            cumulative = 0
+            for i, n in enumerate(stats.buckets):
+                cumulative += n
+                le = repr(BUCKETS[i]) if i < len(BUCKETS) else "+Inf"
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        lines += ["# HELP http_requests_total Requests by route and status code.",
+                  "# TYPE http_requests_total counter"]
+        for (method, path), stats in items:
+            for status, n in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{path}",status="{status}"}} {n}')
+
+        lines += ["# HELP http_request_size_bytes_total Request body bytes by route.",
+                  "# TYPE http_request_size_bytes_total counter"]
+        for (method, path), stats in items:
+            lines.append(f'http_request_size_bytes_total{{method="{method}",route="{path}"}} {stats.request_bytes}')
+
+        lines += ["# HELP http_response_size_bytes_total Response body bytes by route.",
+                  "# TYPE http_response_size_bytes_total counter"]
+        for (method, path), stats in items:
+            lines.append(f'http_response_size_bytes_total{{method="{method}",route="{path}"}} {stats.response_bytes}')
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        state = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        request_bytes = 0
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                request_bytes = int(value)
+                break
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.in_flight -= 1
+            path = metrics.route_path(scope["app"], scope.get("endpoint"))
+            metrics.observe(scope["method"], path, state["status"], elapsed, request_bytes, state["bytes"])
+
+
+# 进程内共享的统计实例
+request_metrics = RequestMetrics()
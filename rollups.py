@@ -0,0 +1,282 @@
+# rollups.py
+"""
+按小时/天预聚合的统计
+
+stat_rollups 中每行是 (指标, 粒度, 时间桶, 范围, 维度, 取值) -> 计数：
+- tasks      按任务创建时间分桶，范围为负责人所属部门，维度 status / task_type / priority
+- panoramas  按全景图创建时间分桶，维度 status
+- analytics  按事件发生时间分桶，维度为对象类型，取值为事件类型（view / favorite）
+
+任务和全景图的增删改通过会话的 flush 事件在同一事务内增量更新计数；
+浏览/收藏计数由 analytics 模块写分钟表时一并更新。定时任务从源表重新计算最近
+几天的桶以修正偏差（例如负责人调换部门、绕过 ORM 的批量更新）。趋势接口只需
+读取与时间桶数量成正比的行。
+
+用法:
+    python rollups.py              # 查看各指标的汇总行数
+    python rollups.py --rebuild    # 从源表全量重建
+"""
+import sys
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, inspect, select, text
+from sqlalchemy.dialects.mysql import insert
+
+from database import engine, SessionLocal
+from models_db import AnalyticsEventCount, GovernmentUser, LawEnforcementTask, Panorama, StatRollup
+
+ROLLUP_CONFIG = {
+    "reconcile_days": 2,                # 定时校正最近多少天的桶
+    "reconcile_interval_minutes": 60,   # 定时校正间隔
+}
+
+GRANULARITIES = {
+    "hour": (lambda t: t.replace(minute=0, second=0, microsecond=0), "%Y-%m-%d %H:00:00"),
+    "day": (lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0), "%Y-%m-%d 00:00:00"),
+}
+
+# 指标 -> (模型, 参与统计的字段, 维度字段)
+_TRACKED = {
+    LawEnforcementTask: ("tasks", ("created_at", "status", "task_type", "priority", "assigned_to"),
+                         ("status", "task_type", "priority")),
+    Panorama: ("panoramas", ("created_at", "status"), ("status",)),
+}
+
+
+def truncate(granularity, t):
+    return GRANULARITIES[granularity][0](t)
+
+
+# ---------- 增量更新 ----------
+def _default(obj, field):
+    column = obj.__table__.c[field]
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    return None
+
+
+def _snapshot(obj, fields, before):
+    """对象在本次 flush 之前(before=True)或之后的字段值"""
+    state = inspect(obj)
+    values = {}
+    for field in fields:
+        history = state.attrs[field].history
+        if before and history.deleted:
+            values[field] = history.deleted[0]
+        elif not before and history.added:
+            values[field] = history.added[0]
+        elif history.unchanged:
+            values[field] = history.unchanged[0]
+        elif state.pending:
+            values[field] = _default(obj, field)
+        else:
+            values[field] = getattr(obj, field)
+    if not isinstance(values["created_at"], datetime):
+        values["created_at"] = datetime.now()
+    return values
+
+
+def _before_flush(session, flush_context, instances):
+    changes = session.info.setdefault("rollup_changes", [])
+    for obj in session.new:
+        if type(obj) in _TRACKED:
+            changes.append((type(obj), None, _snapshot(obj, _TRACKED[type(obj)][1], False)))
+    for obj in session.deleted:
+        if type(obj) in _TRACKED:
+            changes.append((type(obj), _snapshot(obj, _TRACKED[type(obj)][1], True), None))
+    for obj in session.dirty:
+        if type(obj) not in _TRACKED or not session.is_modified(obj):
+            continue
+        fields = _TRACKED[type(obj)][1]
+        state = inspect(obj)
+        if any(state.attrs[f].history.has_changes() for f in fields):
+            changes.append((type(obj), _snapshot(obj, fields, True), _snapshot(obj, fields, False)))
+
+
+def _after_flush(session, flush_context):
+    changes = session.info.pop("rollup_changes", None)
+    if changes:
+        apply_changes(session.connection(), changes)
+
+
+def apply_changes(conn, changes):
+    """
+    按 [(模型, 变更前字段值, 变更后字段值)] 更新汇总，新增时前值为 None、删除时后值为 None。
+    flush 事件自动调用；绕过 ORM 的批量 UPDATE/DELETE 需在同一事务中手动调用
+    """
+    user_ids = {values["assigned_to"] for _, old, new in changes for values in (old, new)
+                if values and values.get("assigned_to")}
+    departments = {}
+    if user_ids:
+        departments = dict(conn.execute(
+            select(GovernmentUser.gov_user_id, GovernmentUser.department)
+            .where(GovernmentUser.gov_user_id.in_(user_ids))
+        ).all())
+
+    deltas = {}
+    for model, old, new in changes:
+        metric, _, dimensions = _TRACKED[model]
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            scope = departments.get(values.get("assigned_to")) or ""
+            for granularity in GRANULARITIES:
+                bucket = truncate(granularity, values["created_at"])
+                for dimension in dimensions:
+                    if values[dimension] is None:
+                        continue
+                    key = (metric, granularity, bucket, scope, dimension, str(values[dimension]))
+                    deltas[key] = deltas.get(key, 0) + sign
+    apply_deltas(conn, deltas)
+
+
+def apply_deltas(conn, deltas):
+    """把 {(metric, granularity, bucket, scope, dimension, value): 增量} 累加到汇总表"""
+    rows = [{"metric": metric, "granularity": granularity, "bucket_start": bucket, "scope": scope,
+             "dimension": dimension, "value": value, "count": n}
+            for (metric, granularity, bucket, scope, dimension, value), n in deltas.items() if n]
+    if not rows:
+        return
+    table = StatRollup.__table__
+    stmt = insert(table).values(rows)
+    conn.execute(stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted["count"]))
+
+
+def ensure_schema():
+    """旧库没有 stat_rollups 表时创建（任务和全景图的写入会在同一事务中更新该表）"""
+    if not inspect(engine).has_table(StatRollup.__tablename__):
+        StatRollup.__table__.create(bind=engine)
+
+
+def install(session_factory):
+    """在会话上注册 flush 事件，任务和全景图的写入随事务更新汇总"""
+    event.listen(session_factory, "before_flush", _before_flush)
+    event.listen(session_factory, "after_flush", _after_flush)
+
+
+# ---------- 重新计算 ----------
+def _bucket(column, granularity):
+    return func.date_format(column, GRANULARITIES[granularity][1])
+
+
+def _source_rows(conn, metric, granularity, since):
+    """从源表按桶聚合，返回 [(bucket, scope, dimension, value, count)]"""
+    if metric == "tasks":
+        t = LawEnforcementTask
+        bucket = _bucket(t.created_at, granularity)
+        query = select(bucket, GovernmentUser.department, t.status, t.task_type, t.priority, func.count()) \
+            .select_from(t).outerjoin(GovernmentUser, t.assigned_to == GovernmentUser.gov_user_id)
+        if since:
+            query = query.where(t.created_at >= since)
+        query = query.group_by(bucket, GovernmentUser.department, t.status, t.task_type, t.priority)
+        for b, department, status, task_type, priority, n in conn.execute(query):
+            for dimension, value in (("status", status), ("task_type", task_type), ("priority", priority)):
+                if value is not None:
+                    yield b, department or "", dimension, value, n
+    elif metric == "panoramas":
+        t = Panorama
+        bucket = _bucket(t.created_at, granularity)
+        query = select(bucket, t.status, func.count())
+        if since:
+            query = query.where(t.created_at >= since)
+        for b, status, n in conn.execute(query.group_by(bucket, t.status)):
+            yield b, "", "status", status, n
+    else:
+        t = AnalyticsEventCount
+        bucket = _bucket(t.bucket_minute, granularity)
+        query = select(bucket, t.target_type, t.event_type, func.sum(t.count))
+        if since:
+            query = query.where(t.bucket_minute >= since)
+        for b, target_type, event_type, n in conn.execute(query.group_by(bucket, t.target_type, t.event_type)):
+            yield b, "", target_type, event_type, int(n)
+
+
+def reconcile(days=None):
+    """用源表重新计算最近 days 天（None 为全部）的汇总，返回写入的行数"""
+    since = truncate("day", datetime.now()) - timedelta(days=days - 1) if days else None
+    written = 0
+    with engine.begin() as conn:
+        for metric in ("tasks", "panoramas", "analytics"):
+            for granularity in GRANULARITIES:
+                deltas = {}
+                for b, scope, dimension, value, n in _source_rows(conn, metric, granularity, since):
+                    bucket = datetime.strptime(b, "%Y-%m-%d %H:%M:%S") if isinstance(b, str) else b
+                    key = (metric, granularity, bucket, scope, dimension, str(value))
+                    deltas[key] = deltas.get(key, 0) + n
+                query = delete(StatRollup).where(StatRollup.metric == metric,
+                                                 StatRollup.granularity == granularity)
+                if since:
+                    query = query.where(StatRollup.bucket_start >= since)
+                conn.execute(query)
+                apply_deltas(conn, deltas)
+                written += len(deltas)
+    return written
+
+
+def run_reconcile():
+    """定时校正；汇总表为空时（首次部署）全量重建。多进程部署时只有一个进程执行"""
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT GET_LOCK('stat_rollups_reconcile', 0)")).scalar():
+            return None
+        try:
+            empty = conn.execute(select(StatRollup.rollup_id).limit(1)).first() is None
+            return reconcile(None if empty else ROLLUP_CONFIG["reconcile_days"])
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK('stat_rollups_reconcile')"))
+
+
+# ---------- 查询 ----------
+def query_rollups(db, metric, granularity, since, until=None, dimension=None, scope=None):
+    """返回 [(bucket_start, scope, dimension, value, count)]"""
+    query = db.query(StatRollup.bucket_start, StatRollup.scope, StatRollup.dimension,
+                     StatRollup.value, StatRollup.count).filter(
+        StatRollup.metric == metric,
+        StatRollup.granularity == granularity,
+        StatRollup.bucket_start >= since
+    )
+    if until is not None:
+        query = query.filter(StatRollup.bucket_start < until)
+    if dimension is not None:
+        query = query.filter(StatRollup.dimension == dimension)
+    if scope is not None:
+        query = query.filter(StatRollup.scope == scope)
+    return query.all()
+
+
+def series(db, metric, granularity, since, until, dimension):
+    """按桶求和的时间序列 {bucket_start: count}，没有记录的桶为 0"""
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+    result = {}
+    bucket = truncate(granularity, since)
+    while bucket < until:
+        result[bucket] = 0
+        bucket += step
+    for bucket, _, _, _, n in query_rollups(db, metric, granularity, since, until, dimension):
+        result[bucket] = result.get(bucket, 0) + n
+    return result
+
+
+def show_status():
+    db = SessionLocal()
+    try:
+        for metric, granularity, rows, oldest in db.query(
+            StatRollup.metric, StatRollup.granularity, func.count(), func.min(StatRollup.bucket_start)
+        ).group_by(StatRollup.metric, StatRollup.granularity):
+            print(f"  {metric}/{granularity}: {rows} 行，最早 {oldest}")
+    finally:
+        db.close()
+
+
+def main():
+    try:
+        if "--rebuild" in sys.argv:
+            print(f"✓ 重建完成，写入 {reconcile(None)} 行")
+        show_status()
+    except Exception as e:
+        print(f"✗ 操作失败: {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# sql_profiler.py
+"""
+按请求统计 SQL
+
+通过 SQLAlchemy 游标事件记录每条语句的耗时和返回行数，归属到当前请求（contextvar）
+和路由；同一请求内相同语句以不同参数反复执行时记为 N+1 模式。慢查询进入有界日志。
+调试模式下把本请求的统计写入响应头。
+"""
+import contextvars
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+from request_metrics import request_metrics
+
+PROFILER_CONFIG = {
+    "slow_query_ms": 100,          # 慢查询阈值
+    "slow_log_size": 200,          # 慢查询日志保留条数
+    "n_plus_one_threshold": 5,     # 同一语句在一个请求内执行达到该次数视为 N+1
+    "n_plus_one_log_size": 100,    # N+1 记录保留条数
+    "debug_headers": False,        # 是否在响应头中返回本请求的 SQL 统计
+}
+
+_current = contextvars.ContextVar("sql_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("queries", "db_time", "rows", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.statements = {}   # 语句 -> [执行次数, 不同参数集合]
+
+    def record(self, statement, parameters, elapsed, rows):
+        self.queries += 1
+        self.db_time += elapsed
+        if rows > 0:
+            self.rows += rows
+        entry = self.statements.get(statement)
+        if entry is None:
+            entry = self.statements[statement] = [0, set()]
+        entry[0] += 1
+        if len(entry[1]) < 2:
+            entry[1].add(repr(parameters))
+
+    def n_plus_one(self):
+        threshold = PROFILER_CONFIG["n_plus_one_threshold"]
+        return [(statement, count) for statement, (count, params) in self.statements.items()
+                if count >= threshold and len(params) > 1]
+
+
+class RouteSqlStats:
+    __slots__ = ("requests", "queries", "db_time", "rows", "n_plus_one")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.n_plus_one = 0
+
+
+class SqlProfiler:
+    def __init__(self):
+        self.routes = {}
+        self.slow_queries = deque(maxlen=PROFILER_CONFIG["slow_log_size"])
+        self.n_plus_one_log = deque(maxlen=PROFILER_CONFIG["n_plus_one_log_size"])
+        self._route = contextvars.ContextVar("sql_route", default=None)
+
+    def install(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    # 开始时间记在本次执行的 ExecutionContext 上：语句出错时没有 after_cursor_execute，
+    # 开始时间随上下文一起丢弃，不会残留到连接上
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.sql_profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "sql_profiler_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        profile = _current.get()
+        if profile is not None:
+            profile.record(statement, parameters, elapsed, cursor.rowcount)
+        if elapsed * 1000 >= PROFILER_CONFIG["slow_query_ms"]:
+            self.slow_queries.append({
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "route": self._route.get(),
+                "ms": round(elapsed * 1000, 2),
+                "rows": cursor.rowcount,
+                "statement": statement[:2000]
+            })
+
+    def finish(self, method, path, profile):
+        key = (method, path)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteSqlStats()
+        stats.requests += 1
+        stats.queries += profile.queries
+        stats.db_time += profile.db_time
+        stats.rows += profile.rows
+        patterns = profile.n_plus_one()
+        if patterns:
+            stats.n_plus_one += 1
+            for statement, count in patterns:
+                self.n_plus_one_log.append({
+                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "route": f"{method} {path}",
+                    "count": count,
+                    "statement": statement[:2000]
+                })
+
+    def summary(self):
+        routes = []
+        for (method, path), stats in sorted(self.routes.items(), key=lambda kv: -kv[1].db_time):
+            n = stats.requests or 1
+            routes.append({
+                "method": method,
+                "route": path,
+                "requests": stats.requests,
+                "avgQueries": round(stats.queries / n, 2),
+                "avgDbTimeMs": round(stats.db_time / n * 1000, 2),
+                "avgRows": round(stats.rows / n, 2),
+                "nPlusOneRequests": stats.n_plus_one
+            })
+        return {
+            "routes": routes,
+            "nPlusOne": list(reversed(self.n_plus_one_log)),
+            "slowQueries": list(reversed(self.slow_queries))
+        }
+
+
+class SqlProfilerMiddleware:
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        route_token = self.profiler._route.set(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and PROFILER_CONFIG["debug_headers"]:
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-db-queries", str(profile.queries).encode()),
+                    (b"x-db-time-ms", f"{profile.db_time * 1000:.2f}".encode()),
+                    (b"x-db-rows", str(profile.rows).encode()),
+                    (b"x-db-n-plus-one", str(len(profile.n_plus_one())).encode()),
+                ]
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self.profiler._route.reset(route_token)
+            path = request_metrics.route_path(scope["app"], scope.get("endpoint"))
+            self.profiler.finish(scope["method"], path, profile)
+
+
+# 进程内共享的 SQL 统计实例
+sql_profiler = SqlProfiler()
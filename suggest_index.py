@@ -0,0 +1,217 @@
+# suggest_index.py
+"""
+地点、商铺名称及省/市/区的内存前缀索引（地图搜索框联想）
+
+索引为按检索键排序的数组，查询通过二分定位前缀区间，不访问数据库。
+启动时全量构建，之后由写接口增量维护。
+"""
+import bisect
+import threading
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时只支持原文前缀匹配
+    lazy_pinyin = None
+
+from models_db import Location, Shop
+
+REGION_TYPES = ("province", "city", "district")
+
+
+def search_keys(name: str) -> set:
+    """生成名称的检索键：原文、全拼、拼音首字母"""
+    name = (name or "").strip()
+    if not name:
+        return set()
+
+    keys = {name.lower()}
+    if lazy_pinyin is not None:
+        keys.add("".join(lazy_pinyin(name)).replace(" ", "").lower())
+        keys.add("".join(lazy_pinyin(name, style=Style.FIRST_LETTER)).replace(" ", "").lower())
+    keys.discard("")
+    return keys
+
+
+def _shop_visible(audit_status, status) -> bool:
+    # 与 /api/shop/list 的公开条件保持一致
+    return audit_status == "approved" and bool(status)
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []            # [(检索键, 条目键)]，按检索键排序
+        self._entries = {}         # 条目键 -> 返回给前端的数据
+        self._entry_keys = {}      # 条目键 -> 该条目的检索键集合
+        self._region_refs = {}     # 行政区划条目键 -> 引用它的商铺数
+        self._shop_regions = {}    # shop_id -> 该商铺引用的行政区划条目键
+
+    # ---------- 构建 ----------
+    def rebuild(self, db):
+        """从数据库全量重建索引（只查询需要的列）"""
+        fresh = SuggestIndex()
+
+        for location_id, name, longitude, latitude in db.query(
+                Location.location_id, Location.name, Location.longitude, Location.latitude
+        ):
+            fresh._put_location(location_id, name, longitude, latitude)
+
+        for shop_id, username, province, city, district in db.query(
+                Shop.shop_id, Shop.username, Shop.province, Shop.city, Shop.district
+        ).filter(Shop.audit_status == "approved", Shop.status == True):
+            fresh._put_shop(shop_id, username, province, city, district)
+
+        fresh._keys.sort()
+        with self._lock:
+            self._keys = fresh._keys
+            self._entries = fresh._entries
+            self._entry_keys = fresh._entry_keys
+            self._region_refs = fresh._region_refs
+            self._shop_regions = fresh._shop_regions
+
+    # ---------- 增量维护 ----------
+    def upsert_location(self, location):
+        with self._lock:
+            self._drop(("location", location.location_id))
+            self._put_location(location.location_id, location.name,
+                               location.longitude, location.latitude, sort=True)
+
+    def upsert_locations(self, rows):
+        """批量新增或更新地点，rows 为 (location_id, name, longitude, latitude)；整批只排序一次"""
+        with self._lock:
+            for location_id, name, longitude, latitude in rows:
+                self._drop(("location", location_id))
+                self._put_location(location_id, name, longitude, latitude)
+            self._keys.sort()
+
+    def remove_location(self, location_id: int):
+        with self._lock:
+            self._drop(("location", location_id))
+
+    def upsert_shop(self, shop):
+        """新增或更新商铺；不满足公开条件（已审核且显示）的商铺会被移出索引"""
+        with self._lock:
+            self._drop_shop(shop.shop_id)
+            if _shop_visible(shop.audit_status, shop.status):
+                self._put_shop(shop.shop_id, shop.username, shop.province,
+                               shop.city, shop.district, sort=True)
+
+    def upsert_shops(self, rows):
+        """
+        批量新增或更新商铺，rows 为 (shop_id, username, province, city, district, audit_status, status)；
+        整批只排序一次，适合批量审核
+        """
+        with self._lock:
+            for shop_id, username, province, city, district, audit_status, status in rows:
+                self._drop_shop(shop_id)
+                if _shop_visible(audit_status, status):
+                    self._put_shop(shop_id, username, province, city, district)
+            self._keys.sort()
+
+    def remove_shop(self, shop_id: int):
+        with self._lock:
+            self._drop_shop(shop_id)
+
+    # ---------- 查询 ----------
+    def search(self, prefix: str, limit: int = 10, types=None) -> list:
+        """按前缀返回至多 limit 条联想结果，types 为可选的类型集合"""
+        prefix = (prefix or "").strip().replace(" ", "").lower()
+        if not prefix:
+            return []
+
+        keys = self._keys
+        entries = self._entries
+        result = []
+        seen = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and len(result) < limit:
+            key, entry_key = keys[i]
+            if not key.startswith(prefix):
+                break
+            i += 1
+            if entry_key in seen or (types and entry_key[0] not in types):
+                continue
+            seen.add(entry_key)
+            entry = entries.get(entry_key)
+            if entry is not None:
+                result.append(entry)
+        return result
+
+    def stats(self) -> dict:
+        counts = {}
+        for kind, _ in self._entries:
+            counts[kind] = counts.get(kind, 0) + 1
+        return {"keys": len(self._keys), "entries": counts}
+
+    # ---------- 内部方法（调用方需持有锁或操作的是未发布的实例） ----------
+    def _put(self, entry_key, name, entry, sort=False):
+        keys = search_keys(name)
+        if not keys:
+            return
+        self._entries[entry_key] = entry
+        self._entry_keys[entry_key] = keys
+        for key in keys:
+            if sort:
+                bisect.insort(self._keys, (key, entry_key))
+            else:
+                self._keys.append((key, entry_key))
+
+    def _drop(self, entry_key):
+        self._entries.pop(entry_key, None)
+        for key in self._entry_keys.pop(entry_key, ()):
+            i = bisect.bisect_left(self._keys, (key, entry_key))
+            if i < len(self._keys) and self._keys[i] == (key, entry_key):
+                del self._keys[i]
+
+    def _put_location(self, location_id, name, longitude, latitude, sort=False):
+        self._put(("location", location_id), name, {
+            "type": "location",
+            "id": location_id,
+            "name": name,
+            "longitude": longitude,
+            "latitude": latitude
+        }, sort)
+
+    def _put_shop(self, shop_id, username, province, city, district, sort=False):
+        self._put(("shop", shop_id), username, {
+            "type": "shop",
+            "id": shop_id,
+            "name": username,
+            "province": province,
+            "city": city,
+            "district": district
+        }, sort)
+
+        # 行政区划按完整路径区分（不同省份下可能有同名的市/区）
+        regions = []
+        path = []
+        for kind, value in zip(REGION_TYPES, (province, city, district)):
+            if not value:
+                break
+            path.append(value)
+            region_key = (kind, "/".join(path))
+            regions.append(region_key)
+            refs = self._region_refs.get(region_key, 0)
+            self._region_refs[region_key] = refs + 1
+            if refs == 0:
+                self._put(region_key, value, {
+                    "type": kind,
+                    "id": region_key[1],
+                    "name": value,
+                    "path": list(path)
+                }, sort)
+        self._shop_regions[shop_id] = regions
+
+    def _drop_shop(self, shop_id):
+        self._drop(("shop", shop_id))
+        for region_key in self._shop_regions.pop(shop_id, ()):
+            refs = self._region_refs.get(region_key, 0) - 1
+            if refs > 0:
+                self._region_refs[region_key] = refs
+            else:
+                self._region_refs.pop(region_key, None)
+                self._drop(region_key)
+
+
+# 进程内共享的索引实例
+name_index = SuggestIndex()
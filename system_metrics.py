@@ -0,0 +1,251 @@
+# system_metrics.py
+"""
+系统指标采样
+
+后台任务按固定间隔读取 /proc（CPU、内存、进程RSS、磁盘IOPS）和磁盘使用率，
+样本放入定长环形缓冲区；每分钟把样本均值写入 system_monitoring，
+整点和零点再从细粒度记录汇总出小时、天级记录。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from database import engine, SessionLocal
+from models_db import SystemMonitoring
+
+METRICS_CONFIG = {
+    "interval_seconds": 5,       # 采样间隔
+    "buffer_size": 720,          # 环形缓冲区容量（默认保留1小时的样本）
+    "disk_path": "/",            # 统计使用率的挂载点
+    "minute_retention_days": 2,  # 分钟级记录保留天数
+    "hour_retention_days": 60,   # 小时级记录保留天数
+}
+
+# 汇总粒度 -> (时间截断函数, 上一级来源粒度)
+_ROLLUPS = {
+    "hour": (lambda t: t.replace(minute=0, second=0, microsecond=0), "minute"),
+    "day": (lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0), "hour"),
+}
+_STEP = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+# ---------- /proc 读取 ----------
+def read_cpu_times():
+    """返回 (空闲时间, 总时间)，单位为 jiffies"""
+    with open("/proc/stat") as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return idle, sum(values)
+
+
+def read_memory_usage():
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            info[key] = int(value.split()[0])
+    total = info.get("MemTotal", 0)
+    available = info.get("MemAvailable", info.get("MemFree", 0))
+    return (total - available) / total * 100 if total else 0.0
+
+
+def read_process_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def read_disk_usage(path):
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    return (total - free) / total * 100 if total else 0.0
+
+
+def read_disk_ops():
+    """所有物理磁盘累计完成的读写次数（跳过分区和 loop/ram 设备，避免重复计数）"""
+    ops = 0
+    with open("/proc/diskstats") as f:
+        for line in f:
+            fields = line.split()
+            name = fields[2]
+            if name.startswith(("loop", "ram", "zram")) or not os.path.exists(f"/sys/block/{name}"):
+                continue
+            ops += int(fields[3]) + int(fields[7])
+    return ops
+
+
+class MetricsSampler:
+    def __init__(self, config=None):
+        self.config = dict(METRICS_CONFIG, **(config or {}))
+        self.samples = deque(maxlen=self.config["buffer_size"])
+        # 返回最近平均接口耗时(ms)的函数，由请求统计模块注册
+        self.latency_source = None
+        self._task = None
+        self._last_cpu = None
+        self._last_ops = None
+        self._minute = None
+        self._minute_samples = []
+
+    # ---------- 采样 ----------
+    def sample(self):
+        now = time.monotonic()
+        idle, total = read_cpu_times()
+        ops = read_disk_ops()
+
+        cpu = 0.0
+        iops = 0
+        if self._last_cpu is not None:
+            last_idle, last_total, last_time = self._last_cpu
+            if total > last_total:
+                cpu = (1 - (idle - last_idle) / (total - last_total)) * 100
+            elapsed = now - last_time
+            if elapsed > 0:
+                iops = int((ops - self._last_ops) / elapsed)
+        self._last_cpu = (idle, total, now)
+        self._last_ops = ops
+
+        point = {
+            "time": datetime.now(),
+            "cpu": round(cpu, 1),
+            "memory": round(read_memory_usage(), 1),
+            "disk": round(read_disk_usage(self.config["disk_path"]), 1),
+            "diskIOPS": iops,
+            "rss": round(read_process_rss_mb(), 1),
+            "apiResponseTime": round(self.latency_source(), 1) if self.latency_source else 0.0
+        }
+        self.samples.append(point)
+        return point
+
+    def latest(self):
+        """最近一次采样；尚未开始采样时即时采一次"""
+        return self.samples[-1] if self.samples else self.sample()
+
+    # ---------- 汇总写库 ----------
+    @staticmethod
+    def _insert(db, granularity, recorded_at, values):
+        """写入一条汇总记录；多进程重复写同一时间点时以先写入的为准"""
+        db.add(SystemMonitoring(granularity=granularity, recorded_at=recorded_at, **values))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+    def persist_minute(self, minute, points):
+        n = len(points)
+        db = SessionLocal()
+        try:
+            self._insert(db, "minute", minute, {
+                "cpu_usage": sum(p["cpu"] for p in points) / n,
+                "memory_usage": sum(p["memory"] for p in points) / n,
+                "disk_usage": points[-1]["disk"],
+                "disk_iops": int(sum(p["diskIOPS"] for p in points) / n),
+                "process_rss_mb": max(p["rss"] for p in points),
+                "api_response_time": sum(p["apiResponseTime"] for p in points) / n
+            })
+            for granularity, (truncate, source) in _ROLLUPS.items():
+                # 跨过整点/零点时汇总上一个完整周期
+                if truncate(minute) == minute:
+                    self.persist_rollup(db, granularity, source, minute - _STEP[granularity])
+            if minute.minute == 0:
+                self.purge(db)
+        finally:
+            db.close()
+
+    def persist_rollup(self, db, granularity, source, start):
+        end = start + _STEP[granularity]
+        row = db.query(
+            func.count(SystemMonitoring.monitor_id),
+            func.avg(SystemMonitoring.cpu_usage),
+            func.avg(SystemMonitoring.memory_usage),
+            func.max(SystemMonitoring.disk_usage),
+            func.avg(SystemMonitoring.disk_iops),
+            func.max(SystemMonitoring.process_rss_mb),
+            func.avg(SystemMonitoring.api_response_time)
+        ).filter(
+            SystemMonitoring.granularity == source,
+            SystemMonitoring.recorded_at >= start,
+            SystemMonitoring.recorded_at < end
+        ).one()
+        if not row[0]:
+            return
+        self._insert(db, granularity, start, {
+            "cpu_usage": row[1],
+            "memory_usage": row[2],
+            "disk_usage": row[3],
+            "disk_iops": int(row[4] or 0),
+            "process_rss_mb": row[5],
+            "api_response_time": row[6]
+        })
+
+    def purge(self, db):
+        now = datetime.now()
+        for granularity in ("minute", "hour"):
+            days = self.config[f"{granularity}_retention_days"]
+            db.query(SystemMonitoring).filter(
+                SystemMonitoring.granularity == granularity,
+                SystemMonitoring.recorded_at < now - timedelta(days=days)
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    # ---------- 后台任务 ----------
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                point = self.sample()
+                minute = point["time"].replace(second=0, microsecond=0)
+                if self._minute is not None and minute != self._minute and self._minute_samples:
+                    points, self._minute_samples = self._minute_samples, []
+                    await loop.run_in_executor(None, self.persist_minute, self._minute, points)
+                self._minute = minute
+                self._minute_samples.append(point)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"系统指标采样失败: {e}")
+            await asyncio.sleep(self.config["interval_seconds"])
+
+
+def query_rollups(db, granularity, since):
+    """按时间顺序返回某粒度的汇总记录"""
+    return db.query(SystemMonitoring).filter(
+        SystemMonitoring.granularity == granularity,
+        SystemMonitoring.recorded_at >= since
+    ).order_by(SystemMonitoring.recorded_at).all()
+
+
+def ensure_schema():
+    """为旧库补充 granularity / process_rss_mb 列及索引"""
+    inspector = inspect(engine)
+    if not inspector.has_table(SystemMonitoring.__tablename__):
+        SystemMonitoring.__table__.create(bind=engine)
+        return
+    columns = {c["name"] for c in inspector.get_columns(SystemMonitoring.__tablename__)}
+    with engine.begin() as conn:
+        if "granularity" not in columns:
+            conn.execute(text(
+                "ALTER TABLE system_monitoring "
+                "ADD COLUMN granularity ENUM('minute','hour','day') NOT NULL DEFAULT 'minute', "
+                "ADD COLUMN process_rss_mb FLOAT NULL, "
+                "ADD UNIQUE INDEX ux_system_monitoring_granularity_time (granularity, recorded_at)"
+            ))
+
+
+# 进程内共享的采样器
+sampler = MetricsSampler()
@@ -0,0 +1,79 @@
+# task_codes.py
+"""
+任务编号分配
+
+编号格式 TASK-YYYYMMDD-序号。每天一行 task_code_sequences 计数，进程一次预留一段
+（block_size 个）序号后在内存中发放，用完再预留下一段：
+
+    INSERT ... ON DUPLICATE KEY UPDATE next_value = LAST_INSERT_ID(next_value + block_size)
+
+预留在独立连接上自动提交，多进程并发也不会拿到重复的段。进程重启会丢弃未用完的
+序号，编号因此可能不连续，但不会重复。当天第一次预留时从已有编号的最大序号
+（task_code 前缀范围查询，可走唯一索引）开始，兼容改造前生成的编号。
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import Integer, cast, func, inspect, text
+
+from database import engine
+from models_db import LawEnforcementTask, TaskCodeSequence
+
+TASK_CODE_CONFIG = {
+    "block_size": 10,   # 每次预留的序号数
+    "width": 3,         # 序号最少位数
+}
+
+
+def ensure_schema():
+    """旧库没有 task_code_sequences 表时创建"""
+    if not inspect(engine).has_table(TaskCodeSequence.__tablename__):
+        TaskCodeSequence.__table__.create(bind=engine)
+
+
+def code_prefix(day):
+    return f"TASK-{day}-"
+
+
+class TaskCodeAllocator:
+    def __init__(self, config=None):
+        self.config = dict(TASK_CODE_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = 0
+        self._end = 0
+
+    def _existing_max(self, conn, day):
+        prefix = code_prefix(day)
+        suffix = func.substring(LawEnforcementTask.task_code, len(prefix) + 1)
+        value = conn.execute(
+            func.max(cast(suffix, Integer)).select().where(LawEnforcementTask.task_code.like(f"{prefix}%"))
+        ).scalar()
+        return value or 0
+
+    def _reserve(self, day, first):
+        """预留一段序号，返回 [start, end)；first 表示本进程当天第一次预留"""
+        size = self.config["block_size"]
+        with engine.begin() as conn:
+            # 计数行已存在时 VALUES 中的起始值不会被使用
+            seed = self._existing_max(conn, day) + 1 if first else 1
+            conn.execute(text(
+                "INSERT INTO task_code_sequences (seq_date, next_value) VALUES (:day, LAST_INSERT_ID(:seed + :size)) "
+                "ON DUPLICATE KEY UPDATE next_value = LAST_INSERT_ID(next_value + :size)"
+            ), {"day": day, "seed": seed, "size": size})
+            end = conn.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+        return end - size, end
+
+    def next_code(self, now=None):
+        day = (now or datetime.now()).strftime("%Y%m%d")
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                self._next, self._end = self._reserve(day, first=day != self._day)
+                self._day = day
+            value = self._next
+            self._next += 1
+        return f"{code_prefix(day)}{str(value).zfill(self.config['width'])}"
+
+
+# 进程内共享的编号分配器
+task_codes = TaskCodeAllocator()
@@ -0,0 +1,94 @@
+# tests/test_after_commit.py
+"""
+提交后处理与缓存失效的事务边界测试
+
+run_after_commit 登记的回调和 invalidate_on_commit 的缓存失效只在最外层事务提交后发生：
+释放保存点时不执行，回滚保存点只丢弃保存点内登记的，回滚或直接关闭会话时全部丢弃。
+
+运行: python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import TTLCache, invalidate_on_commit
+from database import Base, run_after_commit
+from models_db import Shop
+
+
+@pytest.fixture
+def env():
+    """返回 (Session, cache, calls)：cache 在提交了 Shop 的写入后失效，calls 收集已执行的回调"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Shop.__table__])
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    cache = TTLCache("test_after_commit", ttl=60, maxsize=1)
+    invalidate_on_commit(Session, (Shop,), cache)
+    cache.set("key", "cached")
+    yield Session, cache, []
+    engine.dispose()
+
+
+def add_shop(db, name):
+    db.execute(insert(Shop), [{"username": name, "email": "e"}])
+
+
+def test_savepoint_release_waits_for_outer_commit(env):
+    Session, cache, calls = env
+    db = Session()
+    with db.begin_nested():
+        add_shop(db, "a")
+        run_after_commit(db, lambda: calls.append("a"))
+    assert calls == [] and cache.get("key") == "cached"
+    db.commit()
+    assert calls == ["a"] and cache.get("key") is None
+    db.close()
+
+
+def test_savepoint_rollback_drops_only_its_callbacks(env):
+    Session, cache, calls = env
+    db = Session()
+    add_shop(db, "a")
+    run_after_commit(db, lambda: calls.append("a"))
+    with pytest.raises(RuntimeError):
+        with db.begin_nested():
+            add_shop(db, "b")
+            run_after_commit(db, lambda: calls.append("b"))
+            raise RuntimeError("row failed")
+    with db.begin_nested():
+        run_after_commit(db, lambda: calls.append("c"))
+    assert calls == [] and cache.get("key") == "cached"
+    db.commit()
+    assert calls == ["a", "c"] and cache.get("key") is None
+    assert [s.username for s in Session().query(Shop)] == ["a"]
+    db.close()
+
+
+def test_outer_rollback_after_savepoint_release(env):
+    Session, cache, calls = env
+    db = Session()
+    with db.begin_nested():
+        add_shop(db, "a")
+        run_after_commit(db, lambda: calls.append("a"))
+    db.rollback()
+    db.commit()
+    assert calls == [] and cache.get("key") == "cached"
+    db.close()
+
+
+def test_close_without_commit(env):
+    Session, cache, calls = env
+    db = Session()
+    add_shop(db, "a")
+    run_after_commit(db, lambda: calls.append("a"))
+    db.close()
+    db.begin()
+    db.commit()
+    assert calls == [] and cache.get("key") == "cached"
+    db.close()
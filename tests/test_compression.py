@@ -0,0 +1,133 @@
+# tests/test_compression.py
+"""
+响应压缩的往返测试
+
+每种编码（br / zstd / gzip）分别经过整段压缩、中间件单段响应、中间件流式响应和
+cached_response 预压缩缓存四条路径，解压后必须与原始响应体一致。
+
+运行: python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brotli
+import zstandard
+
+import compression
+from cache import TTLCache
+
+ALL_ENCODINGS = ("br", "zstd", "gzip")
+
+BODY = b'{"id":1,"thumbnail":"/api/images/1","status":"published"}\n' * 200
+
+
+def decompress(encoding, data):
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def stream_decoder(encoding):
+    if encoding == "br":
+        return brotli.Decompressor().process
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+    return zlib.decompressobj(31).decompress
+
+
+def run(app, accept_encoding):
+    """调用中间件，返回 (响应头, [各段响应体])"""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(compression.CompressionMiddleware(app)(scope, None, send))
+    headers = {k.decode().lower(): v.decode() for k, v in messages[0]["headers"]}
+    return headers, [m.get("body", b"") for m in messages[1:]]
+
+
+def response_app(content_type, chunks):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode())]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def test_all_encodings_available():
+    assert compression.ENCODINGS == ALL_ENCODINGS
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_negotiate_prefers_highest_q(encoding):
+    others = ", ".join(f"{e};q=0.5" for e in ALL_ENCODINGS if e != encoding)
+    assert compression.negotiate(f"{others}, {encoding}") == encoding
+    assert compression.negotiate(f"{encoding};q=0") != encoding
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_compress_round_trip(encoding):
+    data = compression.compress(encoding, BODY)
+    assert len(data) < len(BODY)
+    assert decompress(encoding, data) == BODY
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_middleware_single_body(encoding):
+    headers, bodies = run(response_app("application/json", [BODY]), encoding)
+    assert headers["content-encoding"] == encoding
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(bodies[0])
+    assert decompress(encoding, bodies[0]) == BODY
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_middleware_streaming(encoding):
+    chunks = [BODY[:3000], BODY[3000:7000], BODY[7000:], b""]
+    headers, bodies = run(response_app("application/x-ndjson", chunks), encoding)
+    assert headers["content-encoding"] == encoding
+    assert "content-length" not in headers
+    # 每段都 flush 过：客户端边收边解，每收到一段就能得到对应的原始数据
+    decode = stream_decoder(encoding)
+    assert [decode(body) for body in bodies] == chunks
+    assert decompress(encoding, b"".join(bodies)) == BODY
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_middleware_skips_images_and_small_bodies(encoding):
+    headers, bodies = run(response_app("image/jpeg", [BODY]), encoding)
+    assert "content-encoding" not in headers and bodies == [BODY]
+    headers, bodies = run(response_app("application/json", [b'{"code":"200"}']), encoding)
+    assert "content-encoding" not in headers and bodies == [b'{"code":"200"}']
+
+
+@pytest.mark.parametrize("encoding", ALL_ENCODINGS)
+def test_cached_response(encoding):
+    cache = TTLCache(f"test_compression_{encoding}", ttl=60, maxsize=1)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return BODY
+
+    for _ in range(2):
+        response = compression.cached_response(cache, "key", encoding, build)
+        assert response.headers["content-encoding"] == encoding
+        assert decompress(encoding, response.body) == BODY
+    plain = compression.cached_response(cache, "key", "identity", build)
+    assert "content-encoding" not in plain.headers and plain.body == BODY
+    assert len(builds) == 1
+    assert set(cache.get("key")) == {"identity", encoding}
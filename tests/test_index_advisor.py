@@ -0,0 +1,42 @@
+# tests/test_index_advisor.py
+"""
+热点查询不得退化为全表扫描
+
+与 python index_advisor.py --check 相同：调用热点接口捕获查询，在 MySQL 上 EXPLAIN，
+出现无可用索引的全表扫描或接口调用失败时测试失败。需要 database.py 中配置的 MySQL
+已用 init_db.py 初始化；连不上时跳过。
+
+运行: python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+
+
+def mysql_available():
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not mysql_available(), reason="未连接到 database.py 中配置的 MySQL")
+
+
+def test_hot_queries_have_no_full_scans():
+    import index_advisor
+
+    full_scans, _, failed = index_advisor.analyze()
+    assert not failed, f"热点接口调用失败: {failed}"
+    assert not full_scans, "热点查询全表扫描:\n" + "\n".join(
+        f"{endpoint}: {table} 按 ({', '.join(columns)}) 筛选无可用索引"
+        for endpoint, table, columns, _ in full_scans
+    )
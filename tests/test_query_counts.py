@@ -0,0 +1,128 @@
+# tests/test_query_counts.py
+"""
+列表/详情接口的查询次数回归测试
+
+用内存 SQLite 替换 get_db，登录依赖直接返回测试用户，在引擎上用 before_cursor_execute
+统计每个请求发出的 SELECT 条数。数据量从少到多变化时条数必须不变，
+出现逐行查询（N+1）时测试失败。
+
+运行: python -m pytest -q tests
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import main
+from database import Base, get_db
+from identity_cache import gov_user_cache
+from models_db import GovernmentUser, LawEnforcementTask, TaskComment, TaskHistory
+
+TABLES = [GovernmentUser.__table__, LawEnforcementTask.__table__, TaskHistory.__table__, TaskComment.__table__]
+
+
+@contextmanager
+def sqlite_app():
+    """返回 (Session, selects)：selects 收集期间发出的 SELECT 语句"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=TABLES)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    db = Session()
+    admin = GovernmentUser(gov_user_id=1, username="gov_admin", password="x", email="gov_admin@example.com",
+                           department="城管", role="admin")
+    db.add(admin)
+    db.commit()
+    db.expunge(admin)
+    db.close()
+
+    selects = []
+
+    def count_selects(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_selects)
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.app.dependency_overrides[main.get_current_gov_user] = lambda: admin
+    try:
+        yield Session, selects
+    finally:
+        main.app.dependency_overrides.clear()
+        event.remove(engine, "before_cursor_execute", count_selects)
+        gov_user_cache.invalidate()
+        engine.dispose()
+
+
+def seed(Session, n):
+    """n 个执行人，n 个任务（各指派给不同的人）；任务 1 有 n 条历史和 n 条评论，来自不同的人"""
+    db = Session()
+    for i in range(2, n + 2):
+        db.add(GovernmentUser(gov_user_id=i, username=f"officer{i}", password="x",
+                              email=f"officer{i}@example.com", department="城管", role="officer"))
+    for i in range(1, n + 1):
+        db.add(LawEnforcementTask(
+            task_id=i, task_code=f"T{i:04d}", title=f"任务{i}", description="描述", task_type="cleanup",
+            longitude=120.1, latitude=30.2, assigned_to=i + 1, assigned_by=1, created_by=1,
+            attachments=[1, 2], created_at=datetime(2026, 1, 1, 0, 0, i % 60)
+        ))
+    for i in range(2, n + 2):
+        db.add(TaskHistory(task_id=1, action="update", description="更新", performed_by=i))
+        db.add(TaskComment(task_id=1, content="评论", created_by=i))
+    db.commit()
+    db.close()
+
+
+def count_selects(n, path):
+    """在 n 行数据上请求 path，返回发出的 SELECT 条数（人员缓存为空）"""
+    with sqlite_app() as (Session, selects):
+        seed(Session, n)
+        gov_user_cache.invalidate()
+        selects.clear()
+        response = TestClient(main.app).get(path)
+        assert response.status_code == 200
+        assert response.json()["code"] == "200"
+        return len(selects)
+
+
+URLS = {
+    "get_task_detail": "/api/government/tasks/1",
+    "get_law_enforcement_tasks": "/api/government/tasks?pageSize=100",
+    "get_tasks_for_map": "/api/government/tasks/map?min_longitude=120&min_latitude=30"
+                         "&max_longitude=121&max_latitude=31",
+}
+
+
+@pytest.mark.parametrize("endpoint", list(URLS))
+def test_query_count_does_not_grow_with_rows(endpoint):
+    counts = [count_selects(n, URLS[endpoint]) for n in (2, 30)]
+    assert counts[0] == counts[1], f"{endpoint}: 2 行 {counts[0]} 条 SELECT，30 行 {counts[1]} 条"
+
+
+# 当前各接口的 SELECT 条数；增加查询时需确认不是逐行查询后再更新
+EXPECTED_SELECTS = {
+    "get_task_detail": 4,            # 任务、历史、评论、人员
+    "get_law_enforcement_tasks": 3,  # 总数、当前页、人员
+    "get_tasks_for_map": 2,          # 任务点、执行人
+}
+
+
+@pytest.mark.parametrize("endpoint", list(URLS))
+def test_query_count(endpoint):
+    assert count_selects(30, URLS[endpoint]) == EXPECTED_SELECTS[endpoint]